@@ -0,0 +1,602 @@
+"""
+Benchmarks for the chess core. Run with `python bench.py [name ...]` from the project folder.
+"""
+import itertools
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import pygame as _pygame
+
+_pygame.init()
+
+from chess import initialize_classic_game
+from engine import DIFFICULTY_BUDGETS, Engine
+from epd import EpdLoader, position_to_epd
+import evaluation
+import log
+from bitbase import SIGNATURES, Bitbases, generate_table, pack_values
+from book import ENTRY, OpeningBook, build_book
+from gamerecord import GameRecordReader, GameRecordWriter, convert_pgn, get_index_path
+from pgn import PgnGame, PgnReader, PgnWriter
+from gui import Button, Slider, text_cache
+from rules import BOARD_CONFIG, BoardLocation, initialize_classic_board, parse_fen
+from sprites import sprite_atlas
+
+# Middlegame positions (piece placement field of the FEN, white to move)
+MIDDLEGAME_POSITIONS = {
+    "kiwipete": "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R",
+    "italian": "r1bq1rk1/pppp1ppp/2n2n2/2b1p3/2B1P3/3P1N2/PPP2PPP/RNBQ1RK1",
+    "queens_gambit": "r2q1rk1/pp2bppp/2n1pn2/3p4/2PP4/2N1PN2/PP3PPP/R2QKB1R",
+    "open_centre": "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1",
+}
+
+def benchmark_positions():
+    positions = {"start": BOARD_CONFIG}
+    for name, placement in MIDDLEGAME_POSITIONS.items():
+        positions[name] = parse_fen(f"{placement} w - - 0 1").get_configuration() # only the placement matters here
+    return positions
+
+def make_board(configuration):
+    return initialize_classic_game(0, 0, starting_configuration=configuration)
+
+def time_per_call(function, minimum_time:float = 0.5):
+    calls = 0
+    start = time.perf_counter()
+    elapsed = 0.0
+    while elapsed < minimum_time:
+        function()
+        calls += 1
+        elapsed = time.perf_counter() - start
+    return elapsed / calls
+
+def bench_update():
+    """Full legal move recomputation of every piece, as done by ChessBoard.update."""
+    print("update: full recomputation of every piece's legal moves")
+    for name, configuration in benchmark_positions().items():
+        board = make_board(configuration)
+
+        def full_update():
+            board.invalidate_all()
+            board.update()
+
+        seconds = time_per_call(full_update)
+        print(f"  {name:<14} {seconds * 1e6:10.1f} us/update {1 / seconds:10.0f} updates/s")
+
+def bench_idle():
+    """ChessBoard.update on a frame where nothing has moved."""
+    print("idle: update with no move since the last frame")
+    for name, configuration in benchmark_positions().items():
+        board = make_board(configuration)
+        board.update()
+        seconds = time_per_call(board.update)
+        print(f"  {name:<14} {seconds * 1e6:10.1f} us/update")
+
+def bench_move():
+    """Move, update, pop and update again for every legal move of the side to move."""
+    print("move: move + update + pop + update over every legal move")
+    for name, configuration in benchmark_positions().items():
+        board = make_board(configuration)
+        board.update()
+        moves = [(piece.square, legal_move.move) for piece in board.all_pieces if piece.colour == board.turn for legal_move in piece.legal_moves]
+
+        recomputed = []
+
+        def play_all():
+            for from_square, to_square in moves:
+                board.move(from_square, to_square)
+                board.update()
+                recomputed.append(board.pieces_recomputed)
+                board.pop(1)
+                board.update()
+
+        seconds = time_per_call(play_all)
+        per_move = seconds / len(moves)
+        average_recomputed = sum(recomputed) / len(recomputed)
+        print(f"  {name:<14} {len(moves):3d} moves {per_move * 1e6:10.1f} us/move {1 / per_move:10.0f} moves/s {average_recomputed:5.1f} pieces recomputed/move")
+
+def bench_log():
+    """A logged move and a new board with logging off, and with every message going to a JSON lines file."""
+    print("log: moves and boards with logging off and on")
+    board = make_board(BOARD_CONFIG)
+    board.update()
+    moves = [(piece.square, legal_move.move) for piece in board.all_pieces if piece.colour == board.turn for legal_move in piece.legal_moves]
+
+    def play_all():
+        for from_square, to_square in moves:
+            board.move(from_square, to_square)
+            board.pop(1)
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "chezz.log")
+        for level, console, log_path in (("WARNING", True, None), ("INFO", False, path), ("DEBUG", False, path)):
+            log.configure(level, console, log_path)
+            per_move = time_per_call(play_all, 0.3) / len(moves)
+            per_board = time_per_call(initialize_classic_board, 0.3)
+            print(f"  {level:<7} {'to ' + os.path.basename(log_path) if log_path else 'off':<12} {per_move * 1e6:8.1f} us/move and take back {per_board * 1e6:8.1f} us/board")
+        log.configure()
+        with open(path, encoding="utf-8") as file:
+            lines = file.readlines()
+    print(f"  {len(lines)} records written, the last: {lines[-1].strip()}")
+
+def bench_engine():
+    """Search every position at every difficulty, to size the budgets for the machine."""
+    print("engine: search at every difficulty")
+    for difficulty, budget in enumerate(DIFFICULTY_BUDGETS):
+        for name, configuration in benchmark_positions().items():
+            board = make_board(configuration)
+            engine = Engine(difficulty)
+            result = engine.search(board)
+            hit_rate = engine.table.get_stats()["hit_rate"]
+            print(f"  {budget['name']:<7} {name:<14} depth {result.depth:2d} {result.nodes:7d} nodes {result.elapsed:6.2f} s {result.nodes_per_second:8.0f} nodes/s {hit_rate:6.1%} table hits")
+
+def bench_staged():
+    """
+    Moves encoded per node by the staged generator of a depth 4 search, against every legal move at every node. Only the
+    encoding is staged, so the Piece.update calls and legality filters done per node are counted alongside.
+    """
+    print("staged: moves encoded, pieces updated and sides filtered per node in a depth 4 search")
+    for name, configuration in benchmark_positions().items():
+        board = make_board(configuration)
+        legal = []
+        iterate_moves = board.iterate_moves
+        has_legal_moves = board.has_legal_moves
+
+        # Counts what generating every move would have cost at every node that asks for moves
+        def count_legal_moves(function):
+            def counted(*arguments, **keywords):
+                board.refresh_legal_moves()
+                legal.append(sum(len(piece.legal_moves) for piece in board.all_pieces if piece.colour == board.turn))
+                return function(*arguments, **keywords)
+            return counted
+
+        board.iterate_moves = count_legal_moves(iterate_moves)
+        board.has_legal_moves = count_legal_moves(has_legal_moves)
+        engine = Engine(budget={"name": "bench", "max_depth": 4, "nodes": 10 ** 9, "time": 10 ** 9})
+        board.moves_generated = board.pieces_updated = board.sides_filtered = 0
+        result = engine.search(board)
+        print(f"  {name:<14} {result.nodes:6d} nodes {board.moves_generated / result.nodes:6.2f} moves/node encoded {sum(legal) / result.nodes:6.2f} legal moves/node"
+              f" {board.pieces_updated / result.nodes:6.2f} pieces updated/node {board.sides_filtered / result.nodes:5.2f} sides filtered/node {result.elapsed:6.2f} s")
+
+def bench_table():
+    """Transposition table counters for a fixed depth search at different table sizes."""
+    print("table: depth 4 search of kiwipete at different table sizes")
+    configuration = benchmark_positions()["kiwipete"]
+    for size_mb in (0.01, 0.1, 1, 16, 64):
+        board = make_board(configuration)
+        engine = Engine(budget={"name": "bench", "max_depth": 4, "nodes": 10 ** 9, "time": 10 ** 9}, table_size_mb=size_mb)
+        result = engine.search(board)
+        stats = engine.table.get_stats()
+        print(f"  {size_mb:6.2f} MB {result.nodes:7d} nodes {result.elapsed:6.2f} s hits {stats['hits']:7d} misses {stats['misses']:7d} collisions {stats['collisions']:7d} fill {stats['fill']:6.1%}")
+
+def bench_sprites():
+    """Images read from disk per new game, and the cost of drawing every piece of a board."""
+    print("sprites: disk loads per new game and piece drawing")
+    screen = _pygame.display.set_mode((800, 600))
+    for theme in (1, 2):
+        for game in range(1, 3):
+            loads = sprite_atlas.loads
+            board = make_board(BOARD_CONFIG)
+            board.set_theme(theme)
+            start = time.perf_counter()
+            for piece in board.all_pieces:
+                board.draw_piece(screen, piece)
+            first_draw = time.perf_counter() - start
+            print(f"  theme {theme} game {game} {sprite_atlas.loads - loads:3d} images loaded, first draw {first_draw * 1e3:8.2f} ms")
+
+        def draw_pieces():
+            for piece in board.all_pieces:
+                board.draw_piece(screen, piece)
+
+        seconds = time_per_call(draw_pieces)
+        print(f"  theme {theme} {seconds * 1e6:10.1f} us to draw {len(board.all_pieces)} pieces")
+    print(f"  atlas {sprite_atlas.get_stats()}")
+
+def bench_frame():
+    """Game frame time, drawing the whole screen every frame against drawing only what changed."""
+    print("frame: update + draw + present of the game screen")
+    screen = _pygame.display.set_mode((800, 600))
+    board = initialize_classic_game(150, 50)
+    squares = [BoardLocation(1, 4), None] # select a pawn and let go of it, so some frames change
+
+    def full_frame():
+        board.update()
+        board.draw(screen, redraw=True)
+        _pygame.display.flip()
+
+    frame = 0
+
+    def dirty_frame():
+        nonlocal frame
+        frame += 1
+        if frame % 30 == 0: # a click every half a second at 60 fps
+            board.selected_square = squares[frame // 30 % 2]
+        board.update()
+        _pygame.display.update(board.draw(screen))
+
+    for name, function in (("full redraw", full_frame), ("changed only", dirty_frame)):
+        seconds = time_per_call(function, 1.0)
+        print(f"  {name:<14} {seconds * 1e6:10.1f} us/frame {1 / seconds:10.0f} frames/s")
+
+def bench_text():
+    """Text rendered by full redraws of the game and the options widgets, once warmed up."""
+    print("text: font and text surface cache over full redraws")
+    screen = _pygame.display.set_mode((800, 600))
+    board = initialize_classic_game(150, 50)
+    board.selected_square = BoardLocation(1, 4)
+    slider = Slider(200, 200, 400, 50, 0, 2, 1, ["Easy", "Medium", "Hard"])
+    button = Button(300, 300, 200, 50, "Back", (0, 200, 0), (255, 255, 255))
+
+    def full_frame():
+        board.update()
+        board.draw(screen, extra_text=[("Thinking...", (10, 560))], redraw=True)
+        slider.draw(screen)
+        button.draw(screen)
+
+    full_frame()
+    stats = text_cache.get_stats()
+    seconds = time_per_call(full_frame)
+    after = text_cache.get_stats()
+    print(f"  {seconds * 1e6:10.1f} us/frame, steady state: {after['misses'] - stats['misses']} new text surfaces, {after['fonts'] - stats['fonts']} new fonts")
+    print(f"  cache {after['entries']} entries {after['bytes'] / 1024:.1f} KiB hit rate {after['hit_rate']:.1%}")
+
+def measure_allocations(function, calls:int):
+    # Peak memory allocated during one call and memory still held afterwards per call, in bytes, with tracemalloc
+    function() # caches filled on the first call are not counted
+    tracemalloc.start()
+    peaks = []
+    start, _ = tracemalloc.get_traced_memory()
+    for _ in range(calls):
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        function()
+        peaks.append(tracemalloc.get_traced_memory()[1] - before)
+    held = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    return sum(peaks) / calls, held / calls
+
+def bench_alloc():
+    """Memory allocated per game frame, per logged move and per search move, measured with tracemalloc."""
+    print("alloc: tracemalloc per frame and per move")
+    screen = _pygame.display.set_mode((800, 600))
+    board = initialize_classic_game(150, 50)
+    squares = [BoardLocation(1, 4), None]
+    frame = 0
+
+    def dirty_frame():
+        nonlocal frame
+        frame += 1
+        board.selected_square = squares[frame % 2]
+        board.update()
+        _pygame.display.update(board.draw(screen))
+
+    peak, held = measure_allocations(dirty_frame, 200)
+    print(f"  frame          {peak:10.0f} B peak {held:8.1f} B held per frame")
+    for name, configuration in benchmark_positions().items():
+        board = make_board(configuration)
+        board.update()
+        moves = itertools.cycle([(piece.square, legal_move.move) for piece in board.all_pieces if piece.colour == board.turn for legal_move in piece.legal_moves])
+        encoded_moves = itertools.cycle(board.generate_moves())
+
+        def play_move():
+            from_square, to_square = next(moves)
+            board.move(from_square, to_square)
+            board.update()
+            board.pop(1)
+            board.update()
+
+        def search_move():
+            board.make_move(next(encoded_moves))
+            board.generate_moves()
+            board.unmake_move()
+
+        peak, held = measure_allocations(play_move, 200)
+        search_peak, search_held = measure_allocations(search_move, 1000)
+        print(f"  {name:<14} logged move {peak:8.0f} B peak {held:6.1f} B held, search move {search_peak:8.0f} B peak {search_held:6.1f} B held")
+    print(f"  {len(BoardLocation.interned) if hasattr(BoardLocation, 'interned') else 'no'} interned locations")
+
+def write_epd_file(path:str, lines:int):
+    # Positions from seeded random games, written over and over until the file has enough lines
+    generator = random.Random("epd bench")
+    records = []
+    for game in range(50):
+        board = initialize_classic_board()
+        for ply in range(80):
+            moves = board.generate_moves()
+            if not moves:
+                break
+            board.make_move(generator.choice(moves))
+            position = parse_fen(board.get_fen())
+            position.operations = {"id": [f"game {game} ply {ply}"]}
+            records.append(position_to_epd(position))
+    with open(path, "w", encoding="utf-8") as file:
+        for line in range(lines):
+            file.write(records[line % len(records)] + "\n")
+    return len(records)
+
+def bench_epd():
+    """Streaming an EPD file into positions, and into boards, best of three passes."""
+    print("epd: streaming an EPD file")
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "positions.epd")
+        distinct = write_epd_file(path, 100000)
+        for boards, count in ((False, 100000), (True, 1000)):
+            best = None
+            for _ in range(3):
+                loader = EpdLoader(path, boards=boards)
+                start = time.perf_counter()
+                for _ in itertools.islice(loader, count):
+                    pass
+                seconds = time.perf_counter() - start
+                best = seconds if best is None else min(best, seconds)
+            print(f"  {'boards' if boards else 'positions':<10} {loader.positions:7d} from {distinct} distinct {best:7.3f} s {loader.positions / best:10.0f} positions/s")
+
+def write_pgn_file(path:str, games:int):
+    # Seeded random games of up to 120 plies, written over and over until the file has enough games
+    generator = random.Random("pgn bench")
+    records = []
+    for game_number in range(40):
+        board = initialize_classic_board()
+        game = PgnGame({"Event": "bench", "Round": str(game_number)})
+        for _ in range(120):
+            moves = board.generate_moves()
+            if not moves:
+                break
+            move = generator.choice(moves)
+            game.moves.append(board.move_to_san(move, moves))
+            board.make_move(move)
+        records.append(game)
+    with open(path, "w", encoding="utf-8") as file:
+        writer = PgnWriter(file)
+        for game_number in range(games):
+            writer.write_game(records[game_number % len(records)])
+    return sum(len(game.moves) for game in records) / len(records)
+
+def bench_pgn():
+    """Streaming a PGN archive, reading the tags and SAN alone and replaying every move on a board."""
+    print("pgn: streaming a PGN archive")
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "games.pgn")
+        average_moves = write_pgn_file(path, 5000)
+        for replay, count in ((False, 5000), (True, 50)):
+            reader = PgnReader(path, replay=replay, skip_invalid=False)
+            start = time.perf_counter()
+            for _ in itertools.islice(reader, count):
+                pass
+            seconds = time.perf_counter() - start
+            print(f"  {'replay' if replay else 'read':<7} {reader.games:5d} games of {average_moves:.0f} plies {seconds:7.3f} s {reader.games / seconds:10.1f} games/s {reader.games * average_moves / seconds:10.0f} moves/s")
+
+def bench_record():
+    """Binary game records against PGN: file size, writing, reading every game, reaching one game, and replaying."""
+    print("record: binary game records against PGN")
+    with tempfile.TemporaryDirectory() as folder:
+        pgn_path = os.path.join(folder, "games.pgn")
+        record_path = os.path.join(folder, "games.chz")
+        games = 5000
+        write_pgn_file(pgn_path, 200)
+        start = time.perf_counter()
+        convert_pgn(pgn_path, record_path)
+        print(f"  convert  200 games {time.perf_counter() - start:7.3f} s, every move replayed to encode it")
+        with GameRecordReader(record_path) as reader:
+            converted = list(reader)
+        # The same games over and over, as write_pgn_file does
+        write_pgn_file(pgn_path, games)
+        with GameRecordWriter(record_path) as writer:
+            for game_number in range(len(converted), games):
+                game = converted[game_number % len(converted)]
+                writer.write_game(game.moves, game.headers, game.result)
+        pgn_size = os.path.getsize(pgn_path)
+        record_size = os.path.getsize(record_path) + os.path.getsize(get_index_path(record_path))
+        print(f"  size    PGN {pgn_size:9d} bytes, records {record_size:9d} bytes with the index ({record_size / pgn_size:.1%}, {record_size / games:.0f} bytes/game)")
+
+        pgn_games = list(PgnReader(pgn_path, replay=False))
+        with GameRecordReader(record_path) as reader:
+            recorded = list(reader)
+        start = time.perf_counter()
+        with open(os.path.join(folder, "copy.pgn"), "w", encoding="utf-8") as file:
+            writer = PgnWriter(file)
+            for game in pgn_games:
+                writer.write_game(game)
+        pgn_write = time.perf_counter() - start
+        start = time.perf_counter()
+        with GameRecordWriter(os.path.join(folder, "copy.chz")) as writer:
+            for game in recorded:
+                writer.write_game(game.moves, game.headers, game.result)
+        record_write = time.perf_counter() - start
+        print(f"  write   PGN {games / pgn_write:10.0f} games/s, records {games / record_write:10.0f} games/s")
+
+        start = time.perf_counter()
+        for _ in PgnReader(pgn_path, replay=False):
+            pass
+        pgn_read = time.perf_counter() - start
+        start = time.perf_counter()
+        with GameRecordReader(record_path) as reader:
+            for _ in reader:
+                pass
+        record_read = time.perf_counter() - start
+        print(f"  read    PGN {games / pgn_read:10.0f} games/s, records {games / record_read:10.0f} games/s (tags and moves, no replay)")
+
+        # PGN has to be read from the start to reach a game, the index goes straight to it
+        last = time_per_call(lambda: next(itertools.islice(PgnReader(pgn_path, replay=False), games - 1, None)), 0.2)
+        generator = random.Random("record bench")
+        numbers = [generator.randrange(games) for _ in range(1000)]
+        with GameRecordReader(record_path) as reader:
+            seek = time_per_call(lambda: [reader.read_game(number) for number in numbers], 0.2) / len(numbers)
+        print(f"  game {games - 1} PGN {last * 1e3:8.2f} ms by scanning, records {seek * 1e6:8.2f} us by index (random games)")
+
+        count = 50
+        pgn_replay = time_per_call(lambda: [game.replay() for game in pgn_games[:count]], 0.2) / count
+        record_replay = time_per_call(lambda: [game.replay() for game in recorded[:count]], 0.2) / count
+        print(f"  replay  PGN {pgn_replay * 1e3:8.2f} ms/game resolving SAN, records {record_replay * 1e3:8.2f} ms/game")
+
+def bench_eval():
+    """Batch evaluation against one position at a time, to find the batch size where the batch starts winning."""
+    print(f"eval: batch against per-position evaluation (NumPy {'on' if evaluation._numpy is not None else 'off'})")
+    generator = random.Random("eval bench")
+    rows = []
+    turns = []
+    while len(rows) < 4096:
+        board = initialize_classic_board()
+        for _ in range(100):
+            moves = board.generate_moves()
+            if not moves:
+                break
+            board.make_move(generator.choice(moves))
+            rows.append(evaluation.pack_board(board))
+            turns.append(board.turn == "white")
+    crossover = None
+    for size in (1, 2, 4, 8, 16, 32, 64, 128, 256, 1024, 4096):
+        batch_rows = rows[:size]
+        batch_turns = turns[:size]
+        packed = evaluation.pack_batch(batch_rows)
+        one_at_a_time = time_per_call(lambda: [evaluation.evaluate_codes(row, white) for row, white in zip(batch_rows, batch_turns)], 0.2)
+        batched = time_per_call(lambda: evaluation.evaluate_batch(packed, batch_turns), 0.2)
+        if crossover is None and batched < one_at_a_time:
+            crossover = size
+        print(f"  {size:5d} positions {one_at_a_time / size * 1e6:8.2f} us/position one at a time {batched / size * 1e6:8.2f} us/position batched")
+    print(f"  batch wins from {crossover} positions")
+    print("  children of a node, evaluate_children against make_move + evaluate_board + unmake_move")
+    for name, configuration in benchmark_positions().items():
+        board = make_board(configuration)
+        moves = board.generate_moves()
+
+        def one_at_a_time():
+            for move in moves:
+                board.make_move(move)
+                evaluation.evaluate_board(board)
+                board.unmake_move()
+
+        single = time_per_call(one_at_a_time, 0.2)
+        batched = time_per_call(lambda: evaluation.evaluate_children(board, moves), 0.2)
+        print(f"  {name:<14} {len(moves):3d} moves {single * 1e6:8.1f} us one at a time {batched * 1e6:8.1f} us batched")
+
+def bench_book():
+    """Building a book from a PGN archive, then opening and probing it and a synthetic one of a million entries."""
+    print("book: building and probing opening books")
+    with tempfile.TemporaryDirectory() as folder:
+        pgn_path = os.path.join(folder, "games.pgn")
+        book_path = os.path.join(folder, "book.bin")
+        write_pgn_file(pgn_path, 2000)
+        start = time.perf_counter()
+        entries = build_book([pgn_path], book_path, plies=16)
+        seconds = time.perf_counter() - start
+        print(f"  build  2000 games {entries:7d} entries {seconds:7.3f} s {2000 / seconds:10.0f} games/s")
+        board = make_board(BOARD_CONFIG)
+        with OpeningBook(book_path) as book:
+            moves = len(book.get_moves(board))
+            probe = time_per_call(lambda: book.get_entries(board.hash), 0.2)
+            legal = time_per_call(lambda: book.get_moves(board), 0.2)
+        print(f"  start position {moves} book moves, {probe * 1e6:8.2f} us raw probe {legal * 1e6:8.2f} us with legal move check")
+
+        # A million sorted random keys, 16 MB, to show that opening and probing do not grow with the size
+        generator = random.Random("book bench")
+        keys = sorted(generator.getrandbits(64) for _ in range(1000000))
+        large_path = os.path.join(folder, "large.bin")
+        with open(large_path, "wb") as file:
+            file.write(b"".join(ENTRY.pack(key, 0, 1, 0) for key in keys))
+        start = time.perf_counter()
+        book = OpeningBook(large_path)
+        opened = time.perf_counter() - start
+        hits = keys[::10007]
+        misses = [generator.getrandbits(64) for _ in range(len(hits))]
+        hit = time_per_call(lambda: [book.get_entries(key) for key in hits], 0.2) / len(hits)
+        miss = time_per_call(lambda: [book.get_entries(key) for key in misses], 0.2) / len(misses)
+        book.close()
+        start = time.perf_counter()
+        with open(large_path, "rb") as file:
+            data = file.read()
+        loaded = {ENTRY.unpack_from(data, offset)[0] for offset in range(0, len(data), ENTRY.size)}
+        load = time.perf_counter() - start
+        print(f"  {len(keys)} entries: open {opened * 1e3:7.3f} ms, probe {hit * 1e6:6.2f} us hit {miss * 1e6:6.2f} us miss, against {load:6.2f} s to load it all into a set of {len(loaded)}")
+
+# A won and a drawn pawn ending, and a rook against a pawn that only reaches a table once the pawn is taken
+BITBASE_POSITIONS = {
+    "kpk_win": "7k/8/6K1/8/6P1/8/8/8 w - - 0 1",
+    "kpk_draw": "8/8/8/4k3/8/8/4P3/4K3 w - - 0 1",
+    "krkp": "8/8/8/8/1k6/8/1p2K3/7R w - - 0 1",
+}
+
+def bench_bitbase():
+    """Generating the bitbases in this process, probing them, and a Medium search with and without them."""
+    print("bitbase: generating and probing endgame bitbases")
+    with tempfile.TemporaryDirectory() as folder:
+        for signature in SIGNATURES:
+            start = time.perf_counter()
+            values = generate_table(signature, folder)
+            with open(os.path.join(folder, f"{signature}.bb"), "wb") as file:
+                file.write(pack_values(values))
+            print(f"  generate {signature} {time.perf_counter() - start:7.2f} s")
+        bitbases = Bitbases(folder)
+        for name, fen in BITBASE_POSITIONS.items():
+            board = parse_fen(fen).to_board()
+            probe = time_per_call(lambda: bitbases.probe(board), 0.2)
+            results = []
+            for tables in (None, bitbases):
+                engine = Engine(budget=DIFFICULTY_BUDGETS[1], bitbases=tables)
+                result = engine.search(board)
+                board.make_move(result.from_square.get_index() | result.to_square.get_index() << 6)
+                after = -bitbases.probe(board) if len(board.all_pieces) == 3 else None
+                board.unmake_move()
+                results.append(f"{result.from_square}{result.to_square} ({after}) {result.nodes:5d} nodes")
+            print(f"  {name:<9} probe {probe * 1e6:6.2f} us, value {bitbases.probe(board)}, search {results[0]} without, {results[1]} with")
+        bitbases.close()
+
+IMPORT_CODE = """
+import sys, time
+start = time.perf_counter()
+import rules
+imported = time.perf_counter()
+rules.initialize_classic_board()
+print(imported - start, time.perf_counter() - imported, "pygame" in sys.modules)
+"""
+
+def bench_import():
+    """Import of the rules core and one board in a fresh interpreter, which must not load pygame."""
+    print("import: rules core in a fresh interpreter")
+    output = subprocess.run([sys.executable, "-c", IMPORT_CODE], capture_output=True, text=True, check=True).stdout.split()
+    print(f"  import rules {float(output[0]) * 1e3:8.2f} ms, first board {float(output[1]) * 1e3:8.2f} ms, pygame loaded: {output[2]}")
+
+def bench_parallel():
+    """Root split perft scaling from 1 worker to one per core, in its own interpreter so the workers never load pygame."""
+    print("parallel: root split perft, 1 to N workers")
+    workers = max(2, os.cpu_count() or 1)
+    output = subprocess.run([sys.executable, "parallel.py", "--depth", "4", "--scaling", str(workers)], capture_output=True, text=True, check=True).stdout
+    for line in output.splitlines():
+        print(f"  {line}")
+
+BENCHMARKS = {
+    "import": bench_import,
+    "update": bench_update,
+    "idle": bench_idle,
+    "move": bench_move,
+    "log": bench_log,
+    "sprites": bench_sprites,
+    "frame": bench_frame,
+    "alloc": bench_alloc,
+    "text": bench_text,
+    "engine": bench_engine,
+    "staged": bench_staged,
+    "table": bench_table,
+    "epd": bench_epd,
+    "pgn": bench_pgn,
+    "record": bench_record,
+    "eval": bench_eval,
+    "book": bench_book,
+    "bitbase": bench_bitbase,
+    "parallel": bench_parallel,
+}
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(BENCHMARKS.keys())
+    for name in names:
+        if name not in BENCHMARKS:
+            print(f"Unknown benchmark {name}, choose from: {', '.join(BENCHMARKS.keys())}")
+            sys.exit(1)
+        BENCHMARKS[name]()
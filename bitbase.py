@@ -0,0 +1,411 @@
+"""
+Endgame bitbases: win or draw for every position of king and queen, rook or pawn against a lone king, generated
+by retrograde analysis and stored at 2 bits per position. Tables are memory-mapped, so probing one is a single
+byte read. Generation is split across worker processes.
+
+Tables are built with the stronger side as white. Index = black to move << 18 | white king << 12 | black king << 6
+| piece, squares as in BoardLocation.get_index. A position with black as the stronger side is probed turned upside
+down with the colours swapped. Castling rights are ignored, and knight or bishop against a king is always a draw.
+
+    python bitbase.py --output bitbases
+    python bitbase.py --output bitbases --verify 200
+"""
+import argparse
+import mmap
+import multiprocessing
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+SIGNATURES = ("KQK", "KRK", "KPK") # the pawn table needs the queen and rook ones for its promotions, so it is built last
+TABLE_SIZE = 1 << 19 # positions in every table
+CHUNK_SIZE = 1 << 15 # positions or frontier entries given to a worker at once
+
+# Value of a position for white, the stronger side, stored in 2 bits
+ILLEGAL = 0
+DRAW = 1
+WIN = 2
+
+NO_WIN = 255 # move count of a black position that can take the piece, more than its moves can ever count down
+
+def make_index(black_to_move:int, white_king:int, black_king:int, piece:int):
+    return black_to_move << 18 | white_king << 12 | black_king << 6 | piece
+
+def make_steps(offsets:list[tuple[int, int]]) -> list[tuple[int, ...]]:
+    # Squares one step away from every square
+    steps = []
+    for index in range(64):
+        rank, file = divmod(index, 8)
+        steps.append(tuple((rank + rank_offset) * 8 + file + file_offset for rank_offset, file_offset in offsets if 0 <= rank + rank_offset < 8 and 0 <= file + file_offset < 8))
+    return steps
+
+def make_rays(directions:list[tuple[int, int]]) -> list[tuple[tuple[int, ...], ...]]:
+    # Squares in every direction from every square, nearest first
+    rays = []
+    for index in range(64):
+        rank, file = divmod(index, 8)
+        square_rays = []
+        for rank_offset, file_offset in directions:
+            ray = []
+            ray_rank, ray_file = rank + rank_offset, file + file_offset
+            while 0 <= ray_rank < 8 and 0 <= ray_file < 8:
+                ray.append(ray_rank * 8 + ray_file)
+                ray_rank, ray_file = ray_rank + rank_offset, ray_file + file_offset
+            square_rays.append(tuple(ray))
+        rays.append(tuple(square_rays))
+    return rays
+
+def make_between(rays:list[tuple[tuple[int, ...], ...]]) -> list[dict[int, tuple[int, ...]]]:
+    # For every square, the squares a slider on it attacks along its rays -> the squares in between
+    between = []
+    for square_rays in rays:
+        targets = {}
+        for ray in square_rays:
+            for distance, target in enumerate(ray):
+                targets[target] = ray[:distance]
+        between.append(targets)
+    return between
+
+ROOK_DIRECTIONS = [(1, 0), (-1, 0), (0, 1), (0, -1)]
+QUEEN_DIRECTIONS = ROOK_DIRECTIONS + [(1, 1), (1, -1), (-1, 1), (-1, -1)]
+KING_STEPS = make_steps(QUEEN_DIRECTIONS)
+KING_AREAS = [frozenset(steps) for steps in KING_STEPS]
+RAYS = {"Q": make_rays(QUEEN_DIRECTIONS), "R": make_rays(ROOK_DIRECTIONS)}
+BETWEEN = {kind: make_between(rays) for kind, rays in RAYS.items()}
+
+def piece_attacks(kind:str, piece:int, target:int, blocker:int):
+    # Whether white's piece attacks target, with the white king on blocker the only piece that can be in the way
+    if kind == "P":
+        return target - piece in (7, 9) and abs((target & 7) - (piece & 7)) == 1
+    between = BETWEEN[kind][piece].get(target)
+    return between is not None and blocker not in between
+
+def is_legal(kind:str, index:int):
+    black_to_move = index >> 18
+    white_king = index >> 12 & 63
+    black_king = index >> 6 & 63
+    piece = index & 63
+    if white_king == black_king or piece == white_king or piece == black_king or black_king in KING_AREAS[white_king]:
+        return False
+    if kind == "P" and not 8 <= piece < 56:
+        return False
+    # The side that is not to move cannot be in check, a lone king never checks
+    return black_to_move or not piece_attacks(kind, piece, black_king, white_king)
+
+def get_black_moves(kind:str, index:int):
+    """
+    The positions black's legal moves lead to, and whether one of them takes the piece, which draws.
+    Called on a legal position with black to move.
+    """
+    white_king = index >> 12 & 63
+    black_king = index >> 6 & 63
+    piece = index & 63
+    white_area = KING_AREAS[white_king]
+    children = []
+    takes = False
+    for target in KING_STEPS[black_king]:
+        if target in white_area:
+            continue
+        if target == piece:
+            takes = True # not defended by the king, so a draw
+        elif not piece_attacks(kind, piece, target, white_king):
+            children.append(white_king << 12 | target << 6 | piece)
+    return children, takes
+
+def get_promotions(index:int):
+    # Squares a white pawn can promote on, in a legal position with white to move
+    white_king = index >> 12 & 63
+    black_king = index >> 6 & 63
+    target = (index & 63) + 8
+    if target >= 56 and target != white_king and target != black_king:
+        return target
+    return None
+
+def get_unmoves(kind:str, index:int):
+    """
+    The legal positions that lead to this one in one move: moves of white before a black to move position,
+    moves of the black king before a white to move one. Nothing is ever taken in a table, so no move un-takes.
+    """
+    white_king = index >> 12 & 63
+    black_king = index >> 6 & 63
+    piece = index & 63
+    parents = []
+    if index >> 18: # white moved last
+        for origin in KING_STEPS[white_king]:
+            if origin != piece and origin not in KING_AREAS[black_king]:
+                parents.append(origin << 12 | black_king << 6 | piece)
+        if kind == "P":
+            origin = piece - 8
+            if origin >= 8 and origin != white_king and origin != black_king:
+                parents.append(white_king << 12 | black_king << 6 | origin)
+                if 24 <= piece < 32 and origin - 8 != white_king and origin - 8 != black_king:
+                    parents.append(white_king << 12 | black_king << 6 | origin - 8)
+        else:
+            for ray in RAYS[kind][piece]:
+                for origin in ray:
+                    if origin == white_king or origin == black_king:
+                        break
+                    parents.append(white_king << 12 | black_king << 6 | origin)
+    else: # the black king moved last
+        for origin in KING_STEPS[black_king]:
+            if origin != piece and origin != white_king and origin not in KING_AREAS[white_king]:
+                parents.append(1 << 18 | white_king << 12 | origin << 6 | piece)
+    return [parent for parent in parents if is_legal(kind, parent)]
+
+def classify_range(signature:str, start:int, stop:int, folder:str):
+    """
+    First pass over the positions start to stop: which are legal, how many moves every black position has,
+    and the positions already won (black mated, or a white pawn promoting into a won position).
+    Returns (values, move counts, wins), run in a worker process.
+    """
+    kind = signature[1]
+    promotions = load_bitbases(folder, ("KQK", "KRK")) if kind == "P" else {}
+    values = bytearray(stop - start)
+    counts = bytearray(stop - start)
+    wins = []
+    for index in range(start, stop):
+        if not is_legal(kind, index):
+            continue
+        values[index - start] = DRAW
+        if index >> 18:
+            children, takes = get_black_moves(kind, index)
+            counts[index - start] = NO_WIN if takes else len(children)
+            if not children and not takes and piece_attacks(kind, index & 63, index >> 6 & 63, index >> 12 & 63):
+                values[index - start] = WIN # checkmate
+                wins.append(index)
+        elif kind == "P":
+            target = get_promotions(index)
+            # Promoting to a queen or a rook wins if that table says black, to move next, loses
+            if target is not None and any(promotions[table].probe_index(1 << 18 | (index & 0o777700) | target) == WIN for table in ("KQK", "KRK")):
+                values[index - start] = WIN
+                wins.append(index)
+    return bytes(values), bytes(counts), wins
+
+def unmove_frontier(signature:str, frontier:list[int]):
+    # The parents of every position of the frontier, run in a worker process
+    kind = signature[1]
+    parents = []
+    for index in frontier:
+        parents.extend(get_unmoves(kind, index))
+    return parents
+
+def generate_table(signature:str, folder:str, executor:ProcessPoolExecutor = None) -> bytearray:
+    """
+    Retrograde analysis from the mates and winning promotions outwards. A white to move parent of a won position
+    is won, a black to move parent is won once every one of its moves has been found to lose. Whatever is left is
+    a draw. Each step of the frontier is shared out in chunks to the executor, or done here without one.
+    """
+    mapper = executor.map if executor is not None else map
+    starts = range(0, TABLE_SIZE, CHUNK_SIZE)
+    values = bytearray()
+    counts = bytearray()
+    frontier = []
+    for chunk_values, chunk_counts, chunk_wins in mapper(classify_range, [signature] * len(starts), starts, [start + CHUNK_SIZE for start in starts], [folder] * len(starts)):
+        values += chunk_values
+        counts += chunk_counts
+        frontier += chunk_wins
+
+    while frontier:
+        chunks = [frontier[start:start + CHUNK_SIZE] for start in range(0, len(frontier), CHUNK_SIZE)]
+        frontier = []
+        for parents in mapper(unmove_frontier, [signature] * len(chunks), chunks):
+            for parent in parents:
+                if values[parent] == WIN:
+                    continue
+                if parent >> 18:
+                    counts[parent] -= 1
+                    if counts[parent]:
+                        continue
+                values[parent] = WIN
+                frontier.append(parent)
+    return values
+
+def pack_values(values:bytearray) -> bytes:
+    # Four 2 bit values to a byte, the first in the lowest bits
+    return bytes(first | second << 2 | third << 4 | fourth << 6 for first, second, third, fourth in zip(values[0::4], values[1::4], values[2::4], values[3::4]))
+
+class Bitbase:
+    # One memory-mapped table file
+    def __init__(self, path:str):
+        self.path = path
+        self.file = open(path, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.data) != TABLE_SIZE // 4:
+            self.close()
+            raise ValueError(f"{path} is {os.path.getsize(path)} bytes instead of {TABLE_SIZE // 4}")
+
+    def probe_index(self, index:int):
+        return self.data[index >> 2] >> ((index & 3) << 1) & 3
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+def load_bitbases(folder:str, signatures = SIGNATURES) -> dict[str, Bitbase]:
+    # Every table of the folder that exists
+    tables = {}
+    for signature in signatures:
+        path = os.path.join(folder, f"{signature}.bb")
+        if os.path.isfile(path):
+            tables[signature] = Bitbase(path)
+    return tables
+
+class Bitbases:
+    """
+    The tables of a folder, probed with a board. probe gives 1 if the side to move wins, 0 for a draw,
+    -1 if it loses, and None when the position has more pieces or its table is missing.
+    """
+    def __init__(self, folder:str):
+        self.folder = folder
+        self.tables = load_bitbases(folder)
+
+    def probe(self, board):
+        pieces = board.all_pieces
+        if len(pieces) != 3:
+            return None
+        strong = next(piece for piece in pieces if piece.special != "king")
+        kind = strong.name.upper()
+        if kind in ("N", "B"):
+            return 0 # a lone minor piece cannot mate
+        table = self.tables.get(f"K{kind}K")
+        if table is None:
+            return None
+        flip = 56 if strong.colour == "black" else 0 # turn the board upside down so the stronger side is white
+        white_king = next(piece for piece in pieces if piece.special == "king" and piece.colour == strong.colour)
+        black_king = next(piece for piece in pieces if piece.special == "king" and piece.colour != strong.colour)
+        black_to_move = int(board.turn != strong.colour)
+        value = table.probe_index(make_index(black_to_move, white_king.square.get_index() ^ flip, black_king.square.get_index() ^ flip, strong.square.get_index() ^ flip))
+        if value == WIN:
+            return -1 if black_to_move else 1
+        return 0 if value == DRAW else None
+
+    def close(self):
+        for table in self.tables.values():
+            table.close()
+
+def index_to_fen(signature:str, index:int):
+    squares = [None] * 64
+    squares[index >> 12 & 63] = "K"
+    squares[index >> 6 & 63] = "k"
+    squares[index & 63] = signature[1]
+    ranks = []
+    for rank in range(7, -1, -1):
+        text = ""
+        empty = 0
+        for name in squares[rank * 8:rank * 8 + 8]:
+            if name is None:
+                empty += 1
+                continue
+            text += (str(empty) if empty else "") + name
+            empty = 0
+        ranks.append(text + (str(empty) if empty else ""))
+    return f"{'/'.join(ranks)} {'b' if index >> 18 else 'w'} - - 0 1"
+
+def solve(board, depth:int):
+    """
+    Brute force search with the rules of the game, for the stronger side: 1 if it forces a win within depth plies,
+    0 if the weaker side forces a draw, None if depth is not enough to tell. Only a mate counts as a win, and only
+    taking the piece, a stalemate or an underpromotion counts as a draw.
+    """
+    moves = board.generate_moves()
+    strong_to_move = any(piece.special != "king" and piece.colour == board.turn for piece in board.all_pieces)
+    if not moves:
+        return int(board.is_check() and not strong_to_move)
+    if len(board.all_pieces) == 2 or any(piece.name.upper() in ("N", "B") for piece in board.all_pieces):
+        return 0
+    if depth == 0:
+        return None
+    results = set()
+    for move in moves:
+        board.make_move(move)
+        try:
+            results.add(solve(board, depth - 1))
+        finally:
+            board.unmake_move()
+        if (1 if strong_to_move else 0) in results:
+            return 1 if strong_to_move else 0
+    return results.pop() if len(results) == 1 else None
+
+def get_expected_value(bitbases:Bitbases, board):
+    """
+    The value a legal table position must have given the stored values of the positions its legal moves lead
+    to, probed through the rules of the game: a win for white if some move (white) or every move (black) leads
+    to a win, a draw otherwise.
+    """
+    child_wins = []
+    for move in board.generate_moves():
+        board.make_move(move)
+        result = bitbases.probe(board)
+        child_wins.append(result is not None and result != 0 and (result == 1) == (board.turn == "white"))
+        board.unmake_move()
+    if not child_wins:
+        return WIN if board.is_check() and board.turn == "black" else DRAW
+    return WIN if (any(child_wins) if board.turn == "white" else all(child_wins)) else DRAW
+
+def verify(folder:str, samples:int, depth:int):
+    """
+    Checks random positions of every table against the rules of the game: the value of every position must follow from
+    the values of the positions its legal moves lead to, and must agree with a brute force search of depth plies
+    wherever that search can tell. Returns the number of positions that do not.
+    """
+    from rules import classic_board_from_fen
+
+    bitbases = Bitbases(folder)
+    generator = random.Random("bitbase verify")
+    failures = 0
+    for signature, table in bitbases.tables.items():
+        kind = signature[1]
+        checked = searched = 0
+        while checked < samples:
+            index = generator.randrange(TABLE_SIZE)
+            if not is_legal(kind, index):
+                if table.probe_index(index) != ILLEGAL:
+                    print(f"  {signature} {index_to_fen(signature, index)}: illegal position stored as {table.probe_index(index)}")
+                    failures += 1
+                continue
+            checked += 1
+            board = classic_board_from_fen(index_to_fen(signature, index))
+            stored = table.probe_index(index)
+            expected = get_expected_value(bitbases, board)
+            solved = solve(board, depth)
+            searched += solved is not None
+            if stored != expected or (solved is not None and stored != (WIN if solved else DRAW)):
+                print(f"  {signature} {index_to_fen(signature, index)}: stored {stored}, moves say {expected}, search says {solved}")
+                failures += 1
+        print(f"  {signature}: {checked} positions checked against their moves, {searched} also decided by a {depth} ply search")
+    bitbases.close()
+    return failures
+
+def main(arguments:list[str] = None):
+    parser = argparse.ArgumentParser(description="Generate endgame bitbases, or check them against the rules.")
+    parser.add_argument("--output", default="bitbases", help="folder of the table files")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes, 1 to generate in this process")
+    parser.add_argument("--verify", type=int, metavar="N", help="check N random positions of every table instead of generating")
+    parser.add_argument("--depth", type=int, default=3, help="plies of the brute force search used by --verify")
+    options = parser.parse_args(arguments)
+
+    if options.verify:
+        failures = verify(options.output, options.verify, options.depth)
+        print(f"{failures} positions wrong")
+        return 1 if failures else 0
+
+    os.makedirs(options.output, exist_ok=True)
+    executor = ProcessPoolExecutor(options.workers, mp_context=multiprocessing.get_context("spawn")) if options.workers > 1 else None
+    try:
+        for signature in SIGNATURES:
+            start = time.perf_counter()
+            values = generate_table(signature, options.output, executor)
+            with open(os.path.join(options.output, f"{signature}.bb"), "wb") as file:
+                file.write(pack_values(values))
+            wins = [values[colour << 18:(colour + 1) << 18].count(WIN) for colour in (0, 1)]
+            draws = [values[colour << 18:(colour + 1) << 18].count(DRAW) for colour in (0, 1)]
+            print(f"{signature}: white to move {wins[0]} won {draws[0]} drawn, black to move {wins[1]} won {draws[1]} drawn, {time.perf_counter() - start:.1f} s")
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,184 @@
+"""
+Opening book: a sorted file of 16 byte entries laid out like a Polyglot book (key, move, weight, learn, big-endian).
+The file is memory-mapped and searched in place with a binary search, so opening a book of any size costs nothing
+and a lookup reads only the few entries it needs.
+
+The keys are Board.hash, the Zobrist keys of rules.py and not the Polyglot ones, so books made by other
+programs open and search fine but will not find our positions. Build books with build_book.
+
+    python book.py build games.pgn --output book.bin --plies 16
+    python book.py probe book.bin --fen "<fen>"
+"""
+import argparse
+import mmap
+import os
+import random
+import struct
+import sys
+import time
+
+from rules import Board, SanError, classic_board_from_fen, move_to_string, CASTLING_MOVES
+
+ENTRY = struct.Struct(">QHHI") # key, move, weight, learn
+KEY = struct.Struct(">Q")
+MAX_WEIGHT = 0xFFFF
+
+class BookEntry:
+    def __init__(self, move:int, weight:int, learn:int = 0):
+        self.move = move # encoded as for Board.make_move
+        self.weight = weight
+        self.learn = learn
+
+def move_to_book(move:int, board:Board):
+    """
+    Our moves are from | to << 6 | promotion << 12, Polyglot moves are to | from << 6 | promotion << 12 with the same
+    promotion numbers, and castling written as the king taking its own rook.
+    """
+    from_index = move & 63
+    to_index = move >> 6 & 63
+    piece = board.mailbox[from_index]
+    if piece.special == "king" and abs((from_index & 7) - (to_index & 7)) == 2:
+        to_index = CASTLING_MOVES[to_index][2] # the rook's square
+    return to_index | from_index << 6 | (move >> 12 & 7) << 12
+
+def move_from_book(book_move:int, board:Board):
+    to_index = book_move & 63
+    from_index = book_move >> 6 & 63
+    piece = board.mailbox[from_index]
+    target = board.mailbox[to_index]
+    if piece is not None and piece.special == "king" and target is not None and target.colour == piece.colour:
+        to_index = from_index + 2 if to_index > from_index else from_index - 2 # king takes own rook is castling
+    return from_index | to_index << 6 | (book_move >> 12 & 7) << 12
+
+class OpeningBook:
+    def __init__(self, path:str):
+        self.path = path
+        self.file = open(path, "rb")
+        size = os.fstat(self.file.fileno()).st_size
+        # An empty file cannot be mapped, and has no entries anyway
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size > 0 else b""
+        self.entries = size // ENTRY.size
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+    def find_first(self, key:int):
+        # Index of the first entry with this key or a greater one, a binary search over the mapped file
+        low = 0
+        high = self.entries
+        while low < high:
+            middle = (low + high) // 2
+            if KEY.unpack_from(self.data, middle * ENTRY.size)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def get_entries(self, key:int) -> list[BookEntry]:
+        # Entries are read as Polyglot stores them, the moves are still in Polyglot form
+        entries = []
+        index = self.find_first(key)
+        while index < self.entries:
+            entry_key, move, weight, learn = ENTRY.unpack_from(self.data, index * ENTRY.size)
+            if entry_key != key:
+                break
+            entries.append(BookEntry(move, weight, learn))
+            index += 1
+        return entries
+
+    def get_moves(self, board:Board) -> list[BookEntry]:
+        # The book moves of the position that are legal on the board, heaviest first, with our move encoding
+        legal_moves = set(board.generate_moves())
+        entries = []
+        for entry in self.get_entries(board.hash):
+            move = move_from_book(entry.move, board)
+            if move in legal_moves:
+                entries.append(BookEntry(move, entry.weight, entry.learn))
+        entries.sort(key=lambda entry: entry.weight, reverse=True)
+        return entries
+
+    def choose_move(self, board:Board, generator:random.Random = None):
+        # A book move picked at random in proportion to its weight, None when the position is not in the book
+        entries = [entry for entry in self.get_moves(board) if entry.weight > 0]
+        if not entries:
+            return None
+        generator = generator or random
+        return generator.choices([entry.move for entry in entries], weights=[entry.weight for entry in entries])[0]
+
+def build_book(pgn_paths:list[str], output_path:str, plies:int = 16, minimum_weight:int = 1):
+    """
+    Makes a book of the first plies moves of every game in the PGN files. A move is weighted 2 for a win of the
+    side that played it, 1 for a draw or an unfinished game and 0 for a loss, summed over every game that played it.
+    Moves below minimum_weight are left out. Malformed games are skipped. Returns the number of entries written.
+    """
+    from pgn import PgnReader
+
+    weights:dict[tuple[int, int], int] = {} # (key, book move) -> weight
+    boards:dict[str, Board] = {} # one board per starting position, put back after every game
+    for path in pgn_paths:
+        for game in PgnReader(path, replay=False):
+            fen = game.get_starting_fen()
+            if fen not in boards:
+                boards[fen] = classic_board_from_fen(fen)
+            board = boards[fen]
+            points = {"1-0": {"white": 2, "black": 0}, "0-1": {"white": 0, "black": 2}}.get(game.result, {"white": 1, "black": 1})
+            played = 0
+            try:
+                for san in game.moves[:plies]:
+                    move = board.parse_san(san)
+                    key = (board.hash, move_to_book(move, board))
+                    weights[key] = weights.get(key, 0) + points[board.turn]
+                    board.make_move(move)
+                    played += 1
+            except SanError:
+                pass # the moves up to the illegal one are still worth keeping
+            for _ in range(played):
+                board.unmake_move()
+
+    entries = sorted((key, book_move, weight) for (key, book_move), weight in weights.items() if weight >= minimum_weight)
+    largest = max((weight for key, book_move, weight in entries), default=0)
+    with open(output_path, "wb") as file:
+        for key, book_move, weight in entries:
+            if largest > MAX_WEIGHT: # scaled down to fit 16 bits, without letting a move fall to 0
+                weight = max(1, weight * MAX_WEIGHT // largest)
+            file.write(ENTRY.pack(key, book_move, weight, 0))
+    return len(entries)
+
+def main(arguments:list[str] = None):
+    parser = argparse.ArgumentParser(description="Build or look up an opening book.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="make a book from PGN files")
+    build.add_argument("pgn", nargs="+", help="PGN files to read")
+    build.add_argument("--output", default="book.bin")
+    build.add_argument("--plies", type=int, default=16, help="moves from the start of every game to put in the book")
+    build.add_argument("--minimum-weight", type=int, default=1, help="leave out moves with less weight than this")
+    probe = commands.add_parser("probe", help="print the book moves of a position")
+    probe.add_argument("book")
+    probe.add_argument("--fen", default="rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1")
+    options = parser.parse_args(arguments)
+
+    if options.command == "build":
+        start = time.perf_counter()
+        count = build_book(options.pgn, options.output, options.plies, options.minimum_weight)
+        print(f"{count} entries written to {options.output} in {time.perf_counter() - start:.2f} s")
+        return 0
+
+    board = classic_board_from_fen(options.fen)
+    with OpeningBook(options.book) as book:
+        entries = book.get_moves(board)
+        total = sum(entry.weight for entry in entries)
+        for entry in entries:
+            print(f"{board.get_san(entry.move):<8} {move_to_string(entry.move):<6} weight {entry.weight:6d} ({entry.weight / total if total else 0:.1%})")
+        print(f"{len(entries)} book moves, {book.entries} entries in the book")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,12 @@
+"""
+Drawing and input for the chess board. The rules themselves are in rules.py, which does not need pygame.
+"""
 import pygame as _pygame
+import log
 from settings import settings
+from gui import font_registry, text_cache
+from sprites import sprite_atlas
+from rules import BOARD_CONFIG, BoardLocation, Piece, Board, SQUARES, classic_pieces, parse_fen
 
 MOVE_HIGHLIGHT_RADIUS = settings["board"]["move_highlight_radius"]
 CAPTURE_HIGHLIGHT_RADIUS = settings["board"]["capture_highlight_radius"]
@@ -18,336 +25,10 @@ HIGHLIGHT = _pygame.Color("#8877DD99")
 MOVE_HIGHLIGHT = _pygame.Color("#5fa14460")
 CAPTURE_HIGHLIGHT = _pygame.Color("#d42a2a60")
 
-BOARD_CONFIG = [
-    ["R", "N", "B", "Q", "K", "B", "N", "R"],
-    ["P", "P", "P", "P", "P", "P", "P", "P"],
-    [None, None, None, None, None, None, None, None],
-    [None, None, None, None, None, None, None, None],
-    [None, None, None, None, None, None, None, None],
-    [None, None, None, None, None, None, None, None],
-    ["p", "p", "p", "p", "p", "p", "p", "p"],
-    ["r", "n", "b", "q", "k", "b", "n", "r"],
-]
+show_debug_info = True # on screen, the log has its own switch in log.py
+logger = log.get_logger("board")
 
-show_debug_info = True
-
-class BoardLocation:
-    def __init__(self, rank:int, file:int):
-        self.rank = rank
-        self.file = file
-    
-    def __str__(self):
-        if self.rank < 0 or self.rank > 7 or self.file < 0 or self.file > 7:
-            return "None"
-        else:
-            return f"{["a", "b", "c", "d", "e", "f", "g", "h"][self.file]}{self.rank + 1}"
-    
-    def __eq__(self, other):
-        if isinstance(other, BoardLocation):
-            return self.rank == other.rank and self.file == other.file
-        else:
-            return NotImplemented
-
-    def offset(self, offset_rank:int, offset_file:int):
-        self.rank += offset_rank
-        self.file += offset_file
-    
-    def get_rank(self):
-        return self.rank
-    
-    def get_file(self):
-        return self.file
-
-class Movement:
-    def __init__(self, move:BoardLocation, need_to_be_clear:list[list[BoardLocation]], type:str):
-        self.move = move
-        self.need_to_be_clear = need_to_be_clear
-        self.type = type # "normal", "capture"
-    
-    def __str__(self):
-        clear_str = ', '.join( 
-            '[' + ', '.join(str(loc) for loc in group) + ']'
-            for group in self.need_to_be_clear
-        )
-        return f"Move to {self.move}, clears: {clear_str if clear_str else '[]'}, type: {self.type}"
-    
-    def offset(self, offset_rank:int, offset_file:int):
-        self.move.offset(offset_rank, offset_file)
-        new_clear_spaces = []
-        for clear_spaces in self.need_to_be_clear:
-            new_clear_spaces.append([])
-            for clear_space in clear_spaces:
-                clear_space.offset(offset_rank, offset_file)
-                new_clear_spaces[-1].append(clear_space)
-        self.need_to_be_clear = new_clear_spaces
-    
-    def get_move(self):
-        return self.move
-
-class MovementPattern:
-    def __init__(self, name: str, pattern: list[Movement]):
-        self.name = name
-        self.pattern = pattern  # list of Move objects
-    
-    def __str__(self):
-        moves_str = "\n  ".join(str(move) for move in self.pattern)
-        return f"{self.name.capitalize()} Moves:\n  {moves_str}"
-
-    def update_to_position(self, location: BoardLocation, direction: int) -> list[Movement]:
-        rank_offset = location.get_rank()
-        file_offset = location.get_file()
-        
-        new_pattern = []
-        for move in self.pattern:
-            # offset the main move location
-            original_move = move.move
-            new_move_location = BoardLocation(
-                rank_offset + direction * original_move.get_rank(),
-                file_offset + direction * original_move.get_file()
-            )
-            # offset each group of clear spaces
-            new_clear_spaces = [
-                [
-                    BoardLocation(
-                        rank_offset + direction * cs.get_rank(), # flip dir
-                        file_offset + direction * cs.get_file()
-                    )
-                    for cs in clear_group
-                ]
-                for clear_group in move.need_to_be_clear]
-            # create a new move with updated positions
-            new_move = Movement(new_move_location, new_clear_spaces, move.type)
-            new_pattern.append(new_move)
-
-        return new_pattern
-
-class ClassicPiecesMovement:
-    @staticmethod
-    def generate_linear_moves(directions: list[tuple[int, int]], max_distance: int) -> list[Movement]:
-        moves = []
-        for dx, dy in directions:
-            for dist in range(1, max_distance + 1):
-                destination = BoardLocation(dist * dx, dist * dy)
-                clear_path = [BoardLocation(i * dx, i * dy) for i in range(1, dist)]  # spaces before the end
-                if clear_path:
-                    moves.append(Movement(destination, [clear_path], "normal"))
-                    moves.append(Movement(destination, [clear_path], "capture"))
-                else:
-                    # for adjacent steps (like king), no need_to_be_clear
-                    moves.append(Movement(destination, [], "normal"))
-                    moves.append(Movement(destination, [], "capture"))
-        return moves
-
-    pawn_movement = MovementPattern("pawn", [
-        Movement(BoardLocation(1, 0), [], "normal"),
-        Movement(BoardLocation(2, 0), [[BoardLocation(1, 0)]], "normal"),
-        Movement(BoardLocation(1, 1), [], "capture"),
-        Movement(BoardLocation(1, -1), [], "capture")
-    ])
-
-    knight_movement = MovementPattern("knight", [
-        Movement(BoardLocation(2, 1), [], "jump"), Movement(BoardLocation(2, 1), [], "jump-capture"),
-        Movement(BoardLocation(2, -1), [], "jump"), Movement(BoardLocation(2, -1), [], "jump-capture"),
-        Movement(BoardLocation(-2, 1), [], "jump"), Movement(BoardLocation(-2, 1), [], "jump-capture"),
-        Movement(BoardLocation(-2, -1), [], "jump"), Movement(BoardLocation(-2, -1), [], "jump-capture"),
-        Movement(BoardLocation(1, 2), [], "jump"), Movement(BoardLocation(1, 2), [], "jump-capture"),
-        Movement(BoardLocation(1, -2), [], "jump"), Movement(BoardLocation(1, -2), [], "jump-capture"),
-        Movement(BoardLocation(-1, 2), [], "jump"), Movement(BoardLocation(-1, 2), [], "jump-capture"),
-        Movement(BoardLocation(-1, -2), [], "jump"), Movement(BoardLocation(-1, -2), [], "jump-capture")
-    ])
-
-    bishop_movement = MovementPattern(
-        "bishop", generate_linear_moves([(1, 1), (1, -1), (-1, 1), (-1, -1)], 8)
-    )
-
-    rook_movement = MovementPattern(
-        "rook", generate_linear_moves([(1, 0), (-1, 0), (0, 1), (0, -1)], 8)
-    )
-
-    queen_movement = MovementPattern(
-        "queen", generate_linear_moves([
-            (1, 0), (-1, 0), (0, 1), (0, -1),
-            (1, 1), (1, -1), (-1, 1), (-1, -1)
-        ], 8)
-    )
-
-    king_movement = MovementPattern("king", [
-        Movement(BoardLocation(1, 0), [], "normal"), Movement(BoardLocation(1, 0), [], "capture"),
-        Movement(BoardLocation(-1, 0), [], "normal"), Movement(BoardLocation(-1, 0), [], "capture"),
-        Movement(BoardLocation(0, 1), [], "normal"), Movement(BoardLocation(0, 1), [], "capture"),
-        Movement(BoardLocation(0, -1), [], "normal"), Movement(BoardLocation(0, -1), [], "capture"),
-        Movement(BoardLocation(1, 1), [], "normal"), Movement(BoardLocation(1, 1), [], "capture"),
-        Movement(BoardLocation(1, -1), [], "normal"), Movement(BoardLocation(1, -1), [], "capture"),
-        Movement(BoardLocation(-1, 1), [], "normal"), Movement(BoardLocation(-1, 1), [], "capture"),
-        Movement(BoardLocation(-1, -1), [], "normal"), Movement(BoardLocation(-1, -1), [], "capture")
-    ])
-
-class Piece:
-    def __init__(self, 
-                 name:str,
-                 pattern:MovementPattern, 
-                 square:BoardLocation, 
-                 sprite:_pygame.Surface, 
-                 worth:int,
-                 colour:str,
-                 direction:int = 1,
-                 size:int = PIECE_SIZE,
-                 special:str = None,
-                 theme:int = 1):
-        self.name = name
-        self.theme = theme
-        if sprite is None:
-            sprite = self.try_get_automatic_sprite(name, colour)
-        else:
-            sprite = _pygame.transform.scale(sprite, (size, size))
-        self.sprite = sprite
-        self.square = square
-        self.worth = worth
-        self.colour = colour
-        self.legal_moves:list[Movement] = []
-        self.pattern = pattern
-        self.movement = pattern.update_to_position(square, direction)
-        self.direction = direction # 1 for white, -1 for black
-        self.size = size
-        self.special = special # "normal", "king" can move into check and castle,"jump" means ignore pieces in the way, "pawn" means can capture en passant, promotion and 2 squares first move
-        self.selected = False
-    
-    def try_get_automatic_sprite(self, name:str, colour:str):
-        try:
-            image = _pygame.image.load(f"Assets\\Sprites\\Theme{self.theme}\\{colour[0].lower()}_{name.lower()}.png")
-            return image
-        except FileNotFoundError:
-            return self.create_placeholder_piece(BLACK if name.islower() else WHITE, name)
-
-    def create_placeholder_piece(self, color:_pygame.Color, piece_char:str):
-        surf = _pygame.Surface((50, 50), _pygame.SRCALPHA)
-        color_rgb = color
-        _pygame.draw.circle(surf, color_rgb, (25, 25), 20)
-        font = _pygame.font.SysFont("Arial", 24, bold=True)
-        text = font.render(piece_char.upper(), True, BLACK if color == WHITE else WHITE)
-        text_rect = text.get_rect(center=(25, 25))
-        surf.blit(text, text_rect)
-        return surf
-
-    def update(self, opposite_pieces_locations:list[BoardLocation], same_pieces_locations:list[BoardLocation]):
-        # Update the position of the piece for the movement pattern
-        self.movement = self.pattern.update_to_position(self.square, self.direction)
-        # Update the legal moves of a piece
-        self.legal_moves = []
-        for move in self.movement:
-            if move.move.get_rank() >= 0 and move.move.get_rank() < 8 and move.move.get_file() >= 0 and move.move.get_file() < 8: # check if the move is within the board limits
-                blocked = False
-                if move.type == "normal": # check if the move is not blocked by other pieces including its landing one
-                    for piece_location in opposite_pieces_locations + same_pieces_locations:
-                        for clear_space_group in move.need_to_be_clear:
-                            for cs in clear_space_group:
-                                if piece_location == cs:
-                                    blocked = True
-                                    break
-                            if blocked:
-                                break
-                            
-                        if piece_location == move.move:
-                            blocked = True
-                            break
-                    if not blocked:
-                        self.legal_moves.append(move)
-                elif move.type == "capture":
-                    is_clear = True
-                    # First check if all 'need_to_be_clear' squares are not occupied
-                    for clear_path in move.need_to_be_clear:
-                        for cs in clear_path:
-                            for piece_location in opposite_pieces_locations + same_pieces_locations:
-                                if piece_location == cs:
-                                    is_clear = False
-                                    break
-                            if not is_clear:
-                                break
-                        if not is_clear:
-                            break
-
-                    if is_clear:
-                        # Then check if the destination has an enemy piece
-                        for piece_location in opposite_pieces_locations:
-                            if piece_location == move.move:
-                                self.legal_moves.append(move)
-                                break
-                elif move.type == "jump": # this is if the piece can jump over other pieces
-                    for piece_location in opposite_pieces_locations + same_pieces_locations:
-                        if piece_location == move.move:
-                            break
-                    else:
-                        self.legal_moves.append(move)
-                elif move.type == "jump-capture": # this is if the piece can jump over other pieces and capture them
-                    for piece_location in opposite_pieces_locations:
-                        if piece_location == move.move:
-                            self.legal_moves.append(move)
-                            break
-
-    def move(self, new_square:BoardLocation):
-        self.square = new_square
-    
-    def draw_legal_moves(self, screen:_pygame.Surface, ranks_locations:list[int], files_locations:list[int]):
-        for move in self.legal_moves:
-            if move.type == "normal" or move.type == "jump":
-                _pygame.draw.circle(screen, MOVE_HIGHLIGHT, (ranks_locations[move.move.get_file()], files_locations[move.move.get_rank()]), MOVE_HIGHLIGHT_RADIUS)
-            elif "capture" in move.type:
-                _pygame.draw.circle(screen, CAPTURE_HIGHLIGHT, (ranks_locations[move.move.get_file()], files_locations[move.move.get_rank()]), CAPTURE_HIGHLIGHT_RADIUS, CAPTURE_HIGHLIGHT_WIDTH)
-    
-    def draw(self, screen:_pygame.Surface, ranks_locations:list[int], files_locations:list[int], turn:str):
-        self.sprite = _pygame.transform.scale(self.sprite, (self.size, self.size))
-        screen.blit(self.sprite, (ranks_locations[self.square.get_file()] - self.size / 2, files_locations[self.square.get_rank()] - self.size / 2))
-        if self.selected and turn == self.colour:
-            # _pygame.draw.circle(screen, HIGHLIGHT, (ranks_locations[self.square.get_file()], files_locations[self.square.get_rank()]), MOVE_HIGHLIGHT_RADIUS)
-            self.draw_legal_moves(screen, ranks_locations, files_locations)
-
-class Move:
-    def __init__(self,
-                 piece: Piece,
-                 from_square:BoardLocation,
-                 to_square:BoardLocation,
-                 captured_piece:Piece = None,
-                 castling:bool = False,
-                 en_passant:bool = False,
-                 promotion:Piece = None,
-                 check:bool = False, 
-                 checkmate:bool = False):
-        self.piece = piece
-        self.from_square = from_square
-        self.to_square = to_square
-        self.captured_piece = captured_piece
-        self.castling = castling
-        self.en_passant = en_passant # Possible castling to promotion?
-        self.promotion = promotion # Promotion is the piece object that was promoted to
-        self.check = check
-        self.checkmate = checkmate
-    
-    def __str__(self):
-        return self.notation()
-
-    def notation(self):
-        """
-        Gets a algebraic notation for the move.
-        https://www.chess.com/article/view/chess-notation#algebraic-notation
-        """
-        if self.castling:
-            return "O-O-O" # Edit later for other side
-        
-        if self.piece.name.lower() != "p":
-            notation = self.piece.name
-        notation += str(self.from_square)
-        if self.captured_piece:
-            notation += "x"
-        notation += str(self.to_square)
-        if self.promotion:
-            notation += "=" + self.promotion.name
-        if self.checkmate:
-            notation += "#"
-        elif self.check:
-            notation += "+"
-        return notation
-
-class ChessBoard:
+class ChessBoard(Board):
     def __init__(self, 
                  x:int, y:int, 
                  size: int, 
@@ -357,41 +38,34 @@ class ChessBoard:
                  perspective:str = "white",
                  dark: _pygame.Color = BROWN,
                  light: _pygame.Color = BEIGE,
-                 theme: int = 1): 
+                 theme: int = 1,
+                 castling_rights:int = None,
+                 ep_square:int = -1,
+                 halfmove_clock:int = 0,
+                 fullmove_number:int = 1): 
         self.x = x
         self.y = y
         self.size = size / 8
         self.theme = theme
-        self.all_pieces:list[Piece] = self.make_pieces(pieces, starting_configuration)
-        self.turn = turn
+        # A piece may come with its own sprite, the rules only need its pattern and worth
+        self.custom_sprites:dict[str, _pygame.Surface] = {}
+        rules_pieces = {}
+        for piece_name, piece_info in pieces.items():
+            piece_info = dict(piece_info)
+            sprite = piece_info.pop("sprite", None)
+            if sprite is not None:
+                self.custom_sprites[piece_name.lower()] = _pygame.transform.scale(sprite, (PIECE_SIZE, PIECE_SIZE))
+            rules_pieces[piece_name] = piece_info
+        super().__init__(starting_configuration, turn, rules_pieces, castling_rights, ep_square, halfmove_clock, fullmove_number)
+        self.sprite_page = sprite_atlas.get_page(theme, PIECE_SIZE) # (colour, piece) -> sprite, shared with every other board
         self.dark = dark
         self.light = light
         self.perspective = perspective
         self.ranks_locations, self.files_locations = self.calculate_positions()
         self.selected_square = None
-        self.moves_stack = []
-    
-    @staticmethod
-    def simulate_move(current_all_pieces:list[Piece], piece:Piece, move_to:BoardLocation):
-        return current_all_pieces
-    
-    def get_piece_at_location(self, location:BoardLocation):
-        try:
-            for piece in self.all_pieces:
-                if piece.square == location:
-                    return piece
-            else:
-                return None
-        except AttributeError:
-            return None
-    
-    def attacking(self, square:BoardLocation): # Returns a list of pieces that are attacking the square
-        attacking_pieces = []
-        for piece in self.all_pieces:
-            for legal_move in piece.legal_moves:
-                if legal_move.type == "capture" and legal_move.move == square:
-                    attacking_pieces.append(piece)
-        return attacking_pieces
+        self.background = None # squares and coordinates, rebuilt only when background_key changes
+        self.background_key = None
+        self.last_frame:dict[tuple, tuple] = {} # slot -> (rect, contents) of everything drawn on the last frame
 
     def deselect_square(self):
         self.selected_square = None
@@ -404,24 +78,10 @@ class ChessBoard:
             files.reverse()
         if self.perspective == "black":
             ranks.reverse()
-        print(ranks, files)
+        if log.enabled:
+            logger.debug("Square centres %s, %s", ranks, files)
         return ranks, files
 
-    def make_pieces(self, pieces_dict:dict[str, dict], starting_configuration:list[list[str]]):
-        for piece_name in pieces_dict.keys():
-            if not piece_name.lower() == piece_name:
-                pieces_dict[piece_name.lower()] = pieces_dict.pop(piece_name) # Change the key to lowercase
-
-        pieces = []
-        for rank in range(8):
-            for file in range(8):
-                piece_name = starting_configuration[rank][file]
-                if piece_name is not None:
-                    pieces.append(Piece(**pieces_dict[piece_name.lower()], name=piece_name, square=BoardLocation(rank, file), colour="white" if piece_name.isupper() else "black", direction=1 if piece_name.isupper() else -1, theme=self.theme))
-                    print(f"Piece {piece_name} created at {rank}, {file}")
-        
-        return pieces
-    
     def square_to_coordinates(self, square:BoardLocation):
         return (self.ranks_locations[square.get_file()], self.files_locations[square.get_rank()])
 
@@ -432,108 +92,36 @@ class ChessBoard:
         rank = next((r for r in range(8) if self.files_locations[r] - self.size / 2 <= y < self.files_locations[r] + self.size / 2), None)
         return BoardLocation(rank, file) if rank is not None and file is not None else None
 
-    def get_position(self):
-        # Gets the position (as in chess position) of the board and returns it as how starting_configuration is
-        position_list = [[None for _ in range(8)] for _ in range(8)]
-        for piece in self.all_pieces:
-            for rank in range(8):
-                for file in range(8):
-                    if piece.square == BoardLocation(rank, file):
-                        position_list[rank][file] = piece.name
-        return position_list
-
-    def get_fen(self):
-        """
-        Returns the FEN representation of the board
-        Field 1: Pieces locations
-        Field 2: Active colour
-        Field 3: Castling rights
-        Field 4: En passant target square
-        Field 5: Halfmove clock
-        Field 6: Fullmove number
-        https://www.chess.com/terms/fen-chess#what-is-fen
+    def set_theme(self, theme:int):
+        self.theme = theme
+        self.sprite_page = sprite_atlas.get_page(theme, PIECE_SIZE)
+        self.background = None
 
-        To copy for chess.com do f'[FEN {fen_string}]'
-        """
-        position_list = self.get_position()[::-1]
-        print(position_list)
-        fen_string = ""
-        # get these things
-        castling_rights = ["K", "Q", "k", "q"]
-        en_passant_target = "-"
-        halfmove_clock = 0
-        fullmove_number = 0
+    def set_perspective(self, perspective:str):
+        self.perspective = perspective
+        self.ranks_locations, self.files_locations = self.calculate_positions()
+        self.background = None
 
-        # Pieces Locations
-        for rank in position_list:
-            empty_spaces = 0
-            for square in rank:
-                if square is None:
-                    empty_spaces += 1
-                else:
-                    if empty_spaces > 0:
-                        fen_string += str(empty_spaces)
-                        empty_spaces = 0
-                    fen_string += square
-            if empty_spaces > 0:
-                fen_string += str(empty_spaces)
-            fen_string += "/"
-        # Active Colour
-        fen_string += " " + self.turn[0]
-        # Castling rights
-        fen_string += " " + ("".join(castling_rights) if len(castling_rights) > 0 else "-")
-        # En passant target square
-        fen_string += " " + (en_passant_target if en_passant_target is not None else "-")
-        # Halfmove clock
-        fen_string += " " + str(halfmove_clock)
-        # Fullmove number
-        fen_string += " " + str(fullmove_number)
-        return fen_string
-    
-    def log_move(self, piece:Piece, move:BoardLocation, takes_piece:Piece = None): # Function made by kingsley
-        self.moves_stack.append(Move(piece, piece.square, move, takes_piece))
-        print(f"Logged Move: {self.moves_stack}")
-    
-    def pop(self, amount_of_moves:int):
-        print(f"Moving back {amount_of_moves} moves")
-        for _ in range(amount_of_moves):
-            try:
-                last_move:Move = self.moves_stack[-1]
-            except IndexError:
-                break
-            self.moves_stack = self.moves_stack[:-1] # Remove last move
-            self.turn = "white" if self.turn == "black" else "black" # Switch turn back
-            piece = self.get_piece_at_location(last_move.to_square)
-            piece.move(last_move.from_square)
-            if last_move.captured_piece:
-                self.all_pieces.append(last_move.captured_piece)
-            print(f"Moved {last_move.piece.name} piece back. Moves: {self.moves_stack}")
+    def get_square_rect(self, square:BoardLocation):
+        x, y = self.square_to_coordinates(square)
+        return _pygame.Rect(int(x - self.size / 2), int(y - self.size / 2), int(self.size) + 1, int(self.size) + 1)
 
-    def move(self, piece_location:BoardLocation, move:BoardLocation):
-        piece = self.get_piece_at_location(piece_location)
-        if piece:
-            if not piece.colour == self.turn:
-                print(f"Not your turn")
-                return False
-            for legal_move in piece.legal_moves:
-                if legal_move.move == move:
-                    taken_piece = self.get_piece_at_location(move)
-                    if taken_piece:
-                        self.all_pieces.remove(taken_piece)
-                    self.log_move(piece, move, taken_piece) # Log move
-                    piece.move(move) # Move Piece
-                    self.turn = "black" if self.turn == "white" else "white" # switch turn
-                    print(f"Moved {piece.name} from {piece.square} to {move}")
-                    return True
-        print(f"Move {move} is not legal")
-        return False
+    def get_sprite(self, piece:Piece):
+        piece_name = piece.name.lower()
+        if piece_name in self.custom_sprites: # a custom sprite is shared by both colours
+            return self.custom_sprites[piece_name]
+        sprite = self.sprite_page.get((piece.colour, piece_name))
+        if sprite is None:
+            sprite = sprite_atlas.get_sprite(self.theme, piece.colour, piece_name, PIECE_SIZE)
+        return sprite
 
     def handle_click(self, mouse_pos:tuple[int, int]):
         clicked_square = self.coordinates_to_square(mouse_pos)
 
         if clicked_square is None:
             self.deselect_square()
-            print(f"deselected because of click outside")
+            if log.enabled:
+                logger.debug("Deselected because of a click outside the board")
             return
 
         piece = self.get_piece_at_location(clicked_square)
@@ -542,7 +130,8 @@ class ChessBoard:
             if self.selected_square is not None:
                 if clicked_piece.colour == self.turn:
                     self.selected_square = clicked_square
-                    print(f"selected piece: {clicked_piece}")
+                    if log.enabled:
+                        logger.debug("Selected piece %s", clicked_piece)
                 else:
                     if not self.move(self.selected_square, clicked_square):
                         self.selected_square = clicked_square
@@ -552,129 +141,154 @@ class ChessBoard:
         else:
             if not self.move(self.selected_square, clicked_square):
                 self.deselect_square()
-                print("deselected square")
+                if log.enabled:
+                    logger.debug("Deselected square")
 
     def update(self):
-        # update the pieces
-        white_pieces_locations = []
-        black_pieces_locations = []
-        for piece in self.all_pieces: # get all the pieces locations
-            if piece.colour == "white":
-                white_pieces_locations.append(piece.square)
-            else:
-                black_pieces_locations.append(piece.square)
-        for piece in self.all_pieces:
-            if piece.colour == "white":
-                piece.update(black_pieces_locations, white_pieces_locations)
-            else:
-                piece.update(white_pieces_locations, black_pieces_locations) 
-
-        # update selected square
-        for piece in self.all_pieces:
-            piece.selected = False
-        if self.selected_square is not None:
-            piece = self.get_piece_at_location(self.selected_square)
-            if piece:
-                piece.selected = True
+        # update the pieces that were affected by the last move
+        self.refresh_legal_moves()
     
-    def draw(self, screen:_pygame.Surface, show_coordinates:bool = True):
-        # draw the board
+    def build_background(self, screen_size:tuple[int, int], show_coordinates:bool):
+        # The squares and coordinates only change with the theme, perspective or size, so they are drawn once
+        background = _pygame.Surface(screen_size)
+        background.fill(BLACK)
+        coordinate_index = 0 if self.perspective == "white" else 7
         for rank in range(8):
             for file in range(8):
-                if (rank + file) % 2 == 0:
-                    color = self.light
-                else:
-                    color = self.dark
-                if self.selected_square is not None:
-
-                    if self.selected_square == BoardLocation(file, rank):
-                        color = HIGHLIGHT
-                _pygame.draw.rect(screen, color, (self.ranks_locations[rank] - self.size / 2, self.files_locations[file] - self.size / 2, self.size + 1, self.size + 1))
+                rect = self.get_square_rect(BoardLocation(rank, file))
+                _pygame.draw.rect(background, self.light if (rank + file) % 2 == 0 else self.dark, rect)
 
                 # draw the chess coordinates
                 if show_coordinates:
-                    font = _pygame.font.SysFont("Mono", 20)
-                    if self.perspective == "white":
-                        coordinate_rank, coordinate_file = 0, 0
-                    else:
-                        coordinate_rank, coordinate_file = 7, 7
-                    if rank == coordinate_rank:
-                        text = font.render(str(file + 1), True, self.dark if (rank + file) % 2 == 0 else self.light)
-                        screen.blit(text, (self.ranks_locations[rank] - self.size / 2, self.files_locations[file] - self.size / 2))
-                    if file == coordinate_file:
-                        text = font.render(chr(rank + 65), True, self.dark if (rank + file) % 2 == 0 else self.light)
-                        screen.blit(text, (self.ranks_locations[rank] + self.size / 2 - text.get_width(), self.files_locations[file] + self.size / 2 - text.get_height()))
-        
-        # draw the pieces and the legal moves of the selected piece
+                    text_colour = self.dark if (rank + file) % 2 == 0 else self.light
+                    if file == coordinate_index:
+                        text = text_cache.render(str(rank + 1), text_colour, "Mono", 20)
+                        background.blit(text, rect.topleft)
+                    if rank == coordinate_index:
+                        text = text_cache.render(chr(file + 65), text_colour, "Mono", 20)
+                        background.blit(text, (rect.left + self.size - text.get_width(), rect.top + self.size - text.get_height()))
+        return background
+
+    def get_frame(self, screen:_pygame.Surface, extra_text:list[tuple[str, tuple[int, int]]]):
+        """
+        Describes everything drawn over the background as slot -> (rect, contents).
+        A slot is redrawn only when its rect or contents differ from the last frame.
+        """
+        squares = {} # square index -> [highlighted, sprite, legal move marker]
+        if self.selected_square is not None:
+            squares[self.selected_square.get_index()] = [True, None, None]
         for piece in self.all_pieces:
-            piece.draw(screen, self.ranks_locations, self.files_locations, self.turn)
-        
-        # Print Turn
-        font = _pygame.font.SysFont("Mono", 25)
-        text = font.render(f"Turn: {self.turn}", True, RED)
-        screen.blit(text, (10, 10))
-
+            squares.setdefault(piece.square.get_index(), [False, None, None])[1] = self.get_sprite(piece)
+        selected_piece = self.get_piece_at_location(self.selected_square) if self.selected_square is not None else None
+        if selected_piece is not None and self.turn == selected_piece.colour:
+            for move in selected_piece.legal_moves:
+                marker = "capture" if "capture" in move.type and self.mailbox[move.move.get_index()] is not None else "move"
+                squares.setdefault(move.move.get_index(), [False, None, None])[2] = marker
+
+        frame = {}
+        for index, contents in squares.items():
+            frame[("square", index)] = (self.get_square_rect(SQUARES[index]), tuple(contents))
+
+        # Print Turn, or how the game ended
+        result = self.get_result()
+        if result is None:
+            texts = [("turn", f"Turn: {self.turn}", 25, (10, 10))]
+        else:
+            texts = [("turn", f"{result[0]} by {result[1]}", 25, (10, 10))]
+        texts.append(("clocks", f"Move {self.fullmove_number}, halfmove clock {self.halfmove_clock}", 15, (10, screen.get_height() - 60)))
         # Debugging information
         if show_debug_info:
             mouse_pos = _pygame.mouse.get_pos()
-            font = _pygame.font.SysFont("Mono", 15)
-            text = font.render(f"{self.coordinates_to_square(mouse_pos)}", True, RED)
-            screen.blit(text, (10, 35))
-            text = font.render(f"{mouse_pos[0]}, {mouse_pos[1]}", True, RED)
-            screen.blit(text, (10, 50))
-
+            texts.append(("mouse square", f"{self.coordinates_to_square(mouse_pos)}", 15, (10, 35)))
+            texts.append(("mouse", f"{mouse_pos[0]}, {mouse_pos[1]}", 15, (10, 50)))
+            texts.append(("recomputed", f"Recomputed: {self.pieces_recomputed} pieces", 15, (10, screen.get_height() - 20)))
             if self.selected_square is not None:
-                text = font.render(f"Selected: {self.selected_square}", True, RED)
-                screen.blit(text, (10, 65))
-                piece = self.get_piece_at_location(self.selected_square)
-                if piece:
-                    text = font.render(f"Piece: {piece.square}", True, RED)
-                    screen.blit(text, (10, 80))
-                    text = font.render(f"Legal:", True, RED)
-                    screen.blit(text, (10, 95))
-                    for i in range(len(piece.legal_moves)):
-                        text = font.render(f"{i + 1}: {piece.legal_moves[i].move}", True, RED)
-                        screen.blit(text, (10, 110 + i * 15))
+                texts.append(("selected", f"Selected: {self.selected_square}", 15, (10, 65)))
+                if selected_piece:
+                    texts.append(("piece", f"Piece: {selected_piece.square}", 15, (10, 80)))
+                    texts.append(("legal", "Legal:", 15, (10, 95)))
+                    for i in range(len(selected_piece.legal_moves)):
+                        texts.append((("legal", i), f"{i + 1}: {selected_piece.legal_moves[i].move}", 15, (10, 110 + i * 15)))
+        for i, (text, position) in enumerate(extra_text):
+            texts.append((("extra", i), text, 15, position))
+        for slot, text, size, position in texts:
+            frame[("text", slot)] = (_pygame.Rect(position, font_registry.get_font("Mono", size).size(text)), (text, size))
+        return frame
+
+    def draw_slot(self, screen:_pygame.Surface, slot:tuple, rect:_pygame.Rect, contents:tuple):
+        if slot[0] == "square":
+            highlighted, sprite, marker = contents
+            centre = rect.left + self.size / 2, rect.top + self.size / 2
+            if highlighted:
+                _pygame.draw.rect(screen, HIGHLIGHT, rect)
+            if sprite is not None:
+                screen.blit(sprite, (centre[0] - PIECE_SIZE / 2, centre[1] - PIECE_SIZE / 2))
+            if marker == "move":
+                _pygame.draw.circle(screen, MOVE_HIGHLIGHT, centre, MOVE_HIGHLIGHT_RADIUS)
+            elif marker == "capture":
+                _pygame.draw.circle(screen, CAPTURE_HIGHLIGHT, centre, CAPTURE_HIGHLIGHT_RADIUS, CAPTURE_HIGHLIGHT_WIDTH)
+        else:
+            text, size = contents
+            screen.blit(text_cache.render(text, RED, "Mono", size), rect)
 
-def initialize_classic_game(x, y, size = BOARD_SIZE, starting_configuration = BOARD_CONFIG, theme = 1):
+    def draw(self, screen:_pygame.Surface, show_coordinates:bool = True, extra_text:list[tuple[str, tuple[int, int]]] = (), redraw:bool = False):
+        """
+        Draws the board and returns the rectangles of the screen that changed, for pygame.display.update.
+        With redraw the whole screen is drawn, otherwise only what differs from the last frame.
+        extra_text is drawn over the board as (text, position) lines.
+        """
+        frame = self.get_frame(screen, extra_text)
+        background_key = (screen.get_size(), show_coordinates, self.perspective, self.theme, self.size, tuple(self.dark), tuple(self.light))
+        if self.background is None or background_key != self.background_key:
+            self.background = self.build_background(screen.get_size(), show_coordinates)
+            self.background_key = background_key
+            redraw = True
+
+        if redraw:
+            dirty_rects = [screen.get_rect()]
+        else:
+            dirty_rects = []
+            for slot in frame.keys() | self.last_frame.keys():
+                old = self.last_frame.get(slot)
+                new = frame.get(slot)
+                if old != new:
+                    if old is not None:
+                        dirty_rects.append(old[0])
+                    if new is not None:
+                        dirty_rects.append(new[0])
+        self.last_frame = frame
+
+        # Every changed rectangle is drawn again from the background up, with the layers that overlap it
+        for dirty_rect in dirty_rects:
+            screen.set_clip(dirty_rect)
+            screen.blit(self.background, dirty_rect, dirty_rect)
+            for slot, (rect, contents) in frame.items():
+                if rect.colliderect(dirty_rect):
+                    self.draw_slot(screen, slot, rect, contents)
+        screen.set_clip(None)
+        return dirty_rects
+
+    def draw_piece(self, screen:_pygame.Surface, piece:Piece):
+        x, y = self.square_to_coordinates(piece.square)
+        screen.blit(self.get_sprite(piece), (x - PIECE_SIZE / 2, y - PIECE_SIZE / 2))
+
+def initialize_classic_game(x, y, size = BOARD_SIZE, starting_configuration = BOARD_CONFIG, theme = 1, turn = "white", fen:str = None):
+    # A FEN replaces the starting configuration and turn, and brings its castling rights, en passant square and clocks
+    board_state = {}
+    if fen is not None:
+        position = parse_fen(fen)
+        starting_configuration = position.get_configuration()
+        turn = position.turn
+        board_state = {"castling_rights": position.castling_rights, "ep_square": position.ep_square,
+                       "halfmove_clock": position.halfmove_clock, "fullmove_number": position.fullmove_number}
     chessboard = ChessBoard(
         x=x,
         y=y,
         size=size,
         starting_configuration=starting_configuration,
-        turn="white",
-        pieces={
-            "p": {
-                "pattern": ClassicPiecesMovement.pawn_movement,
-                "sprite": None,
-                "worth": 1,
-            },
-            "r": {
-                "pattern": ClassicPiecesMovement.rook_movement,
-                "sprite": None,
-                "worth": 5,
-            },
-            "n": {
-                "pattern": ClassicPiecesMovement.knight_movement,
-                "sprite": None,
-                "worth": 3,
-            },
-            "b": {
-                "pattern": ClassicPiecesMovement.bishop_movement,
-                "sprite": None,
-                "worth": 3,
-            },
-            "q": {
-                "pattern": ClassicPiecesMovement.queen_movement,
-                "sprite": None,
-                "worth": 9,
-            },
-            "k": {
-                "pattern": ClassicPiecesMovement.king_movement,
-                "sprite": None,
-                "worth": 0,
-            },
-        },
-        theme=theme
+        turn=turn,
+        pieces=classic_pieces(),
+        theme=theme,
+        **board_state
     )
-    return chessboard
\ No newline at end of file
+    return chessboard
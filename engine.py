@@ -0,0 +1,237 @@
+"""
+The computer opponent, a negamax search with alpha-beta pruning and iterative deepening
+"""
+import time
+
+from rules import SQUARES, PROMOTION_PIECES, Board, BoardLocation
+from transposition import TranspositionTable, EXACT, LOWER_BOUND, UPPER_BOUND
+from evaluation import evaluate_board, evaluate_children
+
+MATE_SCORE = 100000
+MATE_THRESHOLD = MATE_SCORE - 1000 # scores past this are mates, stored relative to the node in the table
+KNOWN_WIN_SCORE = 20000 # a position the bitbases say is won, plus its evaluation so the search still makes progress
+
+# Search budget for every difficulty of the options slider (settings["game"]["difficulty"])
+# The search stops at whichever limit it reaches first, but always finishes depth 1
+DIFFICULTY_BUDGETS = [
+    {"name": "Easy", "max_depth": 2, "nodes": 2000, "time": 0.5},
+    {"name": "Medium", "max_depth": 3, "nodes": 15000, "time": 1.5},
+    {"name": "Hard", "max_depth": 64, "nodes": 100000, "time": 4.0},
+]
+
+class SearchTimeout(Exception):
+    pass
+
+def score_to_table(score:int, ply:int):
+    if score >= MATE_THRESHOLD:
+        return score + ply
+    if score <= -MATE_THRESHOLD:
+        return score - ply
+    return score
+
+def score_from_table(score:int, ply:int):
+    if score >= MATE_THRESHOLD:
+        return score - ply
+    if score <= -MATE_THRESHOLD:
+        return score + ply
+    return score
+
+class SearchResult:
+    def __init__(self, from_square:BoardLocation, to_square:BoardLocation, score:int, depth:int, nodes:int, elapsed:float, promotion:str = None):
+        self.from_square = from_square
+        self.to_square = to_square
+        self.promotion = promotion # piece type a pawn promotes to, None if the move is not a promotion
+        self.score = score # from the point of view of the side that moves
+        self.depth = depth # deepest fully searched depth
+        self.nodes = nodes
+        self.elapsed = elapsed
+
+    @property
+    def nodes_per_second(self):
+        return self.nodes / self.elapsed if self.elapsed > 0 else 0
+
+    def __str__(self):
+        return f"{self.from_square}{self.to_square}{self.promotion or ''} score {self.score} depth {self.depth} nodes {self.nodes} ({self.nodes_per_second:.0f} nodes/s)"
+
+class Engine:
+    def __init__(self, difficulty:int = 1, budget:dict = None, table_size_mb:float = 16, book = None, bitbases = None):
+        self.budget = budget if budget is not None else DIFFICULTY_BUDGETS[difficulty]
+        self.book = book # OpeningBook played from before searching, None to always search
+        self.bitbases = bitbases # Bitbases probed for three piece endgames, None to search them
+        self.root_pieces = 32 # pieces on the board the search started from
+        self.table = TranspositionTable(table_size_mb) # kept between searches of the same game
+        self.nodes = 0
+        self.deadline = 0.0
+        self.stoppable = False # the search can only be stopped by the budget once depth 1 is done
+        self.should_stop = None
+
+    def evaluate(self, board:Board):
+        # Material and piece-square tables from the point of view of the side to move
+        return evaluate_board(board)
+
+    def generate_moves(self, board:Board, order_quiet_moves:bool = False):
+        """
+        Returns the legal moves of the side to move, encoded as for Board.make_move, in the order of
+        Board.iterate_moves. With order_quiet_moves the quiet moves are ordered as in the search.
+        """
+        return list(board.iterate_moves(order_quiet_moves=self.get_quiet_move_order(board) if order_quiet_moves else None))
+
+    def get_quiet_move_order(self, board:Board):
+        """
+        Orders quiet moves best first by the static evaluation of the position after them, all scored in one batch,
+        which is worth it where there is a subtree to save.
+        """
+        def order(quiet_moves:list):
+            scores = evaluate_children(board, quiet_moves)
+            return [move for score, move in sorted(zip(scores, quiet_moves), reverse=True)]
+        return order
+
+    def order_hash_move(self, moves:list, hash_move:int):
+        # Searches the best move stored in the transposition table first
+        if hash_move in moves:
+            moves.remove(hash_move)
+            moves.insert(0, hash_move)
+
+    def make_result(self, move:int, score:int, depth:int, start:float):
+        return SearchResult(SQUARES[move & 63], SQUARES[move >> 6 & 63], score, depth, self.nodes, time.perf_counter() - start, PROMOTION_PIECES[move >> 12 & 7])
+
+    def check_budget(self):
+        self.nodes += 1
+        if self.nodes & 255 == 0 and self.should_stop is not None and self.should_stop():
+            raise SearchTimeout()
+        if not self.stoppable:
+            return
+        if self.nodes >= self.budget["nodes"] or (self.nodes & 255 == 0 and time.perf_counter() > self.deadline):
+            raise SearchTimeout()
+
+    def negamax(self, board:Board, depth:int, alpha:int, beta:int, ply:int):
+        self.check_budget()
+        # A position seen before would just be played again, so one repetition is already a draw, as is the fifty move rule
+        if board.halfmove_clock >= 4 and (board.is_repetition(2) or board.is_fifty_moves()):
+            return 0
+        # Only probed once pieces come off, a search that starts in a bitbase endgame has to find the way to mate itself
+        if self.bitbases is not None and len(board.all_pieces) == 3 < self.root_pieces:
+            result = self.bitbases.probe(board)
+            if result is not None:
+                return result * KNOWN_WIN_SCORE + self.evaluate(board) if result else 0
+        original_alpha = alpha
+        hash_move = 0
+        entry = self.table.probe(board.hash)
+        if entry is not None:
+            table_score, table_depth, bound, hash_move = entry
+            if table_depth >= depth:
+                table_score = score_from_table(table_score, ply)
+                if bound == EXACT:
+                    return table_score
+                if bound == LOWER_BOUND and table_score >= beta:
+                    return table_score
+                if bound == UPPER_BOUND and table_score <= alpha:
+                    return table_score
+
+        if depth == 0:
+            if not board.has_legal_moves(): # checkmate or stalemate
+                return -(MATE_SCORE - ply) if board.is_check() else 0
+            return self.evaluate(board)
+
+        # Moves are generated a stage at a time, a cutoff on the hash move or a capture never generates the quiet moves
+        best_score = -MATE_SCORE - 1
+        best_move = 0
+        for move in board.iterate_moves(hash_move, self.get_quiet_move_order(board) if depth >= 2 else None):
+            board.make_move(move)
+            try:
+                score = -self.negamax(board, depth - 1, -beta, -alpha, ply + 1)
+            finally:
+                board.unmake_move()
+            if score > best_score:
+                best_score = score
+                best_move = move
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        break
+        if best_move == 0: # checkmate or stalemate
+            return -(MATE_SCORE - ply) if board.is_check() else 0
+
+        if best_score <= original_alpha:
+            bound = UPPER_BOUND
+        elif best_score >= beta:
+            bound = LOWER_BOUND
+        else:
+            bound = EXACT
+        self.table.store(board.hash, depth, score_to_table(best_score, ply), bound, best_move)
+        return best_score
+
+    def search_root(self, board:Board, moves:list, depth:int):
+        alpha = -MATE_SCORE - 1
+        best_move = None
+        for move in moves:
+            board.make_move(move)
+            try:
+                score = -self.negamax(board, depth - 1, -MATE_SCORE - 1, -alpha, 1)
+            finally:
+                board.unmake_move()
+            if score > alpha or best_move is None:
+                alpha = score
+                best_move = move
+        return best_move, alpha
+
+    def filter_bitbase_moves(self, board:Board, moves:list):
+        # The moves that keep the best result the bitbases give, all of them if a table is missing
+        results = []
+        for move in moves:
+            board.make_move(move)
+            try:
+                result = self.bitbases.probe(board) if len(board.all_pieces) == 3 else 0 # taking the piece draws
+            finally:
+                board.unmake_move()
+            if result is None:
+                return moves
+            results.append(-result)
+        best = max(results)
+        return [move for move, result in zip(moves, results) if result == best]
+
+    def search(self, board:Board, should_stop=None, on_iteration=None):
+        """
+        Searches the position for the side to move with iterative deepening until the budget is spent.
+        Returns the best move of the deepest completed iteration, or None if there are no legal moves.
+        A position in the book is not searched, its book move comes back with depth 0.
+        should_stop is polled during the search to cancel it early, and on_iteration is called
+        with a SearchResult every time a depth is finished.
+        """
+        start = time.perf_counter()
+        self.nodes = 0
+        self.deadline = start + self.budget["time"]
+        self.stoppable = False
+        self.should_stop = should_stop
+        moves = self.generate_moves(board)
+        if not moves:
+            return None
+        if self.book is not None:
+            book_move = self.book.choose_move(board)
+            if book_move is not None:
+                return self.make_result(book_move, 0, 0, start)
+        self.root_pieces = len(board.all_pieces)
+        if self.bitbases is not None and self.root_pieces == 3:
+            moves = self.filter_bitbase_moves(board, moves)
+        entry = self.table.probe(board.hash)
+        if entry is not None:
+            self.order_hash_move(moves, entry[3])
+
+        best_move, best_score, completed_depth = moves[0], 0, 0
+        for depth in range(1, self.budget["max_depth"] + 1):
+            try:
+                move, score = self.search_root(board, moves, depth)
+            except SearchTimeout:
+                break
+            best_move, best_score, completed_depth = move, score, depth
+            self.stoppable = True
+            self.table.store(board.hash, depth, score_to_table(score, 0), EXACT, move)
+            if on_iteration is not None:
+                on_iteration(self.make_result(move, score, depth, start))
+            # Search the best move first on the next iteration
+            moves.remove(move)
+            moves.insert(0, move)
+            if abs(score) >= MATE_THRESHOLD: # a forced mate was found, searching deeper will not change it
+                break
+
+        return self.make_result(best_move, best_score, completed_depth, start)
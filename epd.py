@@ -0,0 +1,116 @@
+"""
+EPD: positions with operations (best move, id and so on), one per line. Reads single lines and streams whole
+files of millions of positions with constant memory, without pygame.
+
+    python epd.py positions.epd
+    python epd.py positions.epd --boards --skip-invalid
+"""
+import argparse
+import re
+import sys
+import time
+
+from rules import FenError, Position, parse_clock, parse_position_fields
+
+# An opcode, its operands (quoted ones may hold spaces and semicolons) and the semicolon that ends it
+OPERATION_PATTERN = re.compile(r'\s*([A-Za-z]\w*)((?:\s+(?:"[^"]*"|[^\s;"]+))*)\s*;')
+OPERATIONS_PATTERN = re.compile(r'(?:\s*[A-Za-z]\w*(?:\s+(?:"[^"]*"|[^\s;"]+))*\s*;)*\s*') # a whole run of them, to reject anything else
+OPERAND_PATTERN = re.compile(r'"([^"]*)"|([^\s;"]+)')
+
+def parse_operations(text:str) -> dict[str, list[str]]:
+    # 'bm Nf3 Nc3; id "test 1";' -> {"bm": ["Nf3", "Nc3"], "id": ["test 1"]}
+    if OPERATIONS_PATTERN.fullmatch(text) is None:
+        raise FenError(f"bad operations {text!r}")
+    return {opcode: operands.split() if '"' not in operands else [quoted or bare for quoted, bare in OPERAND_PATTERN.findall(operands)] for opcode, operands in OPERATION_PATTERN.findall(text)}
+
+def parse_epd(line:str) -> Position:
+    """
+    Reads one EPD line: the four position fields of a FEN, then operations. The clocks come from the hmvc and fmvn
+    operations. A full six field FEN is also accepted, since files of positions often mix the two.
+    """
+    fields = line.split(None, 4)
+    if len(fields) < 4:
+        raise FenError(f"{len(fields)} fields instead of at least 4 in {line!r}")
+    squares, turn, castling_rights, ep_square = parse_position_fields(fields[0], fields[1], fields[2], fields[3])
+    halfmove_clock = 0
+    fullmove_number = 1
+    operations = {}
+    if len(fields) == 5:
+        if fields[4][0].isdigit(): # the clocks of a FEN, an opcode starts with a letter
+            clocks = fields[4].split()
+            if len(clocks) != 2:
+                raise FenError(f"bad clocks {fields[4]!r}")
+            halfmove_clock = parse_clock(clocks[0], "halfmove clock", 0)
+            fullmove_number = parse_clock(clocks[1], "fullmove number", 1)
+        else:
+            operations = parse_operations(fields[4])
+            if "hmvc" in operations:
+                halfmove_clock = parse_clock(" ".join(operations["hmvc"]), "halfmove clock", 0)
+            if "fmvn" in operations:
+                fullmove_number = parse_clock(" ".join(operations["fmvn"]), "fullmove number", 1)
+    return Position(squares, turn, castling_rights, ep_square, halfmove_clock, fullmove_number, operations)
+
+def position_to_epd(position:Position):
+    fen_fields = position.get_fen().split()
+    operations = dict(position.operations or {})
+    operations.setdefault("hmvc", [str(position.halfmove_clock)])
+    operations.setdefault("fmvn", [str(position.fullmove_number)])
+    text = []
+    for opcode, operands in operations.items():
+        # Operands with spaces or semicolons have to be quoted to be read back
+        text.append(" ".join([opcode] + [f'"{operand}"' if " " in operand or ";" in operand else operand for operand in operands]) + ";")
+    return " ".join(fen_fields[:4] + text)
+
+class EpdLoader:
+    """
+    Streams the positions of an EPD (or FEN) file, one line at a time so any size of file uses the same memory.
+    Yields a Position for every line, or a Board with boards set, which is a lot slower to build.
+    Blank lines and lines starting with # are skipped. An invalid line raises FenError with its line number,
+    or is counted in invalid and skipped with skip_invalid set.
+    """
+    def __init__(self, path:str, boards:bool = False, skip_invalid:bool = False):
+        self.path = path
+        self.boards = boards
+        self.skip_invalid = skip_invalid
+        self.positions = 0 # positions yielded so far
+        self.invalid = 0 # lines skipped for being invalid
+
+    def __iter__(self):
+        with open(self.path, encoding="utf-8") as file:
+            for line_number, line in enumerate(file, 1):
+                line = line.strip()
+                if not line or line[0] == "#":
+                    continue
+                try:
+                    position = parse_epd(line)
+                    if self.boards:
+                        position = position.to_board()
+                except FenError as error:
+                    if not self.skip_invalid:
+                        raise FenError(f"{self.path} line {line_number}: {error}") from None
+                    self.invalid += 1
+                    continue
+                self.positions += 1
+                yield position
+
+def main(arguments:list[str] = None):
+    parser = argparse.ArgumentParser(description="Read and check every position of an EPD or FEN file.")
+    parser.add_argument("path", help="file with one position per line")
+    parser.add_argument("--boards", action="store_true", help="also build a board of every position")
+    parser.add_argument("--skip-invalid", action="store_true", help="count invalid lines instead of stopping at the first one")
+    options = parser.parse_args(arguments)
+
+    loader = EpdLoader(options.path, options.boards, options.skip_invalid)
+    start = time.perf_counter()
+    try:
+        for _ in loader:
+            pass
+    except FenError as error:
+        print(error)
+        return 1
+    seconds = time.perf_counter() - start
+    print(f"{loader.positions} positions, {loader.invalid} invalid, in {seconds:.3f} s ({loader.positions / seconds if seconds > 0 else 0:.0f} positions/s)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
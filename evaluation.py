@@ -0,0 +1,243 @@
+"""
+Static evaluation: material plus piece-square tables, for one board or for a whole batch of positions at once.
+Positions are packed as 64 piece codes each (0 for an empty square, see PIECE_CODES), so a batch is an N x 64 array.
+The batch functions use NumPy when it is installed and fall back to plain Python when it is not.
+
+    python evaluation.py positions.epd
+"""
+import argparse
+import itertools
+import sys
+import time
+
+try:
+    import numpy as _numpy
+except ImportError:
+    _numpy = None
+
+from rules import CASTLING_MOVES, Board, Position, classic_pieces
+
+PAWN_VALUE = 100 # Piece.worth is in pawns, scores are in hundredths of a pawn
+PIECE_CODES = {name: code for code, name in enumerate(" PNBRQKpnbrqk") if name != " "}
+PROMOTION_CODES = {"white": (0, 2, 3, 4, 5), "black": (0, 8, 9, 10, 11)} # by the promotion bits of a move, see PROMOTION_PIECES
+
+# Piece-square tables for white, from rank 8 down to rank 1 so they read like a board, in hundredths of a pawn
+# https://www.chessprogramming.org/Simplified_Evaluation_Function
+PIECE_SQUARE_TABLES = {
+    "p": [
+          0,   0,   0,   0,   0,   0,   0,   0,
+         50,  50,  50,  50,  50,  50,  50,  50,
+         10,  10,  20,  30,  30,  20,  10,  10,
+          5,   5,  10,  25,  25,  10,   5,   5,
+          0,   0,   0,  20,  20,   0,   0,   0,
+          5,  -5, -10,   0,   0, -10,  -5,   5,
+          5,  10,  10, -20, -20,  10,  10,   5,
+          0,   0,   0,   0,   0,   0,   0,   0,
+    ],
+    "n": [
+        -50, -40, -30, -30, -30, -30, -40, -50,
+        -40, -20,   0,   0,   0,   0, -20, -40,
+        -30,   0,  10,  15,  15,  10,   0, -30,
+        -30,   5,  15,  20,  20,  15,   5, -30,
+        -30,   0,  15,  20,  20,  15,   0, -30,
+        -30,   5,  10,  15,  15,  10,   5, -30,
+        -40, -20,   0,   5,   5,   0, -20, -40,
+        -50, -40, -30, -30, -30, -30, -40, -50,
+    ],
+    "b": [
+        -20, -10, -10, -10, -10, -10, -10, -20,
+        -10,   0,   0,   0,   0,   0,   0, -10,
+        -10,   0,   5,  10,  10,   5,   0, -10,
+        -10,   5,   5,  10,  10,   5,   5, -10,
+        -10,   0,  10,  10,  10,  10,   0, -10,
+        -10,  10,  10,  10,  10,  10,  10, -10,
+        -10,   5,   0,   0,   0,   0,   5, -10,
+        -20, -10, -10, -10, -10, -10, -10, -20,
+    ],
+    "r": [
+          0,   0,   0,   0,   0,   0,   0,   0,
+          5,  10,  10,  10,  10,  10,  10,   5,
+         -5,   0,   0,   0,   0,   0,   0,  -5,
+         -5,   0,   0,   0,   0,   0,   0,  -5,
+         -5,   0,   0,   0,   0,   0,   0,  -5,
+         -5,   0,   0,   0,   0,   0,   0,  -5,
+         -5,   0,   0,   0,   0,   0,   0,  -5,
+          0,   0,   0,   5,   5,   0,   0,   0,
+    ],
+    "q": [
+        -20, -10, -10,  -5,  -5, -10, -10, -20,
+        -10,   0,   0,   0,   0,   0,   0, -10,
+        -10,   0,   5,   5,   5,   5,   0, -10,
+         -5,   0,   5,   5,   5,   5,   0,  -5,
+          0,   0,   5,   5,   5,   5,   0,  -5,
+        -10,   5,   5,   5,   5,   5,   0, -10,
+        -10,   0,   5,   0,   0,   0,   0, -10,
+        -20, -10, -10,  -5,  -5, -10, -10, -20,
+    ],
+    "k": [
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -20, -30, -30, -40, -40, -30, -30, -20,
+        -10, -20, -20, -20, -20, -20, -20, -10,
+         20,  20,   0,   0,   0,   0,  20,  20,
+         20,  30,  10,   0,   0,  10,  30,  20,
+    ],
+}
+
+def make_score_table():
+    """
+    Score of every piece code on every square, material plus its piece-square table, from white's point of view.
+    Black's tables are white's turned upside down, and its scores are negative.
+    """
+    worths = {name: info["worth"] for name, info in classic_pieces().items()}
+    table = [[0] * 64 for _ in range(len(PIECE_CODES) + 1)]
+    for name, code in PIECE_CODES.items():
+        piece_type = name.lower()
+        for index in range(64):
+            rank, file = divmod(index, 8)
+            if name.isupper():
+                table[code][index] = worths[piece_type] * PAWN_VALUE + PIECE_SQUARE_TABLES[piece_type][(7 - rank) * 8 + file]
+            else:
+                table[code][index] = -(worths[piece_type] * PAWN_VALUE + PIECE_SQUARE_TABLES[piece_type][rank * 8 + file])
+    return table
+
+SCORE_TABLE = make_score_table() # piece code -> square index -> score
+if _numpy is not None:
+    SCORE_ARRAY = _numpy.array(SCORE_TABLE, dtype=_numpy.int32)
+    SQUARE_RANGE = _numpy.arange(64)
+
+def pack_board(board:Board) -> list[int]:
+    return [PIECE_CODES[piece.name] if piece is not None else 0 for piece in board.mailbox]
+
+def pack_position(position:Position) -> list[int]:
+    return [PIECE_CODES[name] if name is not None else 0 for name in position.squares]
+
+def pack_batch(rows:list[list[int]]):
+    # A list of packed positions as one N x 64 array, kept as the list itself without NumPy
+    if _numpy is None:
+        return rows
+    return _numpy.array(rows, dtype=_numpy.uint8).reshape(len(rows), 64)
+
+def evaluate_codes(codes:list[int], white_to_move:bool = True) -> int:
+    # One packed position, from the point of view of the side to move
+    score = 0
+    for index, code in enumerate(codes):
+        if code:
+            score += SCORE_TABLE[code][index]
+    return score if white_to_move else -score
+
+def evaluate_board(board:Board) -> int:
+    # The same score as evaluate_codes, read straight from the pieces of the board
+    score = 0
+    for piece in board.all_pieces:
+        score += SCORE_TABLE[PIECE_CODES[piece.name]][piece.square.get_index()]
+    return score if board.turn == "white" else -score
+
+def evaluate_batch(codes, white_to_move = True):
+    """
+    Scores every position of a packed batch (N x 64 piece codes) from the point of view of its side to move.
+    white_to_move is one bool for the whole batch or one per position. With NumPy this is a table lookup, a sum
+    and a sign flip over the whole array, and returns an array of N scores. Without it, a list.
+    """
+    if _numpy is None:
+        if isinstance(white_to_move, bool):
+            return [evaluate_codes(row, white_to_move) for row in codes]
+        return [evaluate_codes(row, white) for row, white in zip(codes, white_to_move)]
+    scores = SCORE_ARRAY[codes, SQUARE_RANGE].sum(axis=1, dtype=_numpy.int32)
+    return _numpy.where(white_to_move, scores, -scores)
+
+def evaluate_children(board:Board, moves:list[int]):
+    """
+    Scores the position after each of the legal moves, from the point of view of the side making them, without
+    playing them on the board, as a list in the order of the moves. With NumPy every child is built in one
+    N x 64 batch and scored with evaluate_batch.
+    """
+    codes = pack_board(board)
+    white_to_move = board.turn == "white"
+    promotion_codes = PROMOTION_CODES[board.turn]
+    if _numpy is None:
+        scores = []
+        for move in moves:
+            child = list(codes)
+            apply_move(child, move, board.ep_square, promotion_codes)
+            scores.append(evaluate_codes(child, white_to_move))
+        return scores
+
+    moves_array = _numpy.array(moves, dtype=_numpy.int64)
+    from_squares = moves_array & 63
+    to_squares = moves_array >> 6 & 63
+    promotions = moves_array >> 12 & 7
+    base = _numpy.array(codes, dtype=_numpy.uint8)
+    batch = _numpy.repeat(base[None, :], len(moves), axis=0)
+    rows = _numpy.arange(len(moves))
+    movers = base[from_squares]
+    batch[rows, from_squares] = 0
+    batch[rows, to_squares] = _numpy.where(promotions > 0, _numpy.array(promotion_codes, dtype=_numpy.uint8)[promotions], movers)
+    # En passant and castling move a second piece, they are rare enough to do one at a time
+    pawn_code = PIECE_CODES["P" if white_to_move else "p"]
+    king_code = PIECE_CODES["K" if white_to_move else "k"]
+    special = ((movers == pawn_code) & (to_squares == board.ep_square)) | ((movers == king_code) & (_numpy.abs((from_squares & 7) - (to_squares & 7)) == 2))
+    for row in _numpy.nonzero(special)[0]:
+        apply_second_piece(batch[row], int(from_squares[row]), int(to_squares[row]), int(movers[row]) == pawn_code)
+    return evaluate_batch(batch, white_to_move).tolist()
+
+def apply_second_piece(codes, from_index:int, to_index:int, is_pawn:bool):
+    if is_pawn: # en passant, the taken pawn is beside the square the pawn lands on
+        codes[(from_index & ~7) | (to_index & 7)] = 0
+    else: # castling, the rook jumps over the king
+        right, king_from, rook_from, rook_to, empty_mask, safe_mask, movement = CASTLING_MOVES[to_index]
+        codes[rook_to] = codes[rook_from]
+        codes[rook_from] = 0
+
+def apply_move(codes:list[int], move:int, ep_square:int, promotion_codes:tuple):
+    # Plays a legal move on a packed position in place
+    from_index = move & 63
+    to_index = move >> 6 & 63
+    promotion = move >> 12 & 7
+    mover = codes[from_index]
+    codes[from_index] = 0
+    codes[to_index] = promotion_codes[promotion] if promotion else mover
+    piece_type = mover % 6 # 1 for pawns, 0 for kings
+    if piece_type == 1 and to_index == ep_square:
+        apply_second_piece(codes, from_index, to_index, True)
+    elif piece_type == 0 and abs((from_index & 7) - (to_index & 7)) == 2:
+        apply_second_piece(codes, from_index, to_index, False)
+
+def evaluate_positions(positions, batch_size:int = 4096):
+    """
+    Scores a stream of Positions (like an EpdLoader) from the point of view of their side to move, in batches
+    of batch_size so the stream can be any length. Yields (position, score) in the order of the stream.
+    """
+    positions = iter(positions)
+    while True:
+        batch = list(itertools.islice(positions, batch_size))
+        if not batch:
+            return
+        scores = evaluate_batch(pack_batch([pack_position(position) for position in batch]), [position.turn == "white" for position in batch])
+        yield from zip(batch, scores)
+
+def main(arguments:list[str] = None):
+    from epd import EpdLoader
+
+    parser = argparse.ArgumentParser(description="Evaluate every position of an EPD or FEN file.")
+    parser.add_argument("path", help="file with one position per line")
+    parser.add_argument("--batch-size", type=int, default=4096, help="positions scored at once")
+    parser.add_argument("--show", action="store_true", help="print every position with its score")
+    options = parser.parse_args(arguments)
+
+    start = time.perf_counter()
+    count = 0
+    total = 0
+    for position, score in evaluate_positions(EpdLoader(options.path, skip_invalid=True), options.batch_size):
+        count += 1
+        total += int(score)
+        if options.show:
+            print(f"{score:6d} {position.get_fen()}")
+    seconds = time.perf_counter() - start
+    print(f"{count} positions, average {total / count if count else 0:.1f}, in {seconds:.3f} s ({count / seconds if seconds > 0 else 0:.0f} positions/s, NumPy {'on' if _numpy is not None else 'off'})")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,277 @@
+"""
+Game records: a compact binary archive of played games, for far more games than PGN can hold comfortably.
+Every move is stored as the 16 bit move of Board.make_move (from | to << 6 | promotion << 12), so a game costs
+a few bytes of header, its tags, and two bytes a ply. A second file of 8 byte offsets (path + ".idx") gives the
+start of every game, so any game is read with one seek and nothing before it is scanned.
+
+Both files are only ever appended to. Game records are self-delimiting, so a lost or stale index can be rebuilt
+from the games with rebuild_index.
+
+    python gamerecord.py convert games.pgn --output games.chz
+    python gamerecord.py show games.chz 12
+    python gamerecord.py index games.chz
+"""
+import argparse
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+
+from pgn import RESULTS, START_FEN, PgnGame, PgnReader, PgnWriter
+from rules import Board, FenError, PROMOTION_PIECES, SQUARES, classic_board_from_fen, move_to_string
+
+MAGIC = b"CHZR"
+VERSION = 1
+FILE_HEADER = struct.Struct("<4sH") # magic, version
+GAME_HEADER = struct.Struct("<BHH") # result (index into RESULTS), length of the tags in bytes, number of moves
+OFFSET = struct.Struct("<Q")
+MAX_FIELD = 0xFFFF # tags and moves are counted in 16 bits
+
+class GameRecordError(ValueError):
+    pass
+
+def get_index_path(path:str):
+    return path + ".idx"
+
+def encode_tags(headers:dict[str, str]):
+    # Names and values one after the other, each ended by a zero byte
+    fields = []
+    for name, value in headers.items():
+        if "\0" in name or "\0" in value:
+            raise GameRecordError(f"tag {name!r} has a zero byte in it")
+        fields.append(f"{name}\0{value}\0")
+    data = "".join(fields).encode("utf-8")
+    if len(data) > MAX_FIELD:
+        raise GameRecordError(f"tags of {len(data)} bytes, at most {MAX_FIELD} fit")
+    return data
+
+def decode_tags(data:bytes):
+    fields = data.decode("utf-8").split("\0")[:-1]
+    return dict(zip(fields[0::2], fields[1::2]))
+
+def encode_moves_stack(moves_stack:list) -> array:
+    # The Moves logged by a board, like ChessBoard.moves_stack, as 16 bit moves
+    moves = array("H")
+    for move in moves_stack:
+        promotion = PROMOTION_PIECES.index(move.promotion.name.lower()) if move.promotion is not None else 0
+        moves.append(move.from_square.get_index() | move.to_square.get_index() << 6 | promotion << 12)
+    return moves
+
+class RecordedGame:
+    def __init__(self, headers:dict[str, str] = None, moves:array = None, result:str = "*"):
+        self.headers = headers if headers is not None else {}
+        self.moves = moves if moves is not None else array("H") # encoded for Board.make_move
+        self.result = result
+
+    def get_starting_fen(self):
+        return self.headers.get("FEN", START_FEN)
+
+    def replay(self, board:Board = None, log:bool = False) -> Board:
+        """
+        Plays the moves on the board, or on a new board from the starting position, checking that every one is
+        legal. With log set the moves are logged into moves_stack like moves made on the screen, which is a lot
+        slower. Returns the board, raises GameRecordError or FenError if the game is not legal.
+        """
+        if board is None:
+            board = classic_board_from_fen(self.get_starting_fen())
+        for ply, move in enumerate(self.moves):
+            if not board.is_legal_move(move):
+                raise GameRecordError(f"move {ply + 1} {move_to_string(move)} is not legal")
+            if log:
+                board.play_move(board.mailbox[move & 63], SQUARES[move >> 6 & 63], PROMOTION_PIECES[move >> 12 & 7] or "q")
+            else:
+                board.make_move(move)
+        return board
+
+    def to_pgn(self) -> PgnGame:
+        # The game with the SAN of every move and its check suffix, as Move.notation writes them, worked out by replaying it
+        board = classic_board_from_fen(self.get_starting_fen())
+        game = PgnGame(dict(self.headers), result=self.result)
+        for ply, move in enumerate(self.moves):
+            if not board.is_legal_move(move):
+                raise GameRecordError(f"move {ply + 1} {move_to_string(move)} is not legal")
+            san = board.get_san(move)
+            board.make_move(move)
+            if board.is_check():
+                san += "+" if board.has_legal_moves() else "#"
+            game.moves.append(san)
+        game.encoded_moves = list(self.moves)
+        return game
+
+class GameRecordWriter:
+    """
+    Appends games to an archive, creating it if it does not exist. Every game is written to the games file before
+    its offset goes into the index, so a crash can at worst leave a game the index does not know about yet.
+    """
+    def __init__(self, path:str):
+        self.path = path
+        self.file = open(path, "ab")
+        if self.file.tell() == 0:
+            self.file.write(FILE_HEADER.pack(MAGIC, VERSION))
+        self.index = open(get_index_path(path), "ab")
+        self.games = self.index.tell() // OFFSET.size # games in the archive
+
+    def close(self):
+        self.file.close()
+        self.index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+    def write_game(self, moves, headers:dict[str, str] = None, result:str = "*"):
+        # Appends a game of encoded moves, returns its number in the archive
+        if len(moves) > MAX_FIELD:
+            raise GameRecordError(f"game of {len(moves)} plies, at most {MAX_FIELD} fit")
+        tags = encode_tags(headers or {})
+        moves = array("H", moves)
+        if sys.byteorder == "big":
+            moves.byteswap() # stored little endian like the headers
+        offset = self.file.tell()
+        self.file.write(GAME_HEADER.pack(RESULTS.index(result), len(tags), len(moves)) + tags + moves.tobytes())
+        self.file.flush()
+        self.index.write(OFFSET.pack(offset))
+        self.index.flush()
+        self.games += 1
+        return self.games - 1
+
+    def write_board(self, board:Board, headers:dict[str, str] = None):
+        # The moves logged on the board (its moves_stack), with the result if the game is over
+        headers = dict(headers or {})
+        if board.starting_fen != START_FEN:
+            headers["FEN"] = board.starting_fen
+        result = board.get_result()
+        return self.write_game(encode_moves_stack(board.moves_stack), headers, result[0] if result is not None else "*")
+
+def check_header(path:str):
+    with open(path, "rb") as file:
+        header = file.read(FILE_HEADER.size)
+    if len(header) < FILE_HEADER.size or FILE_HEADER.unpack(header)[0] != MAGIC:
+        raise GameRecordError(f"{path} is not a game record file")
+    version = FILE_HEADER.unpack(header)[1]
+    if version != VERSION:
+        raise GameRecordError(f"{path} is version {version}, only version {VERSION} can be read")
+
+class GameRecordReader:
+    """
+    Reads games from an archive by number. Both files are memory-mapped, so opening an archive of any size costs
+    nothing and reading a game touches only its own bytes.
+    """
+    def __init__(self, path:str):
+        self.path = path
+        check_header(path)
+        self.file = open(path, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.index_file = open(get_index_path(path), "rb")
+        # An empty file cannot be mapped, and has no games anyway
+        self.index = mmap.mmap(self.index_file.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(self.index_file.fileno()).st_size > 0 else b""
+        self.games = len(self.index) // OFFSET.size
+
+    def close(self):
+        self.data.close()
+        if isinstance(self.index, mmap.mmap):
+            self.index.close()
+        self.file.close()
+        self.index_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+    def __len__(self):
+        return self.games
+
+    def __iter__(self):
+        for number in range(self.games):
+            yield self.read_game(number)
+
+    def read_game(self, number:int) -> RecordedGame:
+        if not 0 <= number < self.games:
+            raise IndexError(f"game {number} of {self.games}")
+        offset = OFFSET.unpack_from(self.index, number * OFFSET.size)[0]
+        game, end = read_game_at(self.data, offset)
+        return game
+
+def read_game_at(data, offset:int):
+    # The game whose record starts at offset, and the offset just after it
+    if offset + GAME_HEADER.size > len(data):
+        raise GameRecordError(f"game at byte {offset} runs past the end of the file")
+    result, tags_length, move_count = GAME_HEADER.unpack_from(data, offset)
+    start = offset + GAME_HEADER.size
+    end = start + tags_length + move_count * 2
+    if end > len(data) or result >= len(RESULTS):
+        raise GameRecordError(f"game at byte {offset} is damaged")
+    moves = array("H")
+    moves.frombytes(data[start + tags_length:end])
+    if sys.byteorder == "big":
+        moves.byteswap()
+    return RecordedGame(decode_tags(data[start:start + tags_length]), moves, RESULTS[result]), end
+
+def rebuild_index(path:str):
+    # Writes the index again by walking the games one after the other, returns the number of games
+    check_header(path)
+    offsets = []
+    with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        offset = FILE_HEADER.size
+        while offset < len(data):
+            offsets.append(offset)
+            game, offset = read_game_at(data, offset)
+    with open(get_index_path(path), "wb") as file:
+        file.write(b"".join(OFFSET.pack(offset) for offset in offsets))
+    return len(offsets)
+
+def save_record(board:Board, path:str, headers:dict[str, str] = None):
+    # Adds the game played on the board to the end of an archive, returns its number
+    with GameRecordWriter(path) as writer:
+        return writer.write_board(board, headers)
+
+def convert_pgn(pgn_path:str, output_path:str):
+    # Appends every legal game of a PGN file to an archive, returns (games written, games skipped)
+    reader = PgnReader(pgn_path, replay=True)
+    with GameRecordWriter(output_path) as writer:
+        for game in reader:
+            headers = dict(game.headers)
+            headers.pop("Result", None) # kept in the game header instead
+            writer.write_game(game.encoded_moves, headers, game.result)
+    return reader.games, reader.invalid
+
+def main(arguments:list[str] = None):
+    parser = argparse.ArgumentParser(description="Convert, read and repair binary game records.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    convert = commands.add_parser("convert", help="append the games of a PGN file to an archive")
+    convert.add_argument("pgn")
+    convert.add_argument("--output", default="games.chz")
+    show = commands.add_parser("show", help="print one game of an archive as PGN")
+    show.add_argument("path")
+    show.add_argument("number", type=int, help="number of the game, from 0")
+    index = commands.add_parser("index", help="rebuild the index of an archive from its games")
+    index.add_argument("path")
+    options = parser.parse_args(arguments)
+
+    try:
+        if options.command == "convert":
+            start = time.perf_counter()
+            games, invalid = convert_pgn(options.pgn, options.output)
+            seconds = time.perf_counter() - start
+            pgn_size = os.path.getsize(options.pgn)
+            record_size = os.path.getsize(options.output) + os.path.getsize(get_index_path(options.output))
+            print(f"{games} games written, {invalid} invalid skipped, in {seconds:.3f} s")
+            print(f"{pgn_size} bytes of PGN, {record_size} bytes of records with the index ({record_size / pgn_size if pgn_size else 0:.1%})")
+        elif options.command == "show":
+            with GameRecordReader(options.path) as reader:
+                PgnWriter(sys.stdout).write_game(reader.read_game(options.number).to_pgn())
+        else:
+            print(f"{rebuild_index(options.path)} games indexed")
+    except (GameRecordError, FenError, OSError, IndexError) as error:
+        print(error)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,8 +2,90 @@
 Implements the gui elements of pygame such as button and slider
 """
 import pygame as _pygame
+from collections import OrderedDict
 from typing import Optional, Tuple
 
+class FontRegistry:
+    """
+    Keeps one pygame font per (face, size, bold), so widgets and overlays share fonts instead of
+    making a new one every frame. A face of None is pygame's default font.
+    """
+    def __init__(self):
+        self.fonts: dict = {}
+
+    def get_font(self, face: Optional[str] = None, size: int = 36, bold: bool = False) -> _pygame.font.Font:
+        key = (face, size, bold)
+        if key not in self.fonts:
+            if face is None:
+                font = _pygame.font.Font(None, size)
+                font.set_bold(bold)
+            else:
+                font = _pygame.font.SysFont(face, size, bold=bold)
+            self.fonts[key] = font
+        return self.fonts[key]
+
+class TextCache:
+    """
+    Least recently used cache of rendered text surfaces, keyed by (font, text, colour, antialias).
+    The pixels of all the cached surfaces together are kept under max_bytes.
+    """
+    def __init__(self, fonts: FontRegistry, max_bytes: int = 4 * 1024 * 1024):
+        self.fonts = fonts
+        self.max_bytes = max_bytes
+        self.surfaces: OrderedDict = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def render(
+        self,
+        text: str,
+        color: Tuple[int, int, int],
+        face: Optional[str] = None,
+        size: int = 36,
+        bold: bool = False,
+        antialias: bool = True,
+    ) -> _pygame.Surface:
+        key = ((face, size, bold), text, tuple(color), antialias)
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.hits += 1
+            self.surfaces.move_to_end(key)
+            return surface
+        self.misses += 1
+        surface = self.fonts.get_font(face, size, bold).render(text, antialias, color)
+        self.surfaces[key] = surface
+        self.bytes += self.surface_bytes(surface)
+        while self.bytes > self.max_bytes and len(self.surfaces) > 1:
+            _, evicted = self.surfaces.popitem(last=False)
+            self.bytes -= self.surface_bytes(evicted)
+            self.evictions += 1
+        return surface
+
+    @staticmethod
+    def surface_bytes(surface: _pygame.Surface) -> int:
+        return surface.get_width() * surface.get_height() * surface.get_bytesize()
+
+    def clear(self):
+        self.surfaces.clear()
+        self.bytes = 0
+
+    def get_stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self.surfaces),
+            "bytes": self.bytes,
+            "fonts": len(self.fonts.fonts),
+        }
+
+font_registry = FontRegistry() # shared by every widget and overlay in the process
+text_cache = TextCache(font_registry)
+
 class Button:
     def __init__(
         self,
@@ -21,13 +103,11 @@ class Button:
         self.color: Tuple[int, int, int] = color
         self.text_color: Tuple[int, int, int] = text_color
 
-        # Use default font if none is provided
+        # Use the shared default font if none is provided
         if font is None:
-            font = _pygame.font.Font(None, 36)
-
-        self.text_surface: _pygame.Surface = font.render(
-            self.text, True, self.text_color
-        )
+            self.text_surface: _pygame.Surface = text_cache.render(self.text, self.text_color)
+        else:
+            self.text_surface = font.render(self.text, True, self.text_color)
         self.text_rect: _pygame.Rect = self.text_surface.get_rect(
             center=self.rect.center
         )
@@ -106,11 +186,9 @@ class Slider:
 
         # Draw labels if provided
         if self.labels:
-            font = _pygame.font.Font(None, 24)
-            label_font = _pygame.font.Font(None, 20)
             label_width = self.width // (len(self.labels) - 1)
             for i, label in enumerate(self.labels):
-                label_surface = label_font.render(label, True, (255, 255, 255))
+                label_surface = text_cache.render(label, (255, 255, 255), size=20)
                 label_x = self.x + i * label_width
                 screen.blit(
                     label_surface,
@@ -118,8 +196,7 @@ class Slider:
                 )
 
         # Draw the current value next to the slider
-        font = _pygame.font.Font(None, 36)
-        value_text = font.render(str(self.value), True, (255, 255, 255))
+        value_text = text_cache.render(str(self.value), (255, 255, 255), size=36)
         screen.blit(
             value_text,
             (self.x + self.width + 10, self.y - value_text.get_height() // 2),
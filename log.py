@@ -0,0 +1,62 @@
+"""
+Logging for the game, on top of the standard logging module. Every part of the game has its own logger under
+"chezz" (chezz.rules, chezz.board, chezz.game), messages are formatted only if a handler takes them, and
+configure sends them to the console, to a file of one JSON object a line for later analysis, or to both.
+
+Moves and clicks log on every call, so those call sites check enabled first, and with logging off a message
+costs one global lookup. Warnings and errors are rare enough to always go to their logger.
+
+    import log
+    logger = log.get_logger("rules")
+    if log.enabled:
+        logger.debug("Piece %s created at %d, %d", name, rank, file)
+"""
+import json
+import logging
+import sys
+
+enabled = False # whether debug and info messages go anywhere, set by configure
+
+ROOT_NAME = "chezz"
+CONSOLE_FORMAT = "%(name)s %(levelname)s: %(message)s"
+
+def get_logger(subsystem:str):
+    return logging.getLogger(f"{ROOT_NAME}.{subsystem}")
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object a line: time, level, logger and message, plus any fields given as extra={"fields": {...}},
+    so a log can be read back with json.loads line by line.
+    """
+    def format(self, record:logging.LogRecord):
+        entry = {"time": record.created, "level": record.levelname, "logger": record.name, "message": record.getMessage()}
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(fields)
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+def configure(level:str = "WARNING", console:bool = True, path:str = None):
+    """
+    Sets where the game's messages go and from which level, replacing what an earlier call set up. The console
+    gets plain text, path gets JSON lines appended to it.
+    """
+    global enabled
+    root = logging.getLogger(ROOT_NAME)
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+    root.setLevel(level)
+    root.propagate = False
+    if console:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(logging.Formatter(CONSOLE_FORMAT))
+        root.addHandler(handler)
+    if path is not None:
+        handler = logging.FileHandler(path, encoding="utf-8")
+        handler.setFormatter(JsonFormatter())
+        root.addHandler(handler)
+    if not root.handlers:
+        root.addHandler(logging.NullHandler())
+    enabled = bool(console or path is not None) and root.getEffectiveLevel() <= logging.INFO
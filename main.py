@@ -1,23 +1,9 @@
 import pygame as _pygame
 
+import log
 from settings import settings
 from state import StateManager, SplashState
 
-# Initalizations
-_pygame.init()
-_pygame.font.init()
-_pygame.mixer.init()
-
-# ASSETS
-# Sounds
-# click_sound = _pygame.mixer.Sound("Assets/Sounds/click.wav")
-# move_sound = _pygame.mixer.Sound("Assets/Sounds/move.wav")
-
-# Sprites
-logo = _pygame.image.load("Assets/Sprites/Logo.png")
-icon = _pygame.image.load("Assets/Sprites/Icon.png")
-company_logo = _pygame.image.load("Assets/Sprites/Company.png")
-
 # CONSTANTS
 SCREEN_WIDTH = settings["screen"]["width"]
 SCREEN_HEIGHT = settings["screen"]["height"]
@@ -35,6 +21,23 @@ MOVE_HIGHLIGHT = _pygame.Color("#5fa14460")
 CAPTURE_HIGHLIGHT = _pygame.Color("#d42a2a5f")
 
 if __name__ == "__main__":
+    # Everything here only runs in the game process, the engine worker process imports this file too
+    # Initalizations
+    log.configure(**settings["logging"]) # DEBUG or INFO to see every click and move, a path to keep them as JSON lines
+    _pygame.init()
+    _pygame.font.init()
+    _pygame.mixer.init()
+
+    # ASSETS
+    # Sounds
+    # click_sound = _pygame.mixer.Sound("Assets/Sounds/click.wav")
+    # move_sound = _pygame.mixer.Sound("Assets/Sounds/move.wav")
+
+    # Sprites
+    logo = _pygame.image.load("Assets/Sprites/Logo.png")
+    icon = _pygame.image.load("Assets/Sprites/Icon.png")
+    company_logo = _pygame.image.load("Assets/Sprites/Company.png")
+
     # Initialize Pygame Screen
     screen = _pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
     _pygame.display.set_caption("Chezz.com")
@@ -44,7 +47,7 @@ if __name__ == "__main__":
     # Initialize the state manager
     state_manager = StateManager(
         initial_state=SplashState(None, screen, [company_logo, logo]),
-        default_variables={"theme": 1}
+        default_variables={"theme": 1, "difficulty": settings["game"]["difficulty"]}
     )
     state_manager.state.manager = state_manager
 
@@ -57,7 +60,10 @@ if __name__ == "__main__":
             state_manager.handle_event(event)
         
         state_manager.update()
-        state_manager.draw()
+        dirty_rects = state_manager.draw()
         
-        _pygame.display.flip()
+        if dirty_rects is None:
+            _pygame.display.flip()
+        else:
+            _pygame.display.update(dirty_rects) # only the parts of the screen that changed
         clock.tick(FRAME_RATE)
\ No newline at end of file
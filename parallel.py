@@ -0,0 +1,163 @@
+"""
+Splits the root moves of a position across worker processes, for perft and for fixed depth searches.
+Workers are sent the FEN and one root move, and build their own board from it, so nothing with pygame
+in it is ever pickled. Results are merged in the order of the root moves, so they do not depend on
+which worker finished first.
+
+    python parallel.py --fen "<fen>" --depth 5 --workers 4
+    python parallel.py --search --depth 4 --scaling 8
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from engine import MATE_SCORE, Engine
+from perft import perft
+from rules import Board, classic_board_from_fen, move_to_string
+
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+worker_boards:dict[str, Board] = {} # FEN -> board, kept by each worker process between the root moves it is given
+worker_engine:Engine = None # kept by each worker process, with its table cleared before every root move
+
+def get_worker_board(fen:str) -> Board:
+    # make_move and unmake_move leave the board exactly as it was, down to the order of its pieces and so of its moves,
+    # so one board per position serves every task, test_parallel.py checks that the order of the tasks does not matter
+    if fen not in worker_boards:
+        worker_boards[fen] = classic_board_from_fen(fen)
+    return worker_boards[fen]
+
+def perft_root_move(fen:str, move:int, depth:int):
+    board = get_worker_board(fen)
+    board.make_move(move)
+    try:
+        return perft(board, depth - 1)
+    finally:
+        board.unmake_move()
+
+def get_worker_engine() -> Engine:
+    # One engine per worker process, its table cleared for every task so the score does not depend on what else the process searched
+    global worker_engine
+    if worker_engine is None:
+        worker_engine = Engine(budget={"name": "parallel", "max_depth": 64, "nodes": 10 ** 12, "time": 10 ** 9}, table_size_mb=4)
+    else:
+        worker_engine.table.clear()
+    worker_engine.nodes = 0
+    return worker_engine
+
+def search_root_move(fen:str, move:int, depth:int):
+    # Full window search under one root move
+    board = get_worker_board(fen)
+    engine = get_worker_engine()
+    board.make_move(move)
+    try:
+        score = -engine.negamax(board, depth - 1, -MATE_SCORE - 1, MATE_SCORE + 1, 1)
+    finally:
+        board.unmake_move()
+    return score, engine.nodes
+
+class RootSplitter:
+    """
+    A pool of worker processes that share out the root moves of a position. Started once and kept, as
+    starting the processes takes far longer than a small perft.
+    """
+    def __init__(self, workers:int = None):
+        self.workers = workers or os.cpu_count() or 1
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def warm_up(self):
+        # Starts every worker and has it import the rules, so timings only count the work
+        list(self.executor.map(get_worker_board, [START_FEN] * self.workers * 2))
+
+    def close(self):
+        self.executor.shutdown()
+
+    def perft(self, fen:str, depth:int) -> dict[str, int]:
+        # Leaf nodes under every root move, in the order the moves were generated
+        board = get_worker_board(fen)
+        moves = board.generate_moves()
+        if depth <= 1:
+            return {move_to_string(move): 1 for move in moves}
+        counts = self.executor.map(perft_root_move, [fen] * len(moves), moves, [depth] * len(moves))
+        return {move_to_string(move): nodes for move, nodes in zip(moves, counts)}
+
+    def search(self, fen:str, depth:int):
+        """
+        Searches every root move to depth in parallel, each with a full window. Returns (best move, score, nodes,
+        scores of every move). Ties go to the move generated first, so the result is the same with any number of workers.
+        """
+        board = get_worker_board(fen)
+        moves = list(board.iterate_moves()) # the order of Engine.generate_moves, without building an engine
+        if not moves:
+            return None, 0, 0, {}
+        results = list(self.executor.map(search_root_move, [fen] * len(moves), moves, [depth] * len(moves)))
+        best_move = None
+        best_score = 0
+        for move, (score, nodes) in zip(moves, results):
+            if best_move is None or score > best_score:
+                best_move, best_score = move, score
+        return best_move, best_score, sum(nodes for score, nodes in results), {move_to_string(move): score for move, (score, nodes) in zip(moves, results)}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+def run(fen:str, depth:int, workers:int, search:bool):
+    with RootSplitter(workers) as splitter:
+        start = time.perf_counter()
+        splitter.warm_up()
+        startup = time.perf_counter() - start
+        start = time.perf_counter()
+        if search:
+            best_move, score, nodes, scores = splitter.search(fen, depth)
+            result = {"best": move_to_string(best_move) if best_move is not None else None, "score": score, "scores": scores}
+        else:
+            counts = splitter.perft(fen, depth)
+            nodes = sum(counts.values())
+            result = {"divide": counts}
+        seconds = time.perf_counter() - start
+    result.update({"workers": workers, "nodes": nodes, "seconds": seconds, "startup": startup})
+    return result
+
+def print_scaling(results:list[dict]):
+    base = results[0]["seconds"]
+    print(f"{'workers':>7} {'seconds':>9} {'nodes/s':>10} {'speedup':>8} {'efficiency':>10} {'startup':>8}")
+    for result in results:
+        speedup = base / result["seconds"] if result["seconds"] > 0 else 0
+        print(f"{result['workers']:7d} {result['seconds']:9.3f} {result['nodes'] / result['seconds'] if result['seconds'] > 0 else 0:10.0f} {speedup:8.2f} {speedup / result['workers']:10.1%} {result['startup']:8.2f}")
+
+def main(arguments:list[str] = None):
+    parser = argparse.ArgumentParser(description="Perft or a fixed depth search with the root moves split across processes.")
+    parser.add_argument("--fen", default=START_FEN, help="position to count or search, defaults to the start position")
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes")
+    parser.add_argument("--search", action="store_true", help="search instead of counting leaf nodes")
+    parser.add_argument("--scaling", type=int, metavar="N", help="run with 1, 2, 4 ... N workers and print how the time scales")
+    options = parser.parse_args(arguments)
+
+    if options.scaling:
+        worker_counts = []
+        workers = 1
+        while workers < options.scaling:
+            worker_counts.append(workers)
+            workers *= 2
+        worker_counts.append(options.scaling)
+        results = [run(options.fen, options.depth, workers, options.search) for workers in worker_counts]
+        outputs = {(result["best"], result["score"]) if options.search else result["nodes"] for result in results}
+        print(f"{'search' if options.search else 'perft'} depth {options.depth} on {os.cpu_count()} cores, {'same result' if len(outputs) == 1 else 'RESULTS DIFFER'} with every worker count")
+        print_scaling(results)
+        return 0 if len(outputs) == 1 else 1
+
+    result = run(options.fen, options.depth, options.workers, options.search)
+    if options.search:
+        print(f"best {result['best']} score {result['score']}")
+    print(f"{result['nodes']} nodes in {result['seconds']:.3f} s with {options.workers} workers ({result['nodes'] / result['seconds'] if result['seconds'] > 0 else 0:.0f} nodes/s, {result['startup']:.2f} s to start)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,150 @@
+"""
+Perft: counts the leaf nodes of the move tree to a fixed depth, to check and time move generation without pygame
+
+    python perft.py --fen "<fen>" --depth 3 --divide
+    python perft.py --suite --depth 3 --json perft_results.json
+    python perft.py --suite --depth 2 --check-unmake
+"""
+import argparse
+import json
+import sys
+import time
+
+from rules import Board, classic_board_from_fen, move_to_string
+
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+# Reference positions and their node counts from depth 1 upwards
+# https://www.chessprogramming.org/Perft_Results
+REFERENCE_POSITIONS = [
+    {"name": "start", "fen": START_FEN, "nodes": [20, 400, 8902, 197281, 4865609]},
+    {"name": "kiwipete", "fen": "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1", "nodes": [48, 2039, 97862, 4085603]},
+    {"name": "position 3", "fen": "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1", "nodes": [14, 191, 2812, 43238, 674624]},
+    {"name": "position 4", "fen": "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1", "nodes": [6, 264, 9467, 422333]},
+    {"name": "position 5", "fen": "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8", "nodes": [44, 1486, 62379, 2103487]},
+    {"name": "position 6", "fen": "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10", "nodes": [46, 2079, 89890, 3894594]},
+]
+
+def load_board(fen:str) -> Board:
+    return classic_board_from_fen(fen)
+
+def perft(board:Board, depth:int) -> int:
+    moves = board.generate_moves()
+    if depth <= 1:
+        return len(moves) if depth == 1 else 1
+    nodes = 0
+    for move in moves:
+        board.make_move(move)
+        nodes += perft(board, depth - 1)
+        board.unmake_move()
+    return nodes
+
+def get_state(board:Board):
+    # Everything make_move changes, to compare before a move and after taking it back
+    board.refresh_legal_moves()
+    return (
+        board.turn, board.hash, board.in_check[board.turn], board.castling_rights, board.ep_square, board.halfmove_clock, board.fullmove_number, board.ply,
+        tuple(piece.name if piece else None for piece in board.mailbox),
+        tuple(sorted(board.piece_bitboards.items())), tuple(sorted(board.colour_bitboards.items())),
+        # In the order of all_pieces and not sorted, as that order is the order moves are generated in
+        tuple((piece.square.get_index(), piece.name, tuple(str(legal_move.move) for legal_move in piece.legal_moves), piece.attack_mask) for piece in board.all_pieces),
+        tuple(board.generate_moves()),
+    )
+
+def perft_checked(board:Board, depth:int) -> int:
+    """
+    perft that checks every make_move against a hash from scratch, and that every unmake_move
+    restores exactly the state from before the move. Raises AssertionError at the first difference.
+    """
+    if depth == 0:
+        return 1
+    nodes = 0
+    for move in board.generate_moves():
+        before = get_state(board)
+        board.make_move(move)
+        assert board.hash == board.calculate_hash(), f"hash is wrong after {move_to_string(move)} in {board.get_fen()}"
+        nodes += perft_checked(board, depth - 1)
+        board.unmake_move()
+        assert get_state(board) == before, f"unmake of {move_to_string(move)} did not restore {board.get_fen()}"
+    return nodes
+
+def divide(board:Board, depth:int) -> dict[str, int]:
+    # Leaf nodes under every root move, for finding the move where two move generators disagree
+    counts = {}
+    for move in board.generate_moves():
+        move_name = f"{move_to_string(move)}"
+        board.make_move(move)
+        counts[move_name] = perft(board, depth - 1)
+        board.unmake_move()
+    return counts
+
+def run_perft(fen:str, depth:int, show_divide:bool = False, expected:int = None, check_unmake:bool = False) -> dict:
+    board = load_board(fen)
+    start = time.perf_counter()
+    if show_divide:
+        counts = divide(board, depth)
+        nodes = sum(counts.values())
+    else:
+        counts = None
+        nodes = perft_checked(board, depth) if check_unmake else perft(board, depth)
+    seconds = time.perf_counter() - start
+    result = {
+        "fen": fen,
+        "depth": depth,
+        "nodes": nodes,
+        "seconds": seconds,
+        "nodes_per_second": nodes / seconds if seconds > 0 else 0,
+        "expected": expected,
+        "passed": None if expected is None else nodes == expected,
+    }
+    if counts is not None:
+        result["divide"] = counts
+    return result
+
+def print_result(result:dict, name:str = None):
+    if "divide" in result:
+        for move_name, nodes in result["divide"].items():
+            print(f"  {move_name}: {nodes}")
+    status = ""
+    if result["passed"] is not None:
+        status = "ok" if result["passed"] else f"MISMATCH expected {result['expected']}"
+    label = name if name is not None else result["fen"]
+    print(f"{label} depth {result['depth']}: {result['nodes']} nodes in {result['seconds']:.3f} s ({result['nodes_per_second']:.0f} nodes/s) {status}")
+
+def main(arguments:list[str] = None):
+    parser = argparse.ArgumentParser(description="Count move generation leaf nodes to a fixed depth.")
+    parser.add_argument("--fen", default=START_FEN, help="position to count, defaults to the start position")
+    parser.add_argument("--depth", type=int, default=3, help="depth to count to (the maximum depth with --suite)")
+    parser.add_argument("--divide", action="store_true", help="print the count under every root move")
+    parser.add_argument("--suite", action="store_true", help="run the reference positions and compare with their known counts")
+    parser.add_argument("--json", help="write the results to this file as JSON")
+    parser.add_argument("--check-unmake", action="store_true", help="check that unmaking every move restores the exact board state (slow)")
+    options = parser.parse_args(arguments)
+
+    results = []
+    if options.suite:
+        for position in REFERENCE_POSITIONS:
+            for depth in range(1, min(options.depth, len(position["nodes"])) + 1):
+                result = run_perft(position["fen"], depth, options.divide, position["nodes"][depth - 1], options.check_unmake)
+                result["name"] = position["name"]
+                print_result(result, position["name"])
+                results.append(result)
+    else:
+        expected = None
+        for position in REFERENCE_POSITIONS:
+            if position["fen"] == options.fen and options.depth <= len(position["nodes"]):
+                expected = position["nodes"][options.depth - 1]
+        result = run_perft(options.fen, options.depth, options.divide, expected, options.check_unmake)
+        print_result(result)
+        results.append(result)
+
+    total_nodes = sum(result["nodes"] for result in results)
+    total_seconds = sum(result["seconds"] for result in results)
+    print(f"total: {total_nodes} nodes in {total_seconds:.3f} s ({total_nodes / total_seconds if total_seconds else 0:.0f} nodes/s)")
+    if options.json:
+        with open(options.json, "w") as f:
+            json.dump({"results": results, "nodes": total_nodes, "seconds": total_seconds}, f, indent=4)
+    return 1 if any(result["passed"] is False for result in results) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,241 @@
+"""
+PGN: reading and writing games in Portable Game Notation, without pygame. Archives of any size are read one game
+at a time, so the memory used does not grow with the number of games.
+
+    python pgn.py games.pgn
+    python pgn.py games.pgn --no-replay
+"""
+import argparse
+import re
+import sys
+import time
+
+from rules import Board, FenError, SanError, classic_board_from_fen
+
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+RESULTS = ("1-0", "0-1", "1/2-1/2", "*")
+SEVEN_TAG_ROSTER = ("Event", "Site", "Date", "Round", "White", "Black", "Result") # written first and always, in this order
+MAX_GAME_CHARACTERS = 1 << 20 # a game longer than this is skipped as malformed, so one bad game cannot fill the memory
+LINE_LENGTH = 79
+
+TAG_PATTERN = re.compile(r'\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+# Comments, variations, NAGs, move numbers, results and moves
+TOKEN_PATTERN = re.compile(r'\{[^}]*\}?|;[^\n]*|\(|\)|\$\d+|\d+\.+|1-0|0-1|1/2-1/2|\*|[^\s{}();$]+')
+
+class PgnError(ValueError):
+    pass
+
+class PgnGame:
+    def __init__(self, headers:dict[str, str] = None, moves:list[str] = None, result:str = "*"):
+        self.headers = headers if headers is not None else {}
+        self.moves = moves if moves is not None else [] # SAN of every move of the main line
+        self.result = result
+        self.encoded_moves:list[int] = [] # the moves encoded for Board.make_move, filled in by replay
+
+    def get_starting_fen(self):
+        return self.headers.get("FEN", START_FEN)
+
+    def replay(self) -> Board:
+        """
+        Plays the moves from the starting position, resolving every SAN against the legal moves.
+        Returns the board after the last move, raises FenError or SanError if the game is not legal.
+        """
+        board = classic_board_from_fen(self.get_starting_fen())
+        self.encoded_moves = []
+        for san in self.moves:
+            move = board.parse_san(san)
+            board.make_move(move)
+            self.encoded_moves.append(move)
+        return board
+
+def unescape(value:str):
+    return value.replace('\\"', '"').replace("\\\\", "\\")
+
+def parse_movetext(text:str):
+    # The SAN of the main line and the result, skipping comments, variations, NAGs and move numbers
+    moves = []
+    result = "*"
+    depth = 0 # variations can be nested
+    for token in TOKEN_PATTERN.findall(text):
+        first = token[0]
+        if first == "{" or first == ";" or first == "$":
+            continue
+        if token == "(":
+            depth += 1
+        elif token == ")":
+            if depth == 0:
+                raise PgnError("variation closed that was never opened")
+            depth -= 1
+        elif depth > 0 or first.isdigit() and token[-1] == ".":
+            continue
+        elif token in RESULTS:
+            result = token
+        else:
+            moves.append(token.rstrip("!?")) # annotations like ?! are not part of the move
+    if depth != 0:
+        raise PgnError("variation that is never closed")
+    return moves, result
+
+class PgnReader:
+    """
+    Streams the games of a PGN file one at a time. With replay set every game is played through on a board, which
+    checks every move and fills in encoded_moves but is a lot slower than reading the tags and SAN alone.
+    A malformed game raises PgnError, FenError or SanError with its line number, or with skip_invalid set it
+    is counted in invalid, remembered in last_error, and skipped, and the reader carries on with the next game.
+    """
+    def __init__(self, path:str, replay:bool = True, skip_invalid:bool = True):
+        self.path = path
+        self.replay = replay
+        self.skip_invalid = skip_invalid
+        self.games = 0 # games yielded so far
+        self.invalid = 0 # games skipped for being malformed
+        self.last_error:str = None
+
+    def read_game_texts(self, file):
+        # (line number, tag lines, movetext lines, length) of every game, a game ends after its result or where the next tags start
+        first_line = 0
+        tag_lines, movetext, characters = [], [], 0
+        for line_number, line in enumerate(file, 1):
+            stripped = line.strip()
+            if not stripped or stripped[0] == "%":
+                continue
+            if stripped[0] == "[" and (movetext or characters > MAX_GAME_CHARACTERS):
+                yield first_line, tag_lines, movetext, characters
+                tag_lines, movetext, characters = [], [], 0
+            if characters == 0:
+                first_line = line_number
+            characters += len(stripped)
+            if characters > MAX_GAME_CHARACTERS:
+                # Too long, the rest of it is dropped until the next game starts
+                tag_lines.clear()
+                movetext.clear()
+            elif stripped[0] == "[" and not movetext:
+                tag_lines.append(stripped)
+            else:
+                movetext.append(stripped)
+                if stripped.rsplit(None, 1)[-1] in RESULTS:
+                    yield first_line, tag_lines, movetext, characters
+                    tag_lines, movetext, characters = [], [], 0
+        if characters > 0:
+            yield first_line, tag_lines, movetext, characters
+
+    def parse_game(self, tag_lines:list[str], movetext:list[str], characters:int):
+        if characters > MAX_GAME_CHARACTERS:
+            raise PgnError(f"game longer than {MAX_GAME_CHARACTERS} characters")
+        headers = {}
+        for tag_line in tag_lines:
+            match = TAG_PATTERN.fullmatch(tag_line)
+            if match is None:
+                raise PgnError(f"bad tag {tag_line!r}")
+            headers[match.group(1)] = unescape(match.group(2))
+        moves, result = parse_movetext("\n".join(movetext))
+        game = PgnGame(headers, moves, result)
+        if self.replay:
+            game.replay()
+        return game
+
+    def __iter__(self):
+        with open(self.path, encoding="utf-8", errors="replace") as file:
+            for line_number, tag_lines, movetext, characters in self.read_game_texts(file):
+                try:
+                    game = self.parse_game(tag_lines, movetext, characters)
+                except (PgnError, FenError, SanError) as error:
+                    message = f"{self.path} game at line {line_number}: {error}"
+                    if not self.skip_invalid:
+                        raise type(error)(message) from None
+                    self.invalid += 1
+                    self.last_error = message
+                    continue
+                self.games += 1
+                yield game
+
+def escape(value:str):
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+def format_movetext(moves:list[str], result:str, starting_fen:str = START_FEN):
+    # Move numbers go before every white move, and before the first move if black starts
+    fields = starting_fen.split()
+    white_to_move = fields[1] == "w"
+    move_number = int(fields[5])
+    tokens = []
+    for index, san in enumerate(moves):
+        if white_to_move:
+            tokens.append(f"{move_number}.")
+        elif index == 0:
+            tokens.append(f"{move_number}...")
+        tokens.append(san)
+        if not white_to_move:
+            move_number += 1
+        white_to_move = not white_to_move
+    tokens.append(result)
+    lines = []
+    line = ""
+    for token in tokens:
+        if line and len(line) + 1 + len(token) > LINE_LENGTH:
+            lines.append(line)
+            line = token
+        else:
+            line = f"{line} {token}" if line else token
+    lines.append(line)
+    return "\n".join(lines)
+
+class PgnWriter:
+    # Writes games to an open text file one at a time
+    def __init__(self, file):
+        self.file = file
+
+    def write_game(self, game:PgnGame):
+        headers = {tag: "?" for tag in SEVEN_TAG_ROSTER}
+        headers["Date"] = "????.??.??"
+        headers.update(game.headers)
+        headers["Result"] = game.result
+        headers.pop("SetUp", None)
+        headers.pop("FEN", None) # written again after SetUp, which has to come first
+        if game.get_starting_fen() != START_FEN:
+            headers["SetUp"] = "1"
+            headers["FEN"] = game.get_starting_fen()
+        for tag in SEVEN_TAG_ROSTER:
+            self.file.write(f'[{tag} "{escape(headers.pop(tag))}"]\n')
+        for tag, value in headers.items():
+            self.file.write(f'[{tag} "{escape(value)}"]\n')
+        self.file.write("\n" + format_movetext(game.moves, game.result, game.get_starting_fen()) + "\n\n")
+
+def board_to_game(board:Board, headers:dict[str, str] = None):
+    # The moves played on the board (its moves_stack) as a game, with the result if the game is over
+    game = PgnGame(dict(headers or {}), [move.notation() for move in board.moves_stack])
+    if board.starting_fen != START_FEN:
+        game.headers["FEN"] = board.starting_fen
+    result = board.get_result()
+    if result is not None:
+        game.result = result[0]
+    return game
+
+def save_game(board:Board, path:str, headers:dict[str, str] = None):
+    # Adds the game played on the board to the end of a PGN file
+    with open(path, "a", encoding="utf-8") as file:
+        PgnWriter(file).write_game(board_to_game(board, headers))
+
+def main(arguments:list[str] = None):
+    parser = argparse.ArgumentParser(description="Read every game of a PGN file, checking that the moves are legal.")
+    parser.add_argument("path", help="PGN file")
+    parser.add_argument("--no-replay", action="store_true", help="only read the tags and moves, without playing the moves on a board")
+    parser.add_argument("--strict", action="store_true", help="stop at the first malformed game instead of skipping it")
+    options = parser.parse_args(arguments)
+
+    reader = PgnReader(options.path, replay=not options.no_replay, skip_invalid=not options.strict)
+    start = time.perf_counter()
+    moves = 0
+    try:
+        for game in reader:
+            moves += len(game.moves)
+    except (PgnError, FenError, SanError) as error:
+        print(error)
+        return 1
+    seconds = time.perf_counter() - start
+    print(f"{reader.games} games, {moves} moves, {reader.invalid} invalid, in {seconds:.3f} s ({reader.games / seconds if seconds > 0 else 0:.1f} games/s)")
+    if reader.last_error is not None:
+        print(f"last invalid game: {reader.last_error}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
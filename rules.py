@@ -0,0 +1,1381 @@
+"""
+The rules of the game: squares, movement patterns, pieces, move generation, FEN and move history.
+Nothing here uses pygame or settings.json, so boards can be made in workers and tools without a window.
+"""
+import random
+import re
+from array import array
+
+import log
+
+logger = log.get_logger("rules")
+
+BOARD_CONFIG = [
+    ["R", "N", "B", "Q", "K", "B", "N", "R"],
+    ["P", "P", "P", "P", "P", "P", "P", "P"],
+    [None, None, None, None, None, None, None, None],
+    [None, None, None, None, None, None, None, None],
+    [None, None, None, None, None, None, None, None],
+    [None, None, None, None, None, None, None, None],
+    ["p", "p", "p", "p", "p", "p", "p", "p"],
+    ["r", "n", "b", "q", "k", "b", "n", "r"],
+]
+
+# Zobrist keys, one random 64-bit number per piece name and square, seeded so hashes are the same every run
+ZOBRIST_PIECE_KEYS:dict[str, list[int]] = {}
+ZOBRIST_BLACK_TO_MOVE = random.Random("zobrist black to move").getrandbits(64)
+
+def get_zobrist_keys(piece_name:str) -> list[int]:
+    if piece_name not in ZOBRIST_PIECE_KEYS:
+        generator = random.Random(f"zobrist {piece_name}")
+        ZOBRIST_PIECE_KEYS[piece_name] = [generator.getrandbits(64) for _ in range(64)]
+    return ZOBRIST_PIECE_KEYS[piece_name]
+
+# Castling rights are kept as a bitmask, like the KQkq field of a FEN
+WHITE_KINGSIDE = 1
+WHITE_QUEENSIDE = 2
+BLACK_KINGSIDE = 4
+BLACK_QUEENSIDE = 8
+CASTLING_LETTERS = ((WHITE_KINGSIDE, "K"), (WHITE_QUEENSIDE, "Q"), (BLACK_KINGSIDE, "k"), (BLACK_QUEENSIDE, "q"))
+
+# The castling rights that survive a move from or to every square, a king or rook leaving home or a rook being taken loses them
+CASTLING_RIGHTS_KEPT = [15] * 64
+CASTLING_RIGHTS_KEPT[0] = 15 & ~WHITE_QUEENSIDE # a1
+CASTLING_RIGHTS_KEPT[4] = 15 & ~(WHITE_KINGSIDE | WHITE_QUEENSIDE) # e1
+CASTLING_RIGHTS_KEPT[7] = 15 & ~WHITE_KINGSIDE # h1
+CASTLING_RIGHTS_KEPT[56] = 15 & ~BLACK_QUEENSIDE # a8
+CASTLING_RIGHTS_KEPT[60] = 15 & ~(BLACK_KINGSIDE | BLACK_QUEENSIDE) # e8
+CASTLING_RIGHTS_KEPT[63] = 15 & ~BLACK_KINGSIDE # h8
+
+def make_castling_keys():
+    # One key per right, the key of a set of rights is all of them xored together so no rights hash to 0
+    generator = random.Random("zobrist castling")
+    right_keys = [generator.getrandbits(64) for _ in range(4)]
+    keys = []
+    for rights in range(16):
+        key = 0
+        for bit in range(4):
+            if rights >> bit & 1:
+                key ^= right_keys[bit]
+        keys.append(key)
+    return keys
+
+ZOBRIST_CASTLING_KEYS = make_castling_keys()
+ZOBRIST_EN_PASSANT_KEYS = [random.Random(f"zobrist en passant {file}").getrandbits(64) for file in range(8)] # by file
+UNDO_STACK_SIZE = 256 # plies of undo information allocated up front, doubled when a game or search goes deeper
+
+class BoardLocation:
+    """
+    A square, or an offset when used in a movement pattern. Locations are interned and immutable: BoardLocation(rank, file)
+    always gives back the same object for the same coordinates, so they compare by identity and can be dict keys.
+    """
+    __slots__ = ("rank", "file", "index", "bit")
+    interned:dict[tuple[int, int], "BoardLocation"] = {}
+
+    def __new__(cls, rank:int, file:int):
+        location = cls.interned.get((rank, file))
+        if location is None:
+            location = object.__new__(cls)
+            object.__setattr__(location, "rank", rank)
+            object.__setattr__(location, "file", file)
+            object.__setattr__(location, "index", rank * 8 + file)
+            object.__setattr__(location, "bit", 1 << (rank * 8 + file) if 0 <= rank < 8 and 0 <= file < 8 else 0)
+            cls.interned[(rank, file)] = location
+        return location
+
+    def __setattr__(self, name, value):
+        raise AttributeError("BoardLocation is immutable, use offset to get another one")
+
+    def __reduce__(self):
+        # Unpickled through __new__, so a location sent from another process is interned again
+        return (BoardLocation, (self.rank, self.file))
+
+    def __str__(self):
+        if self.rank < 0 or self.rank > 7 or self.file < 0 or self.file > 7:
+            return "None"
+        else:
+            return f"{["a", "b", "c", "d", "e", "f", "g", "h"][self.file]}{self.rank + 1}"
+
+    def offset(self, offset_rank:int, offset_file:int):
+        return BoardLocation(self.rank + offset_rank, self.file + offset_file)
+    
+    def get_rank(self):
+        return self.rank
+    
+    def get_file(self):
+        return self.file
+
+    def is_on_board(self):
+        return 0 <= self.rank < 8 and 0 <= self.file < 8
+
+    def get_index(self): # index of the square in a bitboard, a1 = 0 ... h8 = 63
+        return self.index
+
+    def get_bit(self):
+        return self.bit
+
+SQUARES = [BoardLocation(index // 8, index % 8) for index in range(64)] # one shared BoardLocation per square index
+
+class Movement:
+    __slots__ = ("move", "need_to_be_clear", "type")
+
+    def __init__(self, move:BoardLocation, need_to_be_clear:list[list[BoardLocation]], type:str):
+        self.move = move
+        self.need_to_be_clear = need_to_be_clear
+        self.type = type # "normal", "capture"
+    
+    def __str__(self):
+        clear_str = ', '.join( 
+            '[' + ', '.join(str(loc) for loc in group) + ']'
+            for group in self.need_to_be_clear
+        )
+        return f"Move to {self.move}, clears: {clear_str if clear_str else '[]'}, type: {self.type}"
+    
+    def offset(self, offset_rank:int, offset_file:int):
+        # The same movement shifted by the offset, as a new movement since locations cannot change
+        return Movement(
+            self.move.offset(offset_rank, offset_file),
+            [[clear_space.offset(offset_rank, offset_file) for clear_space in clear_spaces] for clear_spaces in self.need_to_be_clear],
+            self.type,
+        )
+    
+    def get_move(self):
+        return self.move
+
+    def get_clear_mask(self): # bitboard of every square that needs to be clear
+        mask = 0
+        for clear_spaces in self.need_to_be_clear:
+            for clear_space in clear_spaces:
+                mask |= clear_space.get_bit()
+        return mask
+
+class MovementPattern:
+    def __init__(self, name: str, pattern: list[Movement]):
+        self.name = name
+        self.pattern = pattern  # list of Move objects
+        self.tables = {} # direction -> moves from every square, see compile
+        self.reaches = {} # direction -> bitboard of the squares a piece on every square depends on
+    
+    def __str__(self):
+        moves_str = "\n  ".join(str(move) for move in self.pattern)
+        return f"{self.name.capitalize()} Moves:\n  {moves_str}"
+
+    def update_to_position(self, location: BoardLocation, direction: int, on_board_only: bool = False) -> list[Movement]:
+        rank_offset = location.get_rank()
+        file_offset = location.get_file()
+        
+        new_pattern = []
+        for move in self.pattern:
+            # offset the main move location
+            original_move = move.move
+            new_move_location = BoardLocation(
+                rank_offset + direction * original_move.get_rank(),
+                file_offset + direction * original_move.get_file()
+            )
+            if on_board_only and not new_move_location.is_on_board():
+                continue # the clear spaces of a move that leaves the board are never looked at
+            # offset each group of clear spaces
+            new_clear_spaces = [
+                [
+                    BoardLocation(
+                        rank_offset + direction * cs.get_rank(), # flip dir
+                        file_offset + direction * cs.get_file()
+                    )
+                    for cs in clear_group
+                ]
+                for clear_group in move.need_to_be_clear]
+            # create a new move with updated positions
+            new_move = Movement(new_move_location, new_clear_spaces, move.type)
+            new_pattern.append(new_move)
+
+        return new_pattern
+
+    def compile(self, direction: int) -> list[tuple]:
+        """
+        Returns a table indexed by square (see BoardLocation.get_index) of the pattern moved to that square.
+        Each entry is (movement, target bitboard, clear bitboard, type) and moves that land outside
+        the board are left out. The table is built once per direction and shared by every piece.
+        """
+        if direction not in self.tables:
+            table = []
+            reach = []
+            for index in range(64):
+                location = BoardLocation(index // 8, index % 8)
+                table.append(tuple(
+                    (move, move.move.get_bit(), move.get_clear_mask(), move.type)
+                    for move in self.update_to_position(location, direction, on_board_only=True)
+                ))
+                reach_mask = 0
+                for _, target, clear_mask, _ in table[-1]:
+                    reach_mask |= target | clear_mask
+                reach.append(reach_mask)
+            self.tables[direction] = table
+            self.reaches[direction] = reach
+        return self.tables[direction]
+
+    def get_reach(self, direction: int) -> list[int]:
+        """Returns, for every square, the squares whose occupancy can change the moves from that square."""
+        self.compile(direction)
+        return self.reaches[direction]
+
+class ClassicPiecesMovement:
+    @staticmethod
+    def generate_linear_moves(directions: list[tuple[int, int]], max_distance: int) -> list[Movement]:
+        moves = []
+        for dx, dy in directions:
+            for dist in range(1, max_distance + 1):
+                destination = BoardLocation(dist * dx, dist * dy)
+                clear_path = [BoardLocation(i * dx, i * dy) for i in range(1, dist)]  # spaces before the end
+                if clear_path:
+                    moves.append(Movement(destination, [clear_path], "normal"))
+                    moves.append(Movement(destination, [clear_path], "capture"))
+                else:
+                    # for adjacent steps (like king), no need_to_be_clear
+                    moves.append(Movement(destination, [], "normal"))
+                    moves.append(Movement(destination, [], "capture"))
+        return moves
+
+    pawn_movement = MovementPattern("pawn", [
+        Movement(BoardLocation(1, 0), [], "normal"),
+        Movement(BoardLocation(2, 0), [[BoardLocation(1, 0)]], "normal"),
+        Movement(BoardLocation(1, 1), [], "capture"),
+        Movement(BoardLocation(1, -1), [], "capture")
+    ])
+
+    knight_movement = MovementPattern("knight", [
+        Movement(BoardLocation(2, 1), [], "jump"), Movement(BoardLocation(2, 1), [], "jump-capture"),
+        Movement(BoardLocation(2, -1), [], "jump"), Movement(BoardLocation(2, -1), [], "jump-capture"),
+        Movement(BoardLocation(-2, 1), [], "jump"), Movement(BoardLocation(-2, 1), [], "jump-capture"),
+        Movement(BoardLocation(-2, -1), [], "jump"), Movement(BoardLocation(-2, -1), [], "jump-capture"),
+        Movement(BoardLocation(1, 2), [], "jump"), Movement(BoardLocation(1, 2), [], "jump-capture"),
+        Movement(BoardLocation(1, -2), [], "jump"), Movement(BoardLocation(1, -2), [], "jump-capture"),
+        Movement(BoardLocation(-1, 2), [], "jump"), Movement(BoardLocation(-1, 2), [], "jump-capture"),
+        Movement(BoardLocation(-1, -2), [], "jump"), Movement(BoardLocation(-1, -2), [], "jump-capture")
+    ])
+
+    bishop_movement = MovementPattern(
+        "bishop", generate_linear_moves([(1, 1), (1, -1), (-1, 1), (-1, -1)], 8)
+    )
+
+    rook_movement = MovementPattern(
+        "rook", generate_linear_moves([(1, 0), (-1, 0), (0, 1), (0, -1)], 8)
+    )
+
+    queen_movement = MovementPattern(
+        "queen", generate_linear_moves([
+            (1, 0), (-1, 0), (0, 1), (0, -1),
+            (1, 1), (1, -1), (-1, 1), (-1, -1)
+        ], 8)
+    )
+
+    king_movement = MovementPattern("king", [
+        Movement(BoardLocation(1, 0), [], "normal"), Movement(BoardLocation(1, 0), [], "capture"),
+        Movement(BoardLocation(-1, 0), [], "normal"), Movement(BoardLocation(-1, 0), [], "capture"),
+        Movement(BoardLocation(0, 1), [], "normal"), Movement(BoardLocation(0, 1), [], "capture"),
+        Movement(BoardLocation(0, -1), [], "normal"), Movement(BoardLocation(0, -1), [], "capture"),
+        Movement(BoardLocation(1, 1), [], "normal"), Movement(BoardLocation(1, 1), [], "capture"),
+        Movement(BoardLocation(1, -1), [], "normal"), Movement(BoardLocation(1, -1), [], "capture"),
+        Movement(BoardLocation(-1, 1), [], "normal"), Movement(BoardLocation(-1, 1), [], "capture"),
+        Movement(BoardLocation(-1, -1), [], "normal"), Movement(BoardLocation(-1, -1), [], "capture")
+    ])
+
+# Encoded moves are from_index | to_index << 6 | promotion << 12, with promotion an index into PROMOTION_PIECES
+PROMOTION_PIECES = (None, "n", "b", "r", "q")
+
+def move_to_string(move:int):
+    # Long algebraic notation of an encoded move, like e2e4 or e7e8q
+    promotion = PROMOTION_PIECES[move >> 12 & 7]
+    return f"{SQUARES[move & 63]}{SQUARES[move >> 6 & 63]}{promotion or ''}"
+
+def make_castling_moves():
+    # King destination -> (right, king from, rook from, rook to, squares that must be empty, squares the king must not be attacked on, movement)
+    castling_moves = {}
+    for right, king_from, king_to, rook_from, rook_to in ((WHITE_KINGSIDE, 4, 6, 7, 5), (WHITE_QUEENSIDE, 4, 2, 0, 3),
+                                                          (BLACK_KINGSIDE, 60, 62, 63, 61), (BLACK_QUEENSIDE, 60, 58, 56, 59)):
+        step = 1 if rook_from > king_from else -1
+        empty_mask = 0
+        for index in range(king_from + step, rook_from, step):
+            empty_mask |= 1 << index
+        safe_mask = 1 << (king_from + step) | 1 << king_to
+        castling_moves[king_to] = (right, king_from, rook_from, rook_to, empty_mask, safe_mask, Movement(SQUARES[king_to], [], "castle"))
+    return castling_moves
+
+CASTLING_MOVES = make_castling_moves()
+ALL_SQUARES = (1 << 64) - 1
+
+class Piece:
+    def __init__(self, 
+                 name:str,
+                 pattern:MovementPattern, 
+                 square:BoardLocation, 
+                 worth:int,
+                 colour:str,
+                 direction:int = 1,
+                 special:str = None):
+        self.name = name
+        self.square = square
+        self.worth = worth
+        self.colour = colour
+        self.legal_moves:list[Movement] = [] # set by the board, which takes checks, pins, castling and en passant into account
+        self.pseudo_moves:list[Movement] = [] # moves the pattern allows on the current board, ignoring the king
+        self.pseudo_targets:list[int] = [] # bit of the landing square of every pseudo move
+        self.attack_mask = 0 # bitboard of the squares this piece attacks, whatever is on them
+        self.pattern = pattern
+        self.movement = pattern.compile(direction)[square.get_index()]
+        self.reach_mask = pattern.get_reach(direction)[square.get_index()]
+        self.direction = direction # 1 for white, -1 for black
+        self.zobrist_keys = get_zobrist_keys(name)
+        self.special = special # "king" must never be left in check and can castle, "pawn" captures en passant, promotes and moves 2 squares only from its home rank
+
+    def update(self, opposite_occupancy:int, same_occupancy:int):
+        # Look up the movement pattern from the current square, it is only built once per square
+        self.movement = self.pattern.compile(self.direction)[self.square.get_index()]
+        self.reach_mask = self.pattern.get_reach(self.direction)[self.square.get_index()]
+        # Update the pseudo legal moves and attacks of a piece, occupancy is given as bitboards
+        occupancy = opposite_occupancy | same_occupancy
+        self.pseudo_moves = []
+        self.pseudo_targets = []
+        self.attack_mask = 0
+        # The pawn moves that pass over a square are its first moves, only made from the home rank
+        first_moves_allowed = self.special != "pawn" or self.square.rank == (1 if self.direction == 1 else 6)
+        for move, target, clear_mask, move_type in self.movement:
+            if move_type == "normal": # the path and the landing square must be empty
+                if not (clear_mask | target) & occupancy and (first_moves_allowed or not clear_mask):
+                    self.pseudo_moves.append(move)
+                    self.pseudo_targets.append(target)
+            elif move_type == "capture": # the path must be empty and the landing square must have an enemy piece
+                if not clear_mask & occupancy:
+                    self.attack_mask |= target
+                    if target & opposite_occupancy:
+                        self.pseudo_moves.append(move)
+                        self.pseudo_targets.append(target)
+            elif move_type == "jump": # this is if the piece can jump over other pieces
+                if not target & occupancy:
+                    self.pseudo_moves.append(move)
+                    self.pseudo_targets.append(target)
+            elif move_type == "jump-capture": # this is if the piece can jump over other pieces and capture them
+                self.attack_mask |= target
+                if target & opposite_occupancy:
+                    self.pseudo_moves.append(move)
+                    self.pseudo_targets.append(target)
+
+    def get_attacks(self, occupancy:int):
+        # The squares this piece would attack with a different occupancy, for x-rays and en passant
+        attacks = 0
+        for _, target, clear_mask, move_type in self.movement:
+            if move_type == "jump-capture" or move_type == "capture" and not clear_mask & occupancy:
+                attacks |= target
+        return attacks
+
+    def move(self, new_square:BoardLocation):
+        self.square = new_square
+
+    def set_kind(self, name:str, pattern:MovementPattern, worth:int, special:str = None):
+        # Turns the piece into another kind of piece in place, for promotions
+        self.name = name
+        self.pattern = pattern
+        self.worth = worth
+        self.special = special
+        self.zobrist_keys = get_zobrist_keys(name)
+        self.movement = pattern.compile(self.direction)[self.square.get_index()]
+        self.reach_mask = pattern.get_reach(self.direction)[self.square.get_index()]
+
+class Move:
+    __slots__ = ("piece", "piece_name", "from_square", "to_square", "captured_piece", "castling", "en_passant", "promotion", "check", "checkmate", "san")
+
+    def __init__(self,
+                 piece: Piece,
+                 from_square:BoardLocation,
+                 to_square:BoardLocation,
+                 captured_piece:Piece = None,
+                 castling:bool = False,
+                 en_passant:bool = False,
+                 promotion:Piece = None,
+                 check:bool = False, 
+                 checkmate:bool = False,
+                 san:str = None):
+        self.piece = piece
+        self.piece_name = piece.name # the piece is changed in place by a promotion
+        self.from_square = from_square
+        self.to_square = to_square
+        self.captured_piece = captured_piece
+        self.castling = castling
+        self.en_passant = en_passant # Possible castling to promotion?
+        self.promotion = promotion # Promotion is the piece object that was promoted to
+        self.check = check
+        self.checkmate = checkmate
+        self.san = san # standard algebraic notation without the check suffix, worked out by the board that played the move
+    
+    def __str__(self):
+        return self.notation()
+
+    def notation(self):
+        """
+        Gets a algebraic notation for the move.
+        https://www.chess.com/article/view/chess-notation#algebraic-notation
+        Moves played by a board have their SAN, moves logged by hand fall back to long algebraic notation.
+        """
+        if self.san is not None:
+            notation = self.san
+        elif self.castling:
+            notation = "O-O" if self.to_square.file == 6 else "O-O-O"
+        else:
+            notation = self.piece_name.upper() if self.piece_name.lower() != "p" else ""
+            notation += str(self.from_square)
+            notation += "x" if self.captured_piece else "-"
+            notation += str(self.to_square)
+            if self.promotion:
+                notation += "=" + self.promotion.name.upper()
+        if self.checkmate:
+            notation += "#"
+        elif self.check:
+            notation += "+"
+        return notation
+
+class Board:
+    def __init__(self,
+                 starting_configuration:list[list[str]],
+                 turn:str,
+                 pieces:dict[str, dict],
+                 castling_rights:int = None,
+                 ep_square:int = -1,
+                 halfmove_clock:int = 0,
+                 fullmove_number:int = 1):
+        self.all_pieces:list[Piece] = self.make_pieces(pieces, starting_configuration)
+        self.piece_bitboards, self.colour_bitboards = self.calculate_bitboards()
+        self.turn = turn
+        # Without castling rights every king and rook still on its starting square keeps them
+        self.castling_rights = castling_rights if castling_rights is not None else self.calculate_castling_rights()
+        self.ep_square = ep_square # index of the square a pawn skipped over on the last move, -1 if there is none
+        self.halfmove_clock = halfmove_clock # moves since the last capture or pawn move
+        self.fullmove_number = fullmove_number
+        self.hash = self.calculate_hash() # Zobrist hash of the position, kept up to date by every move
+        self.starting_fen = self.get_fen() # the position before the first move, for saving the game
+        self.moves_stack = []
+        # Undo information of make_move, one entry per ply in preallocated arrays
+        self.ply = 0
+        self.undo_moves = array("I", [0]) * UNDO_STACK_SIZE
+        self.undo_captured:list[Piece] = [None] * UNDO_STACK_SIZE
+        self.undo_captured_index = array("B", [0]) * UNDO_STACK_SIZE # where the taken piece was in all_pieces, so the order comes back too
+        self.undo_castling = array("B", [0]) * UNDO_STACK_SIZE
+        self.undo_ep = array("b", [0]) * UNDO_STACK_SIZE
+        self.undo_halfmove = array("I", [0]) * UNDO_STACK_SIZE
+        self.undo_hash = array("Q", [0]) * UNDO_STACK_SIZE
+        self.stale_pieces:set[Piece] = set() # pieces whose pseudo legal moves and attacks need to be recomputed
+        self.pieces_recomputed = 0 # how many pieces the last recomputation updated
+        self.moves_generated = 0 # moves encoded by generate_moves and iterate_moves, a running total
+        self.pieces_updated = 0 # Piece.update calls of refresh_legal_moves, a running total
+        self.sides_filtered = 0 # update_legal_moves calls of refresh_legal_moves, a running total
+        self.legal_moves_stale = True # checks and pins can change with any move, so legal moves are filtered again after every one
+        self.attack_maps = {"white": 0, "black": 0} # every square each side attacks
+        self.in_check = {"white": False, "black": False}
+        self.invalidate_all()
+
+    def get_occupancy(self):
+        return self.colour_bitboards["white"] | self.colour_bitboards["black"]
+
+    def calculate_bitboards(self):
+        # One occupancy bitboard per piece type (both colours) and one per colour
+        piece_bitboards = {}
+        colour_bitboards = {"white": 0, "black": 0}
+        for piece in self.all_pieces:
+            piece_type = piece.name.lower()
+            piece_bitboards[piece_type] = piece_bitboards.get(piece_type, 0) | piece.square.get_bit()
+            colour_bitboards[piece.colour] |= piece.square.get_bit()
+        return piece_bitboards, colour_bitboards
+
+    def place_piece(self, piece:Piece):
+        # Puts the piece on its square in the bitboards and the mailbox
+        piece_type = piece.name.lower()
+        self.piece_bitboards[piece_type] = self.piece_bitboards.get(piece_type, 0) | piece.square.get_bit()
+        self.colour_bitboards[piece.colour] |= piece.square.get_bit()
+        self.mailbox[piece.square.get_index()] = piece
+        self.hash ^= piece.zobrist_keys[piece.square.get_index()]
+
+    def lift_piece(self, piece:Piece):
+        # Takes the piece off its square in the bitboards and the mailbox
+        piece_type = piece.name.lower()
+        self.piece_bitboards[piece_type] &= ~piece.square.get_bit()
+        self.colour_bitboards[piece.colour] &= ~piece.square.get_bit()
+        self.mailbox[piece.square.get_index()] = None
+        self.hash ^= piece.zobrist_keys[piece.square.get_index()]
+
+    def calculate_hash(self):
+        # Zobrist hash of the position from scratch, moves update self.hash incrementally instead
+        position_hash = ZOBRIST_BLACK_TO_MOVE if self.turn == "black" else 0
+        for piece in self.all_pieces:
+            position_hash ^= piece.zobrist_keys[piece.square.get_index()]
+        position_hash ^= ZOBRIST_CASTLING_KEYS[self.castling_rights]
+        if self.ep_square >= 0:
+            position_hash ^= ZOBRIST_EN_PASSANT_KEYS[self.ep_square & 7]
+        return position_hash
+
+    def calculate_castling_rights(self):
+        castling_rights = 0
+        for right, king_index, rook_index, king_name, rook_name in ((WHITE_KINGSIDE, 4, 7, "K", "R"), (WHITE_QUEENSIDE, 4, 0, "K", "R"),
+                                                                    (BLACK_KINGSIDE, 60, 63, "k", "r"), (BLACK_QUEENSIDE, 60, 56, "k", "r")):
+            king = self.mailbox[king_index]
+            rook = self.mailbox[rook_index]
+            if king is not None and king.name == king_name and rook is not None and rook.name == rook_name:
+                castling_rights |= right
+        return castling_rights
+
+    def check_mailbox(self):
+        # Debug check that the mailbox, the bitboards, the hash and the piece list agree
+        occupancy = self.get_occupancy()
+        pieces = set(self.all_pieces)
+        for index, piece in enumerate(self.mailbox):
+            if piece is None:
+                assert not occupancy >> index & 1, f"mailbox is empty on an occupied square {index}"
+            else:
+                assert piece.square.get_index() == index, f"{piece.name} is on {piece.square} but in the mailbox at {index}"
+                assert piece in pieces, f"{piece.name} on {piece.square} is in the mailbox but not on the board"
+                assert (self.colour_bitboards[piece.colour] & self.piece_bitboards[piece.name.lower()]) >> index & 1, f"{piece.name} on {piece.square} is missing from the bitboards"
+        assert len(self.all_pieces) == sum(piece is not None for piece in self.mailbox), "pieces are missing from the mailbox"
+        assert self.hash == self.calculate_hash(), "the incremental hash does not match the position"
+
+    def invalidate(self, changed_squares:int, *moved_pieces:Piece):
+        # Only the pieces whose moves reach the changed squares (a bitboard) can have different legal moves
+        for piece in self.all_pieces:
+            if piece.reach_mask & changed_squares:
+                self.stale_pieces.add(piece)
+        self.stale_pieces.update(moved_pieces)
+        self.legal_moves_stale = True
+
+    def invalidate_all(self):
+        self.stale_pieces.update(self.all_pieces)
+        self.legal_moves_stale = True
+
+    def refresh_legal_moves(self):
+        # Recomputes the moves and attacks of the stale pieces, then the legal moves of both sides, does nothing if the board has not changed
+        if not self.legal_moves_stale:
+            return
+        white_occupancy = self.colour_bitboards["white"]
+        black_occupancy = self.colour_bitboards["black"]
+        for piece in self.stale_pieces:
+            if piece.colour == "white":
+                piece.update(black_occupancy, white_occupancy)
+            else:
+                piece.update(white_occupancy, black_occupancy)
+        self.pieces_recomputed = len(self.stale_pieces)
+        self.pieces_updated += self.pieces_recomputed
+        self.stale_pieces.clear()
+        white_attacks = 0
+        black_attacks = 0
+        for piece in self.all_pieces:
+            if piece.colour == "white":
+                white_attacks |= piece.attack_mask
+            else:
+                black_attacks |= piece.attack_mask
+        self.attack_maps["white"] = white_attacks
+        self.attack_maps["black"] = black_attacks
+        self.update_legal_moves("white")
+        self.update_legal_moves("black")
+        self.sides_filtered += 2
+        self.legal_moves_stale = False
+
+    def find_king(self, colour:str):
+        for piece in self.all_pieces:
+            if piece.special == "king" and piece.colour == colour:
+                return piece
+        return None
+
+    def update_legal_moves(self, colour:str):
+        """
+        Filters the pseudo legal moves of one side down to the legal ones without playing any of them.
+        Enemy moves that land on the king give the checkers and, through their clear masks, the pin rays:
+        a capture path holding exactly one of our pieces pins it to that path. Non king moves must then
+        land on the check mask and their pin ray, and the king must not step onto an attacked square.
+        """
+        enemy = "black" if colour == "white" else "white"
+        king = self.find_king(colour)
+        if king is None: # nothing to keep safe, as in positions set up without a king
+            for piece in self.all_pieces:
+                if piece.colour == colour:
+                    piece.legal_moves = piece.pseudo_moves
+            self.in_check[colour] = False
+            return
+        king_bit = king.square.get_bit()
+        occupancy = self.get_occupancy()
+        own_occupancy = self.colour_bitboards[colour]
+        danger = self.attack_maps[enemy]
+        checkers = 0
+        check_mask = ALL_SQUARES # squares a non king move has to land on
+        pins = {} # pinned piece -> squares it can still move to
+        for enemy_piece in self.all_pieces:
+            if enemy_piece.colour == colour or not enemy_piece.reach_mask & king_bit:
+                continue
+            enemy_bit = enemy_piece.square.get_bit()
+            for _, target, clear_mask, move_type in enemy_piece.movement:
+                if target != king_bit or (move_type != "capture" and move_type != "jump-capture"):
+                    continue
+                blockers = clear_mask & occupancy if move_type == "capture" else 0
+                if not blockers:
+                    checkers += 1
+                    check_mask &= clear_mask | enemy_bit
+                elif blockers & (blockers - 1) == 0 and blockers & own_occupancy:
+                    pinned_piece = self.mailbox[blockers.bit_length() - 1]
+                    pins[pinned_piece] = pins.get(pinned_piece, ALL_SQUARES) & (clear_mask | enemy_bit)
+            # the squares behind the king are attacked too once it steps out of the way
+            danger |= enemy_piece.get_attacks(occupancy & ~king_bit)
+        self.in_check[colour] = checkers > 0
+
+        for piece in self.all_pieces:
+            if piece.colour != colour:
+                continue
+            if piece is king:
+                piece.legal_moves = [move for move, target in zip(piece.pseudo_moves, piece.pseudo_targets) if not target & danger]
+                if not checkers:
+                    self.add_castling_moves(piece, occupancy, danger)
+                continue
+            if checkers > 1: # only the king can get out of a double check
+                piece.legal_moves = []
+            else:
+                allowed = check_mask & pins.get(piece, ALL_SQUARES)
+                if allowed == ALL_SQUARES:
+                    piece.legal_moves = piece.pseudo_moves
+                else:
+                    piece.legal_moves = [move for move, target in zip(piece.pseudo_moves, piece.pseudo_targets) if target & allowed]
+            if piece.special == "pawn" and colour == self.turn and self.ep_square >= 0:
+                self.add_en_passant_moves(piece, king, occupancy)
+
+    def add_castling_moves(self, king:Piece, occupancy:int, danger:int):
+        king_index = king.square.get_index()
+        for right, king_from, rook_from, _, empty_mask, safe_mask, movement in CASTLING_MOVES.values():
+            if not self.castling_rights & right or king_index != king_from:
+                continue
+            rook = self.mailbox[rook_from]
+            if rook is None or rook.colour != king.colour or empty_mask & occupancy or safe_mask & danger:
+                continue
+            if king.legal_moves is king.pseudo_moves:
+                king.legal_moves = list(king.pseudo_moves)
+            king.legal_moves.append(movement)
+
+    def add_en_passant_moves(self, pawn:Piece, king:Piece, occupancy:int):
+        # En passant takes two pieces off the same rank, so the position after it is checked directly
+        ep_bit = 1 << self.ep_square
+        captured_index = (pawn.square.get_index() & ~7) | (self.ep_square & 7)
+        captured_pawn = self.mailbox[captured_index]
+        if captured_pawn is None or captured_pawn.colour == pawn.colour:
+            return
+        for move, target, clear_mask, move_type in pawn.movement:
+            if target != ep_bit or move_type != "capture" or clear_mask & occupancy:
+                continue
+            occupancy_after = (occupancy & ~pawn.square.get_bit() & ~(1 << captured_index)) | ep_bit
+            king_bit = king.square.get_bit()
+            for enemy_piece in self.all_pieces:
+                if enemy_piece.colour != pawn.colour and enemy_piece is not captured_pawn and enemy_piece.get_attacks(occupancy_after) & king_bit:
+                    return
+            if pawn.legal_moves is pawn.pseudo_moves:
+                pawn.legal_moves = list(pawn.pseudo_moves)
+            pawn.legal_moves.append(move)
+
+    def get_piece_at_location(self, location:BoardLocation):
+        try:
+            if not location.is_on_board():
+                return None
+            return self.mailbox[location.get_index()]
+        except AttributeError:
+            return None
+    
+    def attacking(self, square:BoardLocation): # Returns a list of pieces that are attacking the square
+        self.refresh_legal_moves()
+        square_bit = square.get_bit()
+        if not (self.attack_maps["white"] | self.attack_maps["black"]) & square_bit:
+            return []
+        return [piece for piece in self.all_pieces if piece.attack_mask & square_bit]
+
+    def is_square_attacked(self, square:BoardLocation, colour:str):
+        # Whether any piece of colour attacks the square
+        self.refresh_legal_moves()
+        return bool(self.attack_maps[colour] & square.get_bit())
+
+    def is_check(self):
+        self.refresh_legal_moves()
+        return self.in_check[self.turn]
+
+    def has_legal_moves(self):
+        self.refresh_legal_moves()
+        for piece in self.all_pieces:
+            if piece.colour == self.turn and piece.legal_moves:
+                return True
+        return False
+
+    def is_checkmate(self):
+        return self.is_check() and not self.has_legal_moves()
+
+    def is_stalemate(self):
+        return not self.is_check() and not self.has_legal_moves()
+
+    def count_repetitions(self):
+        """
+        How many times the current position was on the board before. A capture or pawn move can never be undone, so
+        only the last halfmove_clock plies can hold it, and only every other one has the same side to move. The hash of
+        each of those positions is kept by make_move, so this is a short scan of integers.
+        """
+        count = 0
+        first_ply = max(self.ply - self.halfmove_clock, 0) # before the first move played on this board nothing is known
+        for ply in range(self.ply - 4, first_ply - 1, -2):
+            if self.undo_hash[ply] == self.hash:
+                count += 1
+        return count
+
+    def is_repetition(self, times:int = 3):
+        # Whether the position has now been on the board times times
+        return self.count_repetitions() >= times - 1
+
+    def is_fifty_moves(self):
+        # Fifty moves each without a capture or pawn move
+        return self.halfmove_clock >= 100
+
+    def get_result(self):
+        """
+        The result of the game and why it ended, like ("1-0", "checkmate"), or None while it goes on.
+        A threefold repetition or fifty moves end the game straight away, without waiting for a claim.
+        """
+        if not self.has_legal_moves():
+            if self.is_check():
+                return ("0-1" if self.turn == "white" else "1-0"), "checkmate"
+            return "1/2-1/2", "stalemate"
+        if self.is_fifty_moves():
+            return "1/2-1/2", "fifty-move rule"
+        if self.is_repetition():
+            return "1/2-1/2", "threefold repetition"
+        return None
+
+    def generate_moves(self):
+        # The legal moves of the side to move encoded for make_move, a promotion once for every piece it can become
+        self.refresh_legal_moves()
+        moves = []
+        last_rank = 7 if self.turn == "white" else 0
+        for piece in self.all_pieces:
+            if piece.colour != self.turn:
+                continue
+            from_index = piece.square.get_index()
+            for legal_move in piece.legal_moves:
+                move = from_index | legal_move.move.get_index() << 6
+                if piece.special == "pawn" and legal_move.move.rank == last_rank:
+                    for promotion in range(len(PROMOTION_PIECES) - 1, 0, -1):
+                        moves.append(move | promotion << 12)
+                else:
+                    moves.append(move)
+        self.moves_generated += len(moves)
+        return moves
+
+    def iterate_moves(self, hash_move:int = 0, order_quiet_moves = None):
+        """
+        The moves of generate_moves in stages, each only encoded once the stage before it runs out: the hash move
+        if it is legal, captures with the most valuable victim first and the least valuable attacker first between
+        equal victims, promotions, then quiet moves, in the order order_quiet_moves (a function of the list) gives
+        them if set. Only the encoding and ordering are staged. refresh_legal_moves has already updated the stale
+        pieces and filtered the legal moves of both sides before the first stage, so a consumer that stops early,
+        on a cutoff, skips the encoding, sorting and ordering of the later stages but none of the generation.
+        The board can be changed between moves as long as it is put back, every stage works from what it was at the start.
+        """
+        self.refresh_legal_moves()
+        last_rank = 7 if self.turn == "white" else 0
+        # The legal move lists are replaced, never changed, when the board is recomputed, so they can be kept
+        pieces = [(piece, piece.square.get_index(), piece.legal_moves, piece.attack_mask, piece.special == "pawn" and piece.square.rank + piece.direction == last_rank)
+                  for piece in self.all_pieces if piece.colour == self.turn and piece.legal_moves]
+        mailbox = self.mailbox
+        ep_square = self.ep_square
+        if hash_move and self.is_legal_move(hash_move):
+            self.moves_generated += 1
+            yield hash_move
+
+        # Only a piece that attacks an enemy piece, or a pawn that attacks the en passant square, can capture
+        targets = self.colour_bitboards["black" if self.turn == "white" else "white"] | (1 << ep_square if ep_square >= 0 else 0)
+        captures = []
+        for piece, from_index, legal_moves, attack_mask, promotes in pieces:
+            if not attack_mask & targets:
+                continue
+            for legal_move in legal_moves:
+                to_index = legal_move.move.get_index()
+                victim = mailbox[to_index]
+                if victim is None and (piece.special != "pawn" or to_index != ep_square):
+                    continue
+                order = (victim.worth if victim is not None else piece.worth) * 10 - piece.worth
+                move = from_index | to_index << 6
+                if promotes:
+                    captures.extend((order, move | promotion << 12) for promotion in range(len(PROMOTION_PIECES) - 1, 0, -1))
+                else:
+                    captures.append((order, move))
+        captures.sort(key=lambda capture: capture[0], reverse=True) # stable, so ties keep the order of the pieces
+        self.moves_generated += len(captures)
+        for _, move in captures:
+            if move != hash_move:
+                yield move
+
+        promotions = []
+        for piece, from_index, legal_moves, attack_mask, promotes in pieces:
+            if promotes:
+                for legal_move in legal_moves:
+                    to_index = legal_move.move.get_index()
+                    if mailbox[to_index] is None:
+                        promotions.extend(from_index | to_index << 6 | promotion << 12 for promotion in range(len(PROMOTION_PIECES) - 1, 0, -1))
+        self.moves_generated += len(promotions)
+        for move in promotions:
+            if move != hash_move:
+                yield move
+
+        quiet_moves = []
+        for piece, from_index, legal_moves, attack_mask, promotes in pieces:
+            if promotes:
+                continue
+            is_pawn = piece.special == "pawn"
+            for legal_move in legal_moves:
+                to_index = legal_move.move.get_index()
+                if mailbox[to_index] is None and (not is_pawn or to_index != ep_square):
+                    move = from_index | to_index << 6
+                    if move != hash_move:
+                        quiet_moves.append(move)
+        self.moves_generated += len(quiet_moves)
+        if order_quiet_moves is not None and len(quiet_moves) > 1:
+            quiet_moves = order_quiet_moves(quiet_moves)
+        yield from quiet_moves
+
+    def is_legal_move(self, move:int):
+        # Whether an encoded move, like a hash move that may come from another position, is legal here
+        self.refresh_legal_moves()
+        piece = self.mailbox[move & 63]
+        if piece is None or piece.colour != self.turn:
+            return False
+        to_index = move >> 6 & 63
+        promotion = move >> 12 & 7
+        for legal_move in piece.legal_moves:
+            if legal_move.move.get_index() == to_index:
+                promotes = piece.special == "pawn" and legal_move.move.rank == (7 if self.turn == "white" else 0)
+                return promotion != 0 and promotion < len(PROMOTION_PIECES) if promotes else promotion == 0
+        return False
+
+    def make_pieces(self, pieces_dict:dict[str, dict], starting_configuration:list[list[str]]):
+        for piece_name in pieces_dict.keys():
+            if not piece_name.lower() == piece_name:
+                pieces_dict[piece_name.lower()] = pieces_dict.pop(piece_name) # Change the key to lowercase
+
+        self.piece_kinds = pieces_dict # pattern, worth and special of every piece type, for promotions
+        pieces = []
+        self.mailbox:list[Piece] = [None] * 64 # the piece on every square, indexed like the bitboards
+        for rank in range(8):
+            for file in range(8):
+                piece_name = starting_configuration[rank][file]
+                if piece_name is not None:
+                    pieces.append(Piece(**pieces_dict[piece_name.lower()], name=piece_name, square=BoardLocation(rank, file), colour="white" if piece_name.isupper() else "black", direction=1 if piece_name.isupper() else -1))
+                    self.mailbox[rank * 8 + file] = pieces[-1]
+                    if log.enabled:
+                        logger.debug("Piece %s created at %d, %d", piece_name, rank, file)
+        
+        return pieces
+
+    def get_san(self, move:int, moves:list[int] = None):
+        """
+        Standard algebraic notation of a legal move of the side to move without the check suffix, like "Nbd7", "exd6",
+        "O-O" or "e8=Q". The legal moves tell pieces of the same kind apart and are generated if not given.
+        """
+        from_index = move & 63
+        to_index = move >> 6 & 63
+        promotion = move >> 12 & 7
+        piece = self.mailbox[from_index]
+        if piece.special == "king" and abs((from_index & 7) - (to_index & 7)) == 2:
+            return "O-O" if to_index & 7 == 6 else "O-O-O"
+        is_capture = self.mailbox[to_index] is not None or (piece.special == "pawn" and to_index == self.ep_square)
+        if piece.special == "pawn":
+            san = "abcdefgh"[from_index & 7] + "x" if is_capture else ""
+            san += str(SQUARES[to_index])
+            if promotion:
+                san += "=" + PROMOTION_PIECES[promotion].upper()
+            return san
+        if moves is None:
+            moves = self.generate_moves()
+        ambiguous = same_file = same_rank = False
+        for other_move in moves:
+            other_from = other_move & 63
+            if other_move >> 6 & 63 == to_index and other_from != from_index and self.mailbox[other_from].name == piece.name:
+                ambiguous = True
+                same_file = same_file or other_from & 7 == from_index & 7
+                same_rank = same_rank or other_from >> 3 == from_index >> 3
+        san = piece.name.upper()
+        if ambiguous:
+            # The file if that is enough to tell the pieces apart, then the rank, then both
+            if not same_file:
+                san += "abcdefgh"[from_index & 7]
+            elif not same_rank:
+                san += str(from_index // 8 + 1)
+            else:
+                san += str(SQUARES[from_index])
+        return san + ("x" if is_capture else "") + str(SQUARES[to_index])
+
+    def move_to_san(self, move:int, moves:list[int] = None):
+        # get_san with the + or # suffix, found by playing the move and taking it back
+        san = self.get_san(move, moves)
+        self.make_move(move)
+        if self.is_check():
+            san += "+" if self.has_legal_moves() else "#"
+        self.unmake_move()
+        return san
+
+    def parse_san(self, san:str, moves:list[int] = None):
+        """
+        The legal move of the side to move that a SAN stands for, encoded for make_move. Check and annotation
+        suffixes are ignored. Raises SanError if the SAN is not a legal move, or is ambiguous.
+        """
+        if moves is None:
+            moves = self.generate_moves()
+        text = san.rstrip("+#!?")
+        if text in ("O-O", "O-O-O", "0-0", "0-0-0"):
+            king_file = 6 if len(text) == 3 else 2
+            for move in moves:
+                piece = self.mailbox[move & 63]
+                if piece.special == "king" and move >> 6 & 7 == king_file and abs((move & 7) - king_file) == 2:
+                    return move
+            raise SanError(f"{san} is not legal in {self.get_fen()}")
+        match = SAN_PATTERN.fullmatch(text)
+        if match is None:
+            raise SanError(f"{san!r} is not a move in SAN")
+        piece_letter, from_file, from_rank, to_square, promotion_letter = match.groups()
+        piece_name = piece_letter.lower() if piece_letter else "p"
+        to_index = (int(to_square[1]) - 1) * 8 + "abcdefgh".index(to_square[0])
+        promotion = PROMOTION_PIECES.index(promotion_letter.lower()) if promotion_letter else 0
+        found = None
+        for move in moves:
+            from_index = move & 63
+            if move >> 6 & 63 != to_index or move >> 12 != promotion or self.mailbox[from_index].name.lower() != piece_name:
+                continue
+            if (from_file and from_index & 7 != "abcdefgh".index(from_file)) or (from_rank and from_index >> 3 != int(from_rank) - 1):
+                continue
+            if found is not None:
+                raise SanError(f"{san} is ambiguous in {self.get_fen()}")
+            found = move
+        if found is None:
+            raise SanError(f"{san} is not legal in {self.get_fen()}")
+        return found
+
+    def get_position(self):
+        # Gets the position (as in chess position) of the board and returns it as how starting_configuration is
+        return [[piece.name if piece else None for piece in self.mailbox[rank * 8:rank * 8 + 8]] for rank in range(8)]
+
+    def get_fen(self):
+        """
+        Returns the FEN representation of the board
+        Field 1: Pieces locations
+        Field 2: Active colour
+        Field 3: Castling rights
+        Field 4: En passant target square
+        Field 5: Halfmove clock
+        Field 6: Fullmove number
+        https://www.chess.com/terms/fen-chess#what-is-fen
+
+        To copy for chess.com do f'[FEN {fen_string}]'
+        """
+        castling_rights = [letter for right, letter in CASTLING_LETTERS if self.castling_rights & right]
+        en_passant_target = str(SQUARES[self.ep_square]) if self.ep_square >= 0 else "-"
+        halfmove_clock = self.halfmove_clock
+        fullmove_number = self.fullmove_number
+
+        # Pieces Locations, read from the mailbox from rank 8 down to rank 1
+        ranks = []
+        for rank in range(7, -1, -1):
+            rank_string = ""
+            empty_spaces = 0
+            for piece in self.mailbox[rank * 8:rank * 8 + 8]:
+                if piece is None:
+                    empty_spaces += 1
+                else:
+                    if empty_spaces > 0:
+                        rank_string += str(empty_spaces)
+                        empty_spaces = 0
+                    rank_string += piece.name
+            if empty_spaces > 0:
+                rank_string += str(empty_spaces)
+            ranks.append(rank_string)
+        fen_string = "/".join(ranks)
+        # Active Colour
+        fen_string += " " + self.turn[0]
+        # Castling rights
+        fen_string += " " + ("".join(castling_rights) if len(castling_rights) > 0 else "-")
+        # En passant target square
+        fen_string += " " + (en_passant_target if en_passant_target is not None else "-")
+        # Halfmove clock
+        fen_string += " " + str(halfmove_clock)
+        # Fullmove number
+        fen_string += " " + str(fullmove_number)
+        return fen_string
+    
+    def log_move(self, piece:Piece, move:BoardLocation, takes_piece:Piece = None): # Function made by kingsley
+        self.moves_stack.append(Move(piece, piece.square, move, takes_piece))
+
+    def make_move(self, move:int):
+        """
+        Plays a move encoded as from_index | to_index << 6 | promotion << 12 on the board in place, without
+        checking that it is legal, logging it or printing. Castling is the king moving two squares and en
+        passant a pawn moving onto the en passant square. The undo information goes into arrays allocated
+        up front, so unmake_move can take it back exactly and searches never copy the board.
+        """
+        from_index = move & 63
+        to_index = move >> 6 & 63
+        promotion = move >> 12 & 7
+        piece = self.mailbox[from_index]
+        is_pawn = piece.special == "pawn"
+        captured_piece = self.mailbox[to_index]
+        if is_pawn and to_index == self.ep_square:
+            captured_piece = self.mailbox[(from_index & ~7) | (to_index & 7)] # en passant takes the pawn beside
+        ply = self.ply
+        if ply == len(self.undo_moves):
+            self.grow_undo_stack()
+        self.undo_moves[ply] = move
+        self.undo_captured[ply] = captured_piece
+        self.undo_castling[ply] = self.castling_rights
+        self.undo_ep[ply] = self.ep_square
+        self.undo_halfmove[ply] = self.halfmove_clock
+        self.undo_hash[ply] = self.hash
+        self.ply = ply + 1
+
+        changed_squares = 1 << from_index | 1 << to_index
+        if captured_piece is not None:
+            changed_squares |= captured_piece.square.get_bit()
+            captured_index = self.all_pieces.index(captured_piece)
+            self.undo_captured_index[ply] = captured_index
+            del self.all_pieces[captured_index]
+            self.lift_piece(captured_piece)
+            self.stale_pieces.discard(captured_piece)
+        self.lift_piece(piece)
+        piece.move(SQUARES[to_index])
+        if promotion:
+            self.promote(piece, PROMOTION_PIECES[promotion])
+        self.place_piece(piece)
+        rook = None
+        if piece.special == "king" and to_index in CASTLING_MOVES and CASTLING_MOVES[to_index][1] == from_index:
+            _, _, rook_from, rook_to, _, _, _ = CASTLING_MOVES[to_index]
+            rook = self.mailbox[rook_from]
+            self.lift_piece(rook)
+            rook.move(SQUARES[rook_to])
+            self.place_piece(rook)
+            changed_squares |= 1 << rook_from | 1 << rook_to
+        if rook is not None:
+            self.invalidate(changed_squares, piece, rook)
+        else:
+            self.invalidate(changed_squares, piece)
+
+        self.hash ^= ZOBRIST_CASTLING_KEYS[self.castling_rights]
+        self.castling_rights &= CASTLING_RIGHTS_KEPT[from_index] & CASTLING_RIGHTS_KEPT[to_index]
+        self.hash ^= ZOBRIST_CASTLING_KEYS[self.castling_rights]
+        if self.ep_square >= 0:
+            self.hash ^= ZOBRIST_EN_PASSANT_KEYS[self.ep_square & 7]
+        if is_pawn and (to_index - from_index == 16 or from_index - to_index == 16):
+            self.ep_square = (from_index + to_index) >> 1
+            self.hash ^= ZOBRIST_EN_PASSANT_KEYS[self.ep_square & 7]
+        else:
+            self.ep_square = -1
+        if is_pawn or captured_piece is not None:
+            self.halfmove_clock = 0
+        else:
+            self.halfmove_clock += 1
+        if self.turn == "black":
+            self.fullmove_number += 1
+        self.turn = "black" if self.turn == "white" else "white" # switch turn
+        self.hash ^= ZOBRIST_BLACK_TO_MOVE
+
+    def unmake_move(self):
+        # Takes back the last make_move, restoring the position, castling rights, en passant square, clocks and hash
+        self.ply -= 1
+        ply = self.ply
+        move = self.undo_moves[ply]
+        from_index = move & 63
+        to_index = move >> 6 & 63
+        self.turn = "white" if self.turn == "black" else "black" # Switch turn back
+        if self.turn == "black":
+            self.fullmove_number -= 1
+        piece = self.mailbox[to_index]
+        changed_squares = 1 << from_index | 1 << to_index
+        self.lift_piece(piece)
+        if move >> 12 & 7:
+            self.promote(piece, "p")
+        piece.move(SQUARES[from_index])
+        self.place_piece(piece)
+        rook = None
+        if piece.special == "king" and to_index in CASTLING_MOVES and CASTLING_MOVES[to_index][1] == from_index:
+            _, _, rook_from, rook_to, _, _, _ = CASTLING_MOVES[to_index]
+            rook = self.mailbox[rook_to]
+            self.lift_piece(rook)
+            rook.move(SQUARES[rook_from])
+            self.place_piece(rook)
+            changed_squares |= 1 << rook_from | 1 << rook_to
+        captured_piece = self.undo_captured[ply]
+        if captured_piece is not None:
+            self.undo_captured[ply] = None
+            changed_squares |= captured_piece.square.get_bit()
+            self.all_pieces.insert(self.undo_captured_index[ply], captured_piece)
+            self.place_piece(captured_piece)
+            self.stale_pieces.add(captured_piece)
+        if rook is not None:
+            self.invalidate(changed_squares, piece, rook)
+        else:
+            self.invalidate(changed_squares, piece)
+        self.castling_rights = self.undo_castling[ply]
+        self.ep_square = self.undo_ep[ply]
+        self.halfmove_clock = self.undo_halfmove[ply]
+        self.hash = self.undo_hash[ply]
+
+    def promote(self, piece:Piece, piece_type:str):
+        # Changes the kind of a piece that is off the board, white pieces are named in upper case
+        kind = self.piece_kinds[piece_type]
+        piece.set_kind(piece_type.upper() if piece.colour == "white" else piece_type, kind["pattern"], kind["worth"], kind.get("special"))
+
+    def grow_undo_stack(self):
+        size = len(self.undo_moves)
+        self.undo_moves.extend(array("I", [0]) * size)
+        self.undo_captured.extend([None] * size)
+        self.undo_captured_index.extend(array("B", [0]) * size)
+        self.undo_castling.extend(array("B", [0]) * size)
+        self.undo_ep.extend(array("b", [0]) * size)
+        self.undo_halfmove.extend(array("I", [0]) * size)
+        self.undo_hash.extend(array("Q", [0]) * size)
+
+    def play_move(self, piece:Piece, move:BoardLocation, promotion:str = "q"):
+        # Plays and logs a move without checking that it is legal or printing, returns the taken piece
+        encoded_move = piece.square.get_index() | move.get_index() << 6
+        if piece.special == "pawn" and move.rank == (7 if piece.colour == "white" else 0):
+            encoded_move |= PROMOTION_PIECES.index(promotion) << 12
+        san = self.get_san(encoded_move)
+        castling = piece.special == "king" and abs(piece.square.file - move.file) == 2
+        en_passant = piece.special == "pawn" and move.get_index() == self.ep_square
+        self.log_move(piece, move) # Log move
+        self.make_move(encoded_move)
+        logged_move:Move = self.moves_stack[-1]
+        logged_move.captured_piece = self.undo_captured[self.ply - 1]
+        logged_move.castling = castling
+        logged_move.en_passant = en_passant
+        logged_move.promotion = piece if encoded_move >> 12 else None
+        logged_move.san = san
+        logged_move.check = self.is_check()
+        logged_move.checkmate = logged_move.check and not self.has_legal_moves()
+        return logged_move.captured_piece
+
+    def undo_move(self):
+        # Takes back the last logged move without printing, returns it or None if no moves were played
+        if not self.moves_stack:
+            return None
+        last_move:Move = self.moves_stack.pop()
+        self.unmake_move()
+        return last_move
+
+    def pop(self, amount_of_moves:int):
+        for _ in range(amount_of_moves):
+            last_move = self.undo_move()
+            if last_move is None:
+                break
+            if __debug__:
+                self.check_mailbox()
+            if log.enabled:
+                logger.info("Took back %s", last_move, extra={"fields": {"event": "undo", "move": last_move.notation(), "ply": self.ply}})
+
+    def move(self, piece_location:BoardLocation, move:BoardLocation, promotion:str = "q"):
+        piece = self.get_piece_at_location(piece_location)
+        if piece:
+            self.refresh_legal_moves()
+            if not piece.colour == self.turn:
+                if log.enabled:
+                    logger.info("Not your turn")
+                return False
+            for legal_move in piece.legal_moves:
+                if legal_move.move == move:
+                    from_square = piece.square
+                    self.play_move(piece, move, promotion)
+                    if __debug__:
+                        self.check_mailbox()
+                    if log.enabled:
+                        logged_move = self.moves_stack[-1]
+                        logger.info("Played %s", logged_move, extra={"fields": {"event": "move", "move": logged_move.notation(), "from": str(from_square), "to": str(move), "ply": self.ply, "fen": self.get_fen()}})
+                    return True
+        if log.enabled:
+            logger.info("Move %s is not legal", move)
+        return False
+
+def classic_pieces():
+    # Movement pattern and worth of every classic piece, keyed by the lowercase piece name
+    return {
+        "p": {
+            "pattern": ClassicPiecesMovement.pawn_movement,
+            "special": "pawn",
+            "worth": 1,
+        },
+        "r": {
+            "pattern": ClassicPiecesMovement.rook_movement,
+            "worth": 5,
+        },
+        "n": {
+            "pattern": ClassicPiecesMovement.knight_movement,
+            "worth": 3,
+        },
+        "b": {
+            "pattern": ClassicPiecesMovement.bishop_movement,
+            "worth": 3,
+        },
+        "q": {
+            "pattern": ClassicPiecesMovement.queen_movement,
+            "worth": 9,
+        },
+        "k": {
+            "pattern": ClassicPiecesMovement.king_movement,
+            "special": "king",
+            "worth": 0,
+        },
+    }
+
+def initialize_classic_board(starting_configuration = BOARD_CONFIG, turn = "white", castling_rights = None, ep_square = -1, halfmove_clock = 0, fullmove_number = 1):
+    return Board(starting_configuration=starting_configuration, turn=turn, pieces=classic_pieces(), castling_rights=castling_rights,
+                 ep_square=ep_square, halfmove_clock=halfmove_clock, fullmove_number=fullmove_number)
+
+def classic_board_from_fen(fen:str):
+    # Builds a board from a full six field FEN, raises FenError if it is not a legal position
+    return parse_fen(fen).to_board()
+
+class FenError(ValueError):
+    pass
+
+class SanError(ValueError):
+    pass
+
+SAN_PATTERN = re.compile(r"([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([NBRQ]))?") # piece, from file and rank, to, promotion
+
+FEN_PIECES = "pnbrqkPNBRQK"
+FEN_RANK_CACHE_SIZE = 65536
+
+def make_castling_fields():
+    # Every castling field a strict FEN may have, KQkq letters in that order or "-", and the rights it stands for
+    fields = {"-": 0}
+    for rights in range(1, 16):
+        fields["".join(letter for right, letter in CASTLING_LETTERS if rights & right)] = rights
+    return fields
+
+CASTLING_FIELDS = make_castling_fields()
+EN_PASSANT_FIELDS = {"-": -1}
+EN_PASSANT_FIELDS.update({str(SQUARES[index]): index for index in list(range(16, 24)) + list(range(40, 48))})
+# The king and rook squares every set of castling rights needs
+CASTLING_HOME_SQUARES = [tuple(home for right, *home in ((WHITE_KINGSIDE, 4, 7, "K", "R"), (WHITE_QUEENSIDE, 4, 0, "K", "R"), (BLACK_KINGSIDE, 60, 63, "k", "r"), (BLACK_QUEENSIDE, 60, 56, "k", "r"))
+                               if rights & right) for rights in range(16)]
+
+class Position:
+    """
+    A position read from a FEN or EPD, kept as plain fields so hundreds of thousands of them can be read a second.
+    A Board, with its pieces and moves, is only built from it by to_board.
+    """
+    def __init__(self, squares:list[str], turn:str, castling_rights:int, ep_square:int, halfmove_clock:int = 0, fullmove_number:int = 1, operations:dict[str, list[str]] = None):
+        self.squares = squares # piece name or None on every square, indexed like the bitboards
+        self.turn = turn
+        self.castling_rights = castling_rights
+        self.ep_square = ep_square
+        self.halfmove_clock = halfmove_clock
+        self.fullmove_number = fullmove_number
+        self.operations = operations # EPD operations, opcode -> operands
+
+    def get_configuration(self):
+        # The squares as a starting configuration, rank 1 first
+        return [list(self.squares[rank * 8:rank * 8 + 8]) for rank in range(8)]
+
+    def get_fen(self):
+        ranks = []
+        for rank in range(7, -1, -1):
+            rank_string = ""
+            empty_spaces = 0
+            for piece_name in self.squares[rank * 8:rank * 8 + 8]:
+                if piece_name is None:
+                    empty_spaces += 1
+                    continue
+                if empty_spaces > 0:
+                    rank_string += str(empty_spaces)
+                    empty_spaces = 0
+                rank_string += piece_name
+            if empty_spaces > 0:
+                rank_string += str(empty_spaces)
+            ranks.append(rank_string)
+        castling = "".join(letter for right, letter in CASTLING_LETTERS if self.castling_rights & right) or "-"
+        en_passant = str(SQUARES[self.ep_square]) if self.ep_square >= 0 else "-"
+        return f"{'/'.join(ranks)} {self.turn[0]} {castling} {en_passant} {self.halfmove_clock} {self.fullmove_number}"
+
+    def to_board(self):
+        board = initialize_classic_board(self.get_configuration(), self.turn, self.castling_rights, self.ep_square, self.halfmove_clock, self.fullmove_number)
+        # The one rule the fields alone cannot check, the side that just moved must not have left its king in check
+        board.refresh_legal_moves()
+        if board.in_check["black" if self.turn == "white" else "white"]:
+            raise FenError("the side not to move is in check")
+        return board
+
+class FenRankCache(dict):
+    """
+    Rank field of a FEN -> its 8 squares. The same ranks come up again and again in a file of positions,
+    so each one is only read once, a rank that is not in the cache yet is read by __missing__.
+    """
+    def __missing__(self, rank_field:str):
+        squares = []
+        after_digit = False
+        for char in rank_field:
+            if "1" <= char <= "8":
+                if after_digit:
+                    raise FenError(f"two numbers in a row in rank {rank_field!r}")
+                squares.extend([None] * int(char))
+                after_digit = True
+            elif char in FEN_PIECES:
+                squares.append(char)
+                after_digit = False
+            else:
+                raise FenError(f"unknown piece {char!r} in rank {rank_field!r}")
+        if len(squares) != 8:
+            raise FenError(f"rank {rank_field!r} has {len(squares)} squares instead of 8")
+        if len(self) >= FEN_RANK_CACHE_SIZE:
+            self.clear()
+        self[rank_field] = squares = tuple(squares)
+        return squares
+
+fen_ranks = FenRankCache()
+
+def parse_position_fields(placement:str, active_colour:str, castling:str, en_passant:str):
+    """
+    Reads and checks the four position fields shared by FEN and EPD, raising FenError for anything that is
+    not a legal position: bad ranks, a missing or extra king, pawns on the back ranks, castling rights
+    without the king and rook at home, or an en passant square no pawn could have skipped over.
+    """
+    rank_fields = placement.split("/")
+    if len(rank_fields) != 8:
+        raise FenError(f"{len(rank_fields)} ranks instead of 8")
+    if placement.count("K") != 1 or placement.count("k") != 1:
+        raise FenError("each side needs exactly one king")
+    if "P" in rank_fields[0] or "p" in rank_fields[0] or "P" in rank_fields[7] or "p" in rank_fields[7]:
+        raise FenError("pawn on the first or last rank")
+    # Unrolled from rank 1 up, this is the hot path of loading a file of positions
+    squares = [*fen_ranks[rank_fields[7]], *fen_ranks[rank_fields[6]], *fen_ranks[rank_fields[5]], *fen_ranks[rank_fields[4]],
+               *fen_ranks[rank_fields[3]], *fen_ranks[rank_fields[2]], *fen_ranks[rank_fields[1]], *fen_ranks[rank_fields[0]]]
+    if active_colour == "w":
+        turn = "white"
+    elif active_colour == "b":
+        turn = "black"
+    else:
+        raise FenError(f"active colour {active_colour!r} is not w or b")
+    castling_rights = CASTLING_FIELDS.get(castling)
+    if castling_rights is None:
+        raise FenError(f"bad castling field {castling!r}")
+    ep_square = EN_PASSANT_FIELDS.get(en_passant)
+    if ep_square is None:
+        raise FenError(f"bad en passant field {en_passant!r}")
+    for king_index, rook_index, king_name, rook_name in CASTLING_HOME_SQUARES[castling_rights]:
+        if squares[king_index] != king_name or squares[rook_index] != rook_name:
+            raise FenError(f"castling right {castling} without the king and rook on their starting squares")
+    if ep_square >= 0:
+        # The pawn that just moved two squares is in front of the en passant square, the squares it crossed are empty
+        pawn_index, start_index, pawn_name = (ep_square - 8, ep_square + 8, "p") if turn == "white" else (ep_square + 8, ep_square - 8, "P")
+        if ep_square // 8 != (5 if turn == "white" else 2) or squares[pawn_index] != pawn_name or squares[ep_square] is not None or squares[start_index] is not None:
+            raise FenError(f"en passant square {en_passant} without a pawn that skipped over it")
+    return squares, turn, castling_rights, ep_square
+
+def parse_clock(field:str, name:str, minimum:int):
+    if not field.isdecimal() or not field.isascii() or int(field) < minimum:
+        raise FenError(f"bad {name} {field!r}")
+    return int(field)
+
+def parse_fen(fen:str) -> Position:
+    # Strict: all six fields, each checked, see parse_position_fields
+    fields = fen.split()
+    if len(fields) != 6:
+        raise FenError(f"{len(fields)} fields instead of 6 in {fen!r}")
+    squares, turn, castling_rights, ep_square = parse_position_fields(*fields[:4])
+    return Position(squares, turn, castling_rights, ep_square, parse_clock(fields[4], "halfmove clock", 0), parse_clock(fields[5], "fullmove number", 1))
@@ -0,0 +1,80 @@
+"""
+Piece sprites shared by every board and game, each image is loaded from disk once per process
+"""
+from pathlib import Path
+
+import pygame as _pygame
+from gui import text_cache
+from settings import settings
+
+SPRITES_FOLDER = Path("Assets") / "Sprites"
+PIECE_NAMES = "pnbrqk"
+
+WHITE = tuple(settings["colors"]["white"])
+BLACK = tuple(settings["colors"]["black"])
+
+class SpriteAtlas:
+    """
+    Sprites are kept in pages, one per (theme, size), each holding the scaled sprite of every
+    (colour, piece). A board draws from one page, so switching themes only swaps the page it uses.
+    """
+    def __init__(self, folder:Path = SPRITES_FOLDER):
+        self.folder = folder
+        self.images:dict[tuple, _pygame.Surface] = {} # (theme, colour, piece) -> image as loaded, None if there is no file
+        self.pages:dict[tuple, dict] = {} # (theme, size) -> {(colour, piece): scaled sprite}
+        self.loads = 0 # images read from disk, for the benchmarks
+
+    def get_page(self, theme:int, size:int) -> dict[tuple, _pygame.Surface]:
+        if (theme, size) not in self.pages:
+            self.pages[(theme, size)] = {}
+        return self.pages[(theme, size)]
+
+    def get_sprite(self, theme:int, colour:str, piece:str, size:int) -> _pygame.Surface:
+        page = self.get_page(theme, size)
+        if (colour, piece) not in page:
+            page[(colour, piece)] = self.make_sprite(theme, colour, piece, size)
+        return page[(colour, piece)]
+
+    def preload(self, theme:int, size:int):
+        # Fills a whole page up front, so the first frame of a game does not wait on the disk
+        for colour in ("white", "black"):
+            for piece in PIECE_NAMES:
+                self.get_sprite(theme, colour, piece, size)
+
+    def load_image(self, theme:int, colour:str, piece:str):
+        key = (theme, colour, piece)
+        if key not in self.images:
+            try:
+                image = _pygame.image.load(self.folder / f"Theme{theme}" / f"{colour[0]}_{piece}.png")
+                self.loads += 1
+                if _pygame.display.get_surface() is not None: # convert_alpha needs a display to match
+                    image = image.convert_alpha()
+            except FileNotFoundError:
+                image = None
+            self.images[key] = image
+        return self.images[key]
+
+    def make_sprite(self, theme:int, colour:str, piece:str, size:int):
+        image = self.load_image(theme, colour, piece)
+        if image is None:
+            image = self.create_placeholder_piece(WHITE if colour == "white" else BLACK, piece)
+        # Scaled once from the original image, so sprites never lose quality by being scaled again
+        return _pygame.transform.scale(image, (size, size))
+
+    def create_placeholder_piece(self, color:_pygame.Color, piece_char:str):
+        surf = _pygame.Surface((50, 50), _pygame.SRCALPHA)
+        _pygame.draw.circle(surf, color, (25, 25), 20)
+        text = text_cache.render(piece_char.upper(), BLACK if color == WHITE else WHITE, "Arial", 24, bold=True)
+        text_rect = text.get_rect(center=(25, 25))
+        surf.blit(text, text_rect)
+        return surf
+
+    def get_stats(self):
+        return {
+            "loads": self.loads,
+            "images": len(self.images),
+            "pages": len(self.pages),
+            "sprites": sum(len(page) for page in self.pages.values()),
+        }
+
+sprite_atlas = SpriteAtlas() # shared by every board in the process
@@ -1,160 +1,244 @@
-import pygame as _pygame
-from sys import exit as _exit
-
-from gui import Button, Slider
-from settings import settings # still need to push these values into states stuff below
-from chess import initialize_classic_game
-
-BOARD_SIZE = settings["board"]["size"]
-SCREEN_WIDTH = settings["screen"]["width"]
-SCREEN_HEIGHT = settings["screen"]["height"]
-BLACK = settings["colors"]["black"]
-
-class State:
-    def __init__(self, manager, screen):
-        self.manager = manager
-        self.screen:_pygame.Surface = screen
-
-    def handle_event(self, event:_pygame.event.Event):
-        pass
-
-    def update(self):
-        pass
-
-    def draw(self):
-        pass
-
-    def update_variable(self, key, value):
-        self.manager.variables[key] = value
-
-    def get_variable(self, key):
-        return self.manager.variables[key]
-
-class StateManager:
-    def __init__(self, initial_state:State, default_variables:dict = {}):
-        self.state = initial_state
-        self.variables = default_variables
-
-    def set_state(self, new_state):
-        self.state = new_state
-
-    def handle_event(self, event):
-        self.state.handle_event(event)
-
-    def update(self):
-        self.state.update()
-
-    def draw(self):
-        self.state.draw()
-
-class SplashState(State):
-    def __init__(self, manager, screen, icons_to_show):
-        super().__init__(manager, screen)
-        self.icons_to_show = [_pygame.transform.scale(icon, (200, 200)) for icon in icons_to_show]
-        self.icon_idx = 0
-        self.alpha = 0
-        self.dir = "+"
-        self.icon = self.icons_to_show[self.icon_idx]
-
-    def handle_event(self, event):
-        if event.type == _pygame.MOUSEBUTTONDOWN:
-            self.dir = "-"
-
-    def update(self):
-        if self.dir == "+":
-            self.alpha += 2
-            if self.alpha >= 300:
-                self.dir = "-"
-        else:
-            self.alpha -= 2
-            if self.alpha <= 0:
-                self.icon_idx += 1
-                if self.icon_idx < len(self.icons_to_show):
-                    self.icon = self.icons_to_show[self.icon_idx]
-                    self.dir = "+"
-                else:
-                    self.manager.set_state(MenuState(self.manager, self.screen)) # Set state to menu
-
-    def draw(self):
-        self.screen.fill(BLACK)
-        self.icon.set_alpha(self.alpha)
-        self.screen.blit(self.icon, (self.screen.get_width() / 2 - self.icon.get_width() / 2,
-                                     self.screen.get_height() / 2 - self.icon.get_height() / 2))
-
-class MenuState(State):
-    def __init__(self, manager, screen):
-        super().__init__(manager, screen)
-        self.center_x = self.screen.get_width() / 2
-        self.center_y = self.screen.get_height() / 2
-        self.new_game_button = Button(self.center_x - 100, self.center_y - 100, 200, 50, "New Game", (0, 255, 0), (255, 255, 255))
-        self.options_button = Button(self.center_x - 100, self.center_y, 200, 50, "Options", (0, 0, 255), (255, 255, 255))
-        self.quit_button = Button(self.center_x - 100, self.center_y + 100, 200, 50, "Quit", (255, 0, 0), (255, 255, 255))
-
-    def handle_event(self, event):
-        if event.type == _pygame.MOUSEBUTTONDOWN:
-            pos = _pygame.mouse.get_pos()
-            if self.new_game_button.is_hovered(pos):
-                self.manager.set_state(ClassicChessGameState(self.manager, self.screen))
-            elif self.options_button.is_hovered(pos):
-                self.manager.set_state(OptionsState(self.manager, self.screen))
-            elif self.quit_button.is_hovered(pos):
-                _pygame.quit()
-                _exit()
-
-    def draw(self):
-        self.screen.fill(BLACK)
-        self.new_game_button.draw(self.screen)
-        self.options_button.draw(self.screen)
-        self.quit_button.draw(self.screen)
-
-class OptionsState(State):
-    def __init__(self, manager, screen):
-        super().__init__(manager, screen)
-        self.center_x = self.screen.get_width() / 2
-        self.center_y = self.screen.get_height() / 2
-    
-        self.difficulty_slider = Slider(self.center_x - 200, self.center_y - 100, 400, 50, 0, 2, 1, ["Easy", "Medium", "Hard"], (100, 100, 100), (255, 0, 0))
-        self.back_button = Button(self.center_x - 100, self.center_y + 50, 200, 50, "Back", (0, 200, 0), (255, 255, 255))
-        self.theme1_button = Button(self.center_x - 100, self.center_y + 100, 200, 50, "Theme 1", (0, 200, 0), (255, 255, 255))
-        self.theme2_button = Button(self.center_x - 100, self.center_y + 150, 200, 50, "Theme 2", (0, 200, 0), (255, 255, 255))
-
-        self.theme = 1
-
-    def handle_event(self, event):
-        self.difficulty_slider.update(event)
-        if event.type == _pygame.MOUSEBUTTONDOWN:
-            if self.back_button.is_hovered(event.pos):
-                self.update_variable("theme", self.theme)
-                self.manager.set_state(MenuState(self.manager, self.screen))
-            if self.theme1_button.is_hovered(event.pos):
-                self.theme = 1
-            if self.theme2_button.is_hovered(event.pos):
-                self.theme = 2
-
-    def draw(self):
-        self.screen.fill(BLACK)
-        self.difficulty_slider.draw(self.screen)
-        self.back_button.draw(self.screen)
-        self.theme1_button.draw(self.screen)
-        self.theme2_button.draw(self.screen)
-
-class ClassicChessGameState(State):
-    def __init__(self, manager, screen):
-        super().__init__(manager, screen)
-        self.chessboard = initialize_classic_game(SCREEN_WIDTH / 2 - BOARD_SIZE / 2, SCREEN_HEIGHT / 2 - BOARD_SIZE / 2, theme=self.get_variable("theme"))
-    
-    def handle_event(self, event):
-        if event.type == _pygame.MOUSEBUTTONDOWN:
-            mouse_pos = _pygame.mouse.get_pos()
-            self.chessboard.handle_click(mouse_pos)
-        if event.type == _pygame.KEYDOWN:
-            if event.key == _pygame.K_LEFT:
-                self.chessboard.pop(1)
-                self.chessboard.deselect_square()
-    
-    def update(self):
-        self.chessboard.update()
-
-    def draw(self):
-        self.screen.fill(BLACK)
-        self.chessboard.draw(self.screen)
\ No newline at end of file
+import time
+import pygame as _pygame
+import log
+from sys import exit as _exit
+
+from gui import Button, Slider
+from settings import settings # still need to push these values into states stuff below
+from chess import initialize_classic_game
+from sprites import sprite_atlas
+from engine import DIFFICULTY_BUDGETS
+from worker import engine_worker
+from pgn import save_game
+from gamerecord import save_record
+
+logger = log.get_logger("game")
+
+BOARD_SIZE = settings["board"]["size"]
+PIECE_SIZE = settings["board"]["piece_size"]
+SCREEN_WIDTH = settings["screen"]["width"]
+SCREEN_HEIGHT = settings["screen"]["height"]
+BLACK = settings["colors"]["black"]
+
+class State:
+    def __init__(self, manager, screen):
+        self.manager = manager
+        self.screen:_pygame.Surface = screen
+
+    def handle_event(self, event:_pygame.event.Event):
+        pass
+
+    def update(self):
+        pass
+
+    def draw(self):
+        # Returns the rectangles of the screen that changed, or None when the whole screen was drawn
+        pass
+
+    def update_variable(self, key, value):
+        self.manager.variables[key] = value
+
+    def get_variable(self, key):
+        return self.manager.variables[key]
+
+class StateManager:
+    def __init__(self, initial_state:State, default_variables:dict = {}):
+        self.state = initial_state
+        self.variables = default_variables
+
+    def set_state(self, new_state):
+        self.state = new_state
+
+    def handle_event(self, event):
+        self.state.handle_event(event)
+
+    def update(self):
+        self.state.update()
+
+    def draw(self):
+        return self.state.draw()
+
+class SplashState(State):
+    def __init__(self, manager, screen, icons_to_show):
+        super().__init__(manager, screen)
+        self.icons_to_show = [_pygame.transform.scale(icon, (200, 200)) for icon in icons_to_show]
+        self.icon_idx = 0
+        self.alpha = 0
+        self.dir = "+"
+        self.icon = self.icons_to_show[self.icon_idx]
+
+    def handle_event(self, event):
+        if event.type == _pygame.MOUSEBUTTONDOWN:
+            self.dir = "-"
+
+    def update(self):
+        if self.dir == "+":
+            self.alpha += 2
+            if self.alpha >= 300:
+                self.dir = "-"
+        else:
+            self.alpha -= 2
+            if self.alpha <= 0:
+                self.icon_idx += 1
+                if self.icon_idx < len(self.icons_to_show):
+                    self.icon = self.icons_to_show[self.icon_idx]
+                    self.dir = "+"
+                else:
+                    self.manager.set_state(MenuState(self.manager, self.screen)) # Set state to menu
+
+    def draw(self):
+        self.screen.fill(BLACK)
+        self.icon.set_alpha(self.alpha)
+        self.screen.blit(self.icon, (self.screen.get_width() / 2 - self.icon.get_width() / 2,
+                                     self.screen.get_height() / 2 - self.icon.get_height() / 2))
+
+class MenuState(State):
+    def __init__(self, manager, screen):
+        super().__init__(manager, screen)
+        self.center_x = self.screen.get_width() / 2
+        self.center_y = self.screen.get_height() / 2
+        self.new_game_button = Button(self.center_x - 100, self.center_y - 100, 200, 50, "New Game", (0, 255, 0), (255, 255, 255))
+        self.options_button = Button(self.center_x - 100, self.center_y, 200, 50, "Options", (0, 0, 255), (255, 255, 255))
+        self.quit_button = Button(self.center_x - 100, self.center_y + 100, 200, 50, "Quit", (255, 0, 0), (255, 255, 255))
+
+    def handle_event(self, event):
+        if event.type == _pygame.MOUSEBUTTONDOWN:
+            pos = _pygame.mouse.get_pos()
+            if self.new_game_button.is_hovered(pos):
+                self.manager.set_state(ClassicChessGameState(self.manager, self.screen))
+            elif self.options_button.is_hovered(pos):
+                self.manager.set_state(OptionsState(self.manager, self.screen))
+            elif self.quit_button.is_hovered(pos):
+                _pygame.quit()
+                _exit()
+
+    def draw(self):
+        self.screen.fill(BLACK)
+        self.new_game_button.draw(self.screen)
+        self.options_button.draw(self.screen)
+        self.quit_button.draw(self.screen)
+
+class OptionsState(State):
+    def __init__(self, manager, screen):
+        super().__init__(manager, screen)
+        self.center_x = self.screen.get_width() / 2
+        self.center_y = self.screen.get_height() / 2
+    
+        self.difficulty_slider = Slider(self.center_x - 200, self.center_y - 100, 400, 50, 0, 2, self.get_variable("difficulty"), ["Easy", "Medium", "Hard"], (100, 100, 100), (255, 0, 0))
+        self.back_button = Button(self.center_x - 100, self.center_y + 50, 200, 50, "Back", (0, 200, 0), (255, 255, 255))
+        self.theme1_button = Button(self.center_x - 100, self.center_y + 100, 200, 50, "Theme 1", (0, 200, 0), (255, 255, 255))
+        self.theme2_button = Button(self.center_x - 100, self.center_y + 150, 200, 50, "Theme 2", (0, 200, 0), (255, 255, 255))
+
+        self.theme = self.get_variable("theme")
+
+    def handle_event(self, event):
+        self.difficulty_slider.update(event)
+        if event.type == _pygame.MOUSEBUTTONDOWN:
+            if self.back_button.is_hovered(event.pos):
+                self.update_variable("theme", self.theme)
+                self.update_variable("difficulty", self.difficulty_slider.value)
+                settings["game"]["difficulty"] = self.difficulty_slider.value
+                settings.save()
+                self.manager.set_state(MenuState(self.manager, self.screen))
+            if self.theme1_button.is_hovered(event.pos):
+                self.theme = 1
+                sprite_atlas.preload(self.theme, PIECE_SIZE)
+            if self.theme2_button.is_hovered(event.pos):
+                self.theme = 2
+                sprite_atlas.preload(self.theme, PIECE_SIZE)
+
+    def draw(self):
+        self.screen.fill(BLACK)
+        self.difficulty_slider.draw(self.screen)
+        self.back_button.draw(self.screen)
+        self.theme1_button.draw(self.screen)
+        self.theme2_button.draw(self.screen)
+
+class ClassicChessGameState(State):
+    def __init__(self, manager, screen):
+        super().__init__(manager, screen)
+        self.chessboard = initialize_classic_game(SCREEN_WIDTH / 2 - BOARD_SIZE / 2, SCREEN_HEIGHT / 2 - BOARD_SIZE / 2, theme=self.get_variable("theme"))
+        self.difficulty = self.get_variable("difficulty")
+        self.computer_colour = "black"
+        self.engine_job = None # search running in the engine worker process
+        self.full_redraw = True # the screen still shows the last state, so the first frame draws all of it
+        self.notice = None # text shown on screen for a few seconds, like the confirmation of a save
+        self.notice_until = 0.0
+    
+    def handle_event(self, event):
+        if event.type == _pygame.VIDEOEXPOSE:
+            self.full_redraw = True
+        if event.type == _pygame.MOUSEBUTTONDOWN and self.chessboard.turn != self.computer_colour and self.chessboard.get_result() is None:
+            mouse_pos = _pygame.mouse.get_pos()
+            self.chessboard.handle_click(mouse_pos)
+        if event.type == _pygame.KEYDOWN:
+            if event.key == _pygame.K_LEFT:
+                if self.engine_job is not None:
+                    engine_worker.cancel(self.engine_job)
+                    self.engine_job = None
+                self.chessboard.pop(1)
+                # Then the computer's reply as well, unless its search was just cancelled and there is none
+                while self.chessboard.moves_stack and self.chessboard.turn == self.computer_colour:
+                    self.chessboard.pop(1)
+                self.chessboard.deselect_square()
+            if event.key == _pygame.K_s:
+                players = {"White": "Player", "Black": "Player"}
+                if self.computer_colour is not None:
+                    players[self.computer_colour.capitalize()] = f"Computer ({DIFFICULTY_BUDGETS[self.difficulty]['name']})"
+                headers = {"Event": "Chezz.com game", "Date": time.strftime("%Y.%m.%d"), **players}
+                try:
+                    save_game(self.chessboard, settings["game"]["pgn_path"], headers)
+                    number = save_record(self.chessboard, settings["game"]["record_path"], headers)
+                except OSError as error:
+                    logger.error("Could not save the game: %s", error)
+                    self.show_notice(f"Could not save the game: {error}")
+                else:
+                    logger.info("Saved the game to %s and as game %d of %s", settings["game"]["pgn_path"], number, settings["game"]["record_path"])
+                    self.show_notice(f"Saved to {settings['game']['pgn_path']} and {settings['game']['record_path']} (game {number})")
+
+    def show_notice(self, text:str, seconds:float = 3.0):
+        self.notice = text
+        self.notice_until = time.perf_counter() + seconds
+    
+    def update(self):
+        self.chessboard.update()
+        if self.chessboard.turn == self.computer_colour and self.engine_job is None and self.chessboard.get_result() is None:
+            self.engine_job = engine_worker.submit(
+                self.chessboard,
+                self.difficulty,
+                table_size_mb=settings["engine"]["transposition_table_mb"],
+                timeout=DIFFICULTY_BUDGETS[self.difficulty]["time"] * 2,
+                book_path=settings["engine"]["book_path"],
+                bitbase_path=settings["engine"]["bitbase_path"],
+            )
+        if self.engine_job is not None:
+            engine_worker.poll()
+            if self.engine_job.status == "done":
+                result = self.engine_job.result
+                self.engine_job = None
+                if result is not None:
+                    if log.enabled:
+                        logger.info("Engine: %s", result, extra={"fields": {"event": "search", "depth": result.depth, "score": result.score, "nodes": result.nodes, "seconds": result.elapsed}})
+                    self.chessboard.move(result.from_square, result.to_square, result.promotion or "q")
+            elif self.engine_job.status == "failed":
+                logger.error("Engine failed: %s", self.engine_job.error)
+                self.computer_colour = None # let the players carry on by themselves
+                self.engine_job = None
+
+    def draw(self):
+        extra_text = []
+        if self.engine_job is not None:
+            progress = self.engine_job.progress
+            if progress is None:
+                text = "Thinking..."
+            else:
+                text = f"Thinking... depth {progress.depth}, {progress.nodes_per_second:.0f} nodes/s"
+            extra_text.append((text, (10, self.screen.get_height() - 40)))
+        if self.notice is not None:
+            if time.perf_counter() < self.notice_until:
+                extra_text.append((self.notice, (10, self.screen.get_height() - 80)))
+            else:
+                self.notice = None
+        dirty_rects = self.chessboard.draw(self.screen, extra_text=extra_text, redraw=self.full_redraw)
+        self.full_redraw = False
+        return dirty_rects
\ No newline at end of file
@@ -0,0 +1,52 @@
+"""
+Checks the generated bitbases against the rules of the game: every stored value must follow from the values of the
+positions its legal moves lead to. Covers every pawn on the 7th rank position of KPK, where the pawn table hands over
+to the queen and rook tables, and every KQK and KRK position those promotions probe.
+"""
+import pytest
+
+from bitbase import SIGNATURES, Bitbases, generate_table, get_expected_value, get_promotions, index_to_fen, is_legal, pack_values
+from rules import classic_board_from_fen
+
+@pytest.fixture(scope="module")
+def bitbases(tmp_path_factory):
+    folder = tmp_path_factory.mktemp("bitbases")
+    for signature in SIGNATURES:
+        values = generate_table(signature, str(folder))
+        (folder / f"{signature}.bb").write_bytes(pack_values(values))
+    tables = Bitbases(str(folder))
+    yield tables
+    tables.close()
+
+def get_seventh_rank_positions():
+    # Legal KPK positions with the pawn on the 7th rank, both sides to move
+    return [index for index in range(1 << 19) if 48 <= index & 63 < 56 and is_legal("P", index)]
+
+def get_wrong_positions(bitbases:Bitbases, signature:str, indices:list[int]):
+    table = bitbases.tables[signature]
+    wrong = []
+    for index in indices:
+        fen = index_to_fen(signature, index)
+        expected = get_expected_value(bitbases, classic_board_from_fen(fen))
+        if table.probe_index(index) != expected:
+            wrong.append(f"{fen} stored {table.probe_index(index)}, moves say {expected}")
+    return wrong
+
+def test_promotion_example(bitbases):
+    assert bitbases.probe(classic_board_from_fen("8/P7/8/8/8/8/8/k1K5 w - - 0 1")) == 1
+
+def test_pawn_on_seventh_rank(bitbases):
+    wrong = get_wrong_positions(bitbases, "KPK", get_seventh_rank_positions())
+    assert not wrong, f"{len(wrong)} wrong, first {wrong[:5]}"
+
+@pytest.mark.parametrize("signature", ["KQK", "KRK"])
+def test_promotion_targets(bitbases, signature):
+    # The black to move positions right after every promotion the pawn table probes
+    targets = set()
+    for index in get_seventh_rank_positions():
+        target = get_promotions(index) if not index >> 18 else None
+        if target is not None:
+            targets.add(1 << 18 | (index & 0o777700) | target)
+    targets = sorted(index for index in targets if is_legal(signature[1], index))
+    wrong = get_wrong_positions(bitbases, signature, targets)
+    assert not wrong, f"{len(wrong)} wrong, first {wrong[:5]}"
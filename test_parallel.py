@@ -0,0 +1,30 @@
+"""
+Root move tasks run in one worker process one after the other, on the board and engine the process keeps, so every
+task must leave them exactly as it found them for the results not to depend on the order the tasks ran in.
+"""
+import parallel
+from parallel import get_worker_board, perft_root_move, search_root_move
+
+KIWIPETE_FEN = "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1"
+
+def run_fresh(task, move:int, depth:int):
+    # The task on a board nothing has run on before
+    parallel.worker_boards.clear()
+    result = task(KIWIPETE_FEN, move, depth)
+    parallel.worker_boards.clear()
+    return result
+
+def test_search_root_move_repeats():
+    moves = list(get_worker_board(KIWIPETE_FEN).iterate_moves())[:12]
+    first = search_root_move(KIWIPETE_FEN, moves[0], 3)
+    assert search_root_move(KIWIPETE_FEN, moves[0], 3) == first
+
+def test_search_root_move_independent_of_order():
+    moves = list(get_worker_board(KIWIPETE_FEN).iterate_moves())[:12]
+    fresh = [run_fresh(search_root_move, move, 3) for move in moves]
+    assert [search_root_move(KIWIPETE_FEN, move, 3) for move in moves] == fresh
+
+def test_perft_root_move_independent_of_order():
+    moves = list(get_worker_board(KIWIPETE_FEN).iterate_moves())
+    fresh = [run_fresh(perft_root_move, move, 3) for move in moves]
+    assert [perft_root_move(KIWIPETE_FEN, move, 3) for move in moves] == fresh
@@ -0,0 +1,23 @@
+"""
+Move generation of the reference positions against their known node counts, with every make_move checked against
+a hash from scratch and every unmake_move checked to restore the exact state from before the move.
+"""
+import pytest
+
+from perft import REFERENCE_POSITIONS, load_board, perft_checked
+
+MAX_CHECKED_NODES = 10000 # the deepest depth of every position, up to 3, that stays under this many leaf nodes
+
+def get_cases():
+    cases = []
+    for position in REFERENCE_POSITIONS:
+        depth = 3 if position["nodes"][2] <= MAX_CHECKED_NODES else 2
+        cases.append(pytest.param(position["fen"], depth, position["nodes"][depth - 1], id=f"{position['name']} depth {depth}"))
+    return cases
+
+@pytest.mark.parametrize("fen, depth, expected", get_cases())
+def test_make_unmake_restores_state(fen, depth, expected):
+    board = load_board(fen)
+    fen_before = board.get_fen()
+    assert perft_checked(board, depth) == expected
+    assert board.get_fen() == fen_before
@@ -0,0 +1,82 @@
+"""
+A fixed size transposition table for the engine, kept in flat arrays so its memory use is known up front
+"""
+from array import array
+
+EXACT = 0
+LOWER_BOUND = 1 # the search failed high, the score is at least this
+UPPER_BOUND = 2 # the search failed low, the score is at most this
+
+# key (8 bytes) + score (4) + move (2) + depth (1) + bound (1)
+ENTRY_SIZE = 16
+
+class TranspositionTable:
+    """
+    Buckets of two entries: the first keeps the deepest search of the positions that map to the bucket,
+    the second is always replaced. A key of 0 marks an empty entry.
+    """
+    def __init__(self, size_mb:float = 16):
+        self.bucket_count = max(1, int(size_mb * 1024 * 1024) // (ENTRY_SIZE * 2))
+        self.clear()
+
+    @property
+    def memory_bytes(self):
+        return self.bucket_count * 2 * ENTRY_SIZE
+
+    def clear(self):
+        entries = self.bucket_count * 2
+        self.keys = array("Q", bytes(8 * entries))
+        self.scores = array("i", bytes(4 * entries))
+        self.moves = array("H", bytes(2 * entries))
+        self.depths = array("b", bytes(entries))
+        self.bounds = array("B", bytes(entries))
+        self.hits = 0
+        self.misses = 0
+        self.collisions = 0 # misses where both entries of the bucket held other positions
+
+    def probe(self, key:int):
+        """Returns (score, depth, bound, move) stored for the position, or None."""
+        index = (key % self.bucket_count) * 2
+        if self.keys[index] == key or self.keys[index + 1] == key:
+            if self.keys[index] != key:
+                index += 1
+            self.hits += 1
+            return self.scores[index], self.depths[index], self.bounds[index], self.moves[index]
+        self.misses += 1
+        if self.keys[index] and self.keys[index + 1]:
+            self.collisions += 1
+        return None
+
+    def store(self, key:int, depth:int, score:int, bound:int, move:int):
+        index = (key % self.bucket_count) * 2
+        if self.keys[index] != key:
+            replace_first = not self.keys[index] or depth >= self.depths[index]
+            if self.keys[index + 1] == key:
+                if replace_first:
+                    # The position moves up to the deeper entry, and what was there takes the place of its old copy
+                    self.keys[index + 1] = self.keys[index]
+                    self.scores[index + 1] = self.scores[index]
+                    self.moves[index + 1] = self.moves[index]
+                    self.depths[index + 1] = self.depths[index]
+                    self.bounds[index + 1] = self.bounds[index]
+                else:
+                    index += 1
+            elif not replace_first:
+                index += 1 # keep the deeper entry, use the always replace one
+        self.keys[index] = key
+        self.scores[index] = score
+        self.moves[index] = move
+        self.depths[index] = depth
+        self.bounds[index] = bound
+
+    def get_stats(self):
+        probes = self.hits + self.misses
+        filled = sum(1 for key in self.keys if key)
+        return {
+            "size_mb": self.memory_bytes / (1024 * 1024),
+            "hits": self.hits,
+            "misses": self.misses,
+            "collisions": self.collisions,
+            "hit_rate": self.hits / probes if probes else 0.0,
+            "fill": filled / len(self.keys),
+        }
@@ -0,0 +1,153 @@
+"""
+Runs engine searches in a separate process, so the game loop keeps drawing at full frame rate while the computer thinks
+"""
+import multiprocessing
+import os
+import queue
+import time
+import traceback
+
+class EngineJob:
+    def __init__(self, job_id:int, timeout:float = None):
+        self.id = job_id
+        self.timeout = timeout # seconds of searching before the job is stopped, counted from when it starts
+        self.deadline = None
+        self.status = "pending" # "pending", "running", "done", "cancelled" or "failed"
+        self.timed_out = False
+        self.cancel_requested = False
+        self.progress = None # SearchResult of the deepest finished iteration so far
+        self.result = None # final SearchResult, None if there were no moves
+        self.error = None
+
+    def is_finished(self):
+        return self.status in ("done", "cancelled", "failed")
+
+class EngineWorker:
+    """
+    Owns one worker process that searches jobs one after another. submit hands it a position,
+    poll collects whatever the process has sent back without ever waiting for it.
+    """
+    def __init__(self):
+        self.context = multiprocessing.get_context("spawn") # a clean process, not a fork of a running pygame window
+        self.process = None
+        self.jobs_queue = None
+        self.results_queue = None
+        self.cancel_up_to = None # the worker stops or skips every job with an id up to this value
+        self.jobs:dict[int, EngineJob] = {}
+        self.next_id = 1
+
+    def start(self):
+        if self.process is not None and self.process.is_alive():
+            return
+        self.jobs_queue = self.context.Queue()
+        self.results_queue = self.context.Queue()
+        self.cancel_up_to = self.context.Value("i", 0)
+        self.process = self.context.Process(target=run_worker, args=(self.jobs_queue, self.results_queue, self.cancel_up_to), daemon=True)
+        self.process.start()
+
+    def submit(self, board, difficulty:int, table_size_mb:float = 16, timeout:float = None, book_path:str = None, bitbase_path:str = None) -> EngineJob:
+        # Only the starting FEN and the moves are sent, the worker plays them on its own board so it knows which positions would repeat
+        self.start()
+        job = EngineJob(self.next_id, timeout)
+        self.next_id += 1
+        self.jobs[job.id] = job
+        self.jobs_queue.put((job.id, board.starting_fen, board.undo_moves[:board.ply].tolist(), difficulty, table_size_mb, book_path, bitbase_path))
+        return job
+
+    def cancel(self, job:EngineJob):
+        if job.is_finished():
+            return
+        job.cancel_requested = True
+        with self.cancel_up_to.get_lock():
+            self.cancel_up_to.value = max(self.cancel_up_to.value, job.id)
+
+    def poll(self):
+        # Reads every message the worker has sent so far, then stops jobs that ran past their timeout
+        while self.results_queue is not None:
+            try:
+                kind, job_id, data = self.results_queue.get_nowait()
+            except queue.Empty:
+                break
+            job = self.jobs.get(job_id)
+            if job is None:
+                continue
+            if kind == "started":
+                job.status = "running"
+                if job.timeout is not None:
+                    job.deadline = time.perf_counter() + job.timeout
+            elif kind == "progress":
+                job.progress = data
+            elif kind == "done":
+                if job.cancel_requested:
+                    job.status = "cancelled"
+                else:
+                    job.status = "done"
+                    job.result = data
+            elif kind == "cancelled":
+                job.status = "cancelled"
+            elif kind == "failed":
+                job.status = "failed"
+                job.error = data
+            if job.is_finished():
+                del self.jobs[job_id]
+
+        for job in self.jobs.values():
+            if job.status == "running" and job.deadline is not None and time.perf_counter() > job.deadline and not job.timed_out:
+                # The engine returns the best move it has so far, it is only thrown away when cancelled
+                job.timed_out = True
+                with self.cancel_up_to.get_lock():
+                    self.cancel_up_to.value = max(self.cancel_up_to.value, job.id)
+
+    def close(self):
+        if self.process is None:
+            return
+        with self.cancel_up_to.get_lock():
+            self.cancel_up_to.value = self.next_id
+        self.jobs_queue.put(None)
+        self.process.join(timeout=1)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.process = None
+
+def run_worker(jobs_queue, results_queue, cancel_up_to):
+    from rules import classic_board_from_fen
+    from engine import Engine
+    from book import OpeningBook
+    from bitbase import Bitbases
+
+    engines = {} # one engine per difficulty so the transposition table is kept between moves
+    books = {} # path -> OpeningBook, None when there is no file there
+    bitbases = {} # folder -> Bitbases, None when there is no folder there
+    while True:
+        job = jobs_queue.get()
+        if job is None:
+            break
+        job_id, fen, moves, difficulty, table_size_mb, book_path, bitbase_path = job
+        if cancel_up_to.value >= job_id:
+            results_queue.put(("cancelled", job_id, None))
+            continue
+        results_queue.put(("started", job_id, None))
+        try:
+            board = classic_board_from_fen(fen)
+            for move in moves:
+                board.make_move(move)
+            if book_path not in books:
+                books[book_path] = OpeningBook(book_path) if book_path and os.path.isfile(book_path) else None
+            if bitbase_path not in bitbases:
+                bitbases[bitbase_path] = Bitbases(bitbase_path) if bitbase_path and os.path.isdir(bitbase_path) else None
+            if (difficulty, table_size_mb) not in engines:
+                engines[(difficulty, table_size_mb)] = Engine(difficulty, table_size_mb=table_size_mb)
+            engine = engines[(difficulty, table_size_mb)]
+            engine.book = books[book_path]
+            engine.bitbases = bitbases[bitbase_path]
+            result = engine.search(
+                board,
+                should_stop=lambda: cancel_up_to.value >= job_id,
+                on_iteration=lambda progress: results_queue.put(("progress", job_id, progress)),
+            )
+        except Exception:
+            results_queue.put(("failed", job_id, traceback.format_exc()))
+            continue
+        results_queue.put(("done", job_id, result))
+
+engine_worker = EngineWorker() # shared by every game, the process is started on the first search